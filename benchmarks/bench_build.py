@@ -0,0 +1,44 @@
+#!/usr/bin/python3
+
+# time a full database build from the downloaded collections and a no-op
+# update of the built database, and report the peak resident memory of the
+# process
+# run from the directory containing 'www.thelatinlibrary.com/', e.g.
+#     python benchmarks/bench_build.py --processes 4
+
+import os
+import time
+import resource
+import argparse
+import tempfile
+from latin_library import parse_data
+
+
+def main(processes):
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'latin_library.db')
+
+        start = time.perf_counter()
+        parse_data.update_database(processes, database)
+        build = time.perf_counter() - start
+
+        # every book is unchanged, so only the pages are hashed
+        start = time.perf_counter()
+        parse_data.update_database(processes, database)
+        update = time.perf_counter() - start
+
+    # ru_maxrss is reported in kilobytes on linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print('Build: {:.2f}s'.format(build))
+    print('No-op update: {:.2f}s'.format(update))
+    print('Peak RSS: {:.1f} MB'.format(peak / 1024))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--processes', type=int, default=1)
+    args = parser.parse_args()
+
+    main(args.processes)
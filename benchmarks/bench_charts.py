@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+# throughput of batch usage chart rendering (one reused figure) compared
+# with drawing a new figure for every chart
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_charts.py et in arma Iuppiter
+
+import io
+import sys
+import time
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from latin_library import search_interface
+from common import DEFAULT_TERMS
+
+# number of times each term is rendered
+RUNS = 5
+
+
+# charts per minute of the given call, which renders 'count' charts
+def charts_per_minute(call, count):
+
+    start = time.perf_counter()
+    call()
+
+    return count * 60 / (time.perf_counter() - start)
+
+
+# render every chart on a new figure
+def render_new_figures(terms, fmt):
+
+    for term in terms:
+        bars = search_interface.usage_chart_bars(term)
+        if len(bars) > 0:
+            fig = Figure(figsize=search_interface.CHART_SIZE)
+            FigureCanvasAgg(fig)
+            search_interface.draw_usage_chart(fig, term, bars)
+            fig.savefig(io.BytesIO(), format=fmt,
+                        dpi=search_interface.CHART_DPI)
+
+
+def main(terms):
+
+    # load usage counts (served from the result cache afterwards) so only
+    # rendering is timed
+    search_interface.render_usage_charts(terms)
+    found = [term for term in terms
+             if len(search_interface.usage_chart_bars(term)) > 0]
+    batch = found * RUNS
+
+    print('{:<8} {:>16} {:>16}'.format('format', 'new figure/min',
+                                       'reused/min'))
+
+    for fmt in ['png', 'svg']:
+        new = charts_per_minute(lambda: render_new_figures(batch, fmt),
+                                len(batch))
+        reused = charts_per_minute(
+            lambda: search_interface.render_usage_charts(batch, fmt=fmt),
+            len(batch))
+        print('{:<8} {:>16.0f} {:>16.0f}'.format(fmt, new, reused))
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DEFAULT_TERMS)
@@ -0,0 +1,41 @@
+#!/usr/bin/python3
+
+# prefix completion latency - the time to load the vocabulary, then
+# microseconds per completion for prefixes of random vocabulary words
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_complete.py 20000
+
+import sys
+import time
+import random
+from latin_library.query import Corpus
+
+# number of prefixes completed when no number is given
+DEFAULT_PREFIXES = 20000
+
+
+def main(count):
+
+    corpus = Corpus()
+
+    start = time.perf_counter()
+    vocab = corpus.vocabulary()
+    print('loaded {} words in {:.0f} ms'.format(
+        len(vocab), (time.perf_counter() - start) * 1000))
+
+    # prefixes of 1 to 6 characters of random words
+    random.seed(0)
+    prefixes = [random.choice(vocab.terms)[:random.randint(1, 6)]
+                for i in range(count)]
+
+    # the first pass also keeps the completions of common prefixes
+    for name in ('first pass', 'second pass'):
+        start = time.perf_counter()
+        for prefix in prefixes:
+            corpus.complete(prefix)
+        seconds = time.perf_counter() - start
+        print('{:<12} {:8.1f} us per completion'.format(
+            name, seconds / count * 1e6))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_PREFIXES)
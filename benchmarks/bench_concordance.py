@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+# concordance generation for a high-frequency word over the whole corpus -
+# fts offsets() in a single streamed query, compared with fetching the
+# matching verses and locating the word in python
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_concordance.py et
+
+import sys
+import time
+from latin_library.query import Corpus, CONTEXT_CHARS
+from latin_library.text import TOKEN_PATTERN, ASCII_LOWER
+
+# term used when none is given - the most common word
+DEFAULT_TERM = 'et'
+
+# number of timed runs of each method
+RUNS = 3
+
+
+# concordance lines (left, match, right) located by tokenizing each
+# matching verse in python
+def python_concordance(corpus, term, width=CONTEXT_CHARS):
+
+    c = corpus.connection().cursor()
+    c.execute('''SELECT passage FROM latin_fts
+                 WHERE latin_fts.passage MATCH ? ORDER BY docid''', [term])
+
+    for passage, in c:
+        for m in TOKEN_PATTERN.finditer(passage):
+            if m.group(0).translate(ASCII_LOWER) == term:
+                yield (passage[:m.start()][-width:], m.group(0),
+                       passage[m.end():][:width])
+
+
+# best time in seconds of the given call, and the lines it returned
+def best_time(call):
+
+    best = None
+    for run in range(RUNS):
+        start = time.perf_counter()
+        lines = sum(1 for line in call())
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    return best, lines
+
+
+def main(term):
+
+    corpus = Corpus()
+
+    print('{:<28} {:>8} {:>10} {:>12}'.format('method', 'lines', 'ms',
+                                              'lines/s'))
+
+    methods = [('offsets()', lambda: corpus.concordance(term)),
+               ('offsets(), 1 verse span',
+                lambda: corpus.concordance(term, span=1)),
+               ('python tokenizing', lambda: python_concordance(corpus, term))]
+
+    for name, call in methods:
+        seconds, lines = best_time(call)
+        print('{:<28} {:>8} {:>10.1f} {:>12.0f}'.format(
+            name, lines, seconds * 1000, lines / seconds))
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_TERM)
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+# latency of fuzzy searches (finding the closest vocabulary words, then
+# counting the verses matching any of them) compared with exact searches
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_fuzzy.py cesar Iupiter virumqeu arma
+
+import sys
+from latin_library.query import Corpus
+from common import median_ms
+
+# terms used when none are given - misspellings of common words, and a
+# correctly spelled one
+DEFAULT_TERMS = ['cesar', 'Iupiter', 'virumqeu', 'arma']
+
+# number of timed runs per term
+RUNS = 20
+
+
+# number of verses matching a fuzzy search term
+def fuzzy_count(corpus, term):
+
+    query = corpus.fuzzy_query(term)
+
+    return 0 if query is None else corpus.count(query)
+
+
+def main(terms):
+
+    # the result cache is cleared before every run, so each run queries the
+    # database
+    corpus = Corpus()
+    corpus.count(terms[0])
+
+    print('{:<12} {:>8} {:>10} {:>8} {:>10}  {}'.format(
+        'term', 'exact', 'exact ms', 'fuzzy', 'fuzzy ms', 'words'))
+
+    for term in terms:
+        exact_ms = median_ms(
+            lambda: corpus.cache.clear() or corpus.count(term), RUNS)
+        fuzzy_ms = median_ms(
+            lambda: corpus.cache.clear() or fuzzy_count(corpus, term), RUNS)
+
+        print('{:<12} {:>8} {:>10.2f} {:>8} {:>10.2f}  {}'.format(
+            term, corpus.count(term), exact_ms, fuzzy_count(corpus, term),
+            fuzzy_ms, corpus.fuzzy_query(term)))
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DEFAULT_TERMS)
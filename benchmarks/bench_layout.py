@@ -0,0 +1,36 @@
+#!/usr/bin/python3
+
+# compare the on-disk size of the original and normalized database layouts
+# run from the directory containing 'www.thelatinlibrary.com/'
+
+import os
+import sqlite3
+import tempfile
+from latin_library import parse_data
+
+
+# build a database with the given layout and return its vacuumed size
+def build_size(tmp, normalized):
+
+    database = os.path.join(tmp, 'normalized.db' if normalized else 'text.db')
+    parse_data.update_database(database=database, normalized=normalized)
+
+    db = sqlite3.connect(database)
+    db.execute('VACUUM')
+    db.close()
+
+    return os.path.getsize(database)
+
+
+def main():
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text_size = build_size(tmp, False)
+        normalized_size = build_size(tmp, True)
+
+    print('Original layout: {:.1f} MB'.format(text_size / 2 ** 20))
+    print('Normalized layout: {:.1f} MB'.format(normalized_size / 2 ** 20))
+    print('Reduction: {:.0%}'.format(1 - normalized_size / text_size))
+
+if __name__ == '__main__':
+    main()
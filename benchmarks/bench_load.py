@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+# compare database load throughput (rows/sec) of the original row-at-a-time
+# insert loop and fts copy with the per-book load of
+# parse_data.update_database, which also fills the normalized index
+# with no arguments, rows are parsed from the downloaded collections in the
+# current directory; '--synthetic N' loads N generated rows instead
+
+import os
+import time
+import sqlite3
+import argparse
+import itertools
+import tempfile
+from latin_library import parse_data
+
+# books the synthetic rows are spread over
+SYNTHETIC_BOOKS = 12
+
+
+# original load - one execute per row, default transaction handling, then
+# the fts table copied from latin_text
+def load_row_by_row(items, database):
+
+    db = sqlite3.connect(database)
+    c = db.cursor()
+
+    c.execute('''CREATE TABLE latin_text (title text, book text, language text,
+                                          author text, dates text,
+                                          chapter text, verse integer,
+                                          passage text, link text)''')
+
+    for index in range(0, len(items)):
+        c.execute('INSERT INTO latin_text VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                  items[index])
+
+    c.execute('''CREATE VIRTUAL TABLE latin_fts USING fts4(passage, link,
+                 title, book, chapter, verse)''')
+    c.execute('''INSERT INTO latin_fts
+                 SELECT passage, link, title, book, chapter, verse
+                 FROM latin_text''')
+    db.commit()
+    db.close()
+
+
+# load of update_database into an empty database - the rows of each book
+# replaced in turn, in one transaction under the bulk load pragmas
+def load_by_book(items, database):
+
+    db = sqlite3.connect(database, isolation_level=None)
+    c = db.cursor()
+    previous_pragmas = parse_data.set_pragmas(db, parse_data.BULK_PRAGMAS)
+    c.execute('BEGIN')
+
+    parse_data.create_schema(c)
+    groups = itertools.groupby(items, key=lambda item: item[8])
+    for i, (link, book_items) in enumerate(groups):
+        parse_data.replace_book_rows(c, link, list(book_items),
+                                     block=(i + 1) * parse_data.BLOCK_GAP)
+
+    c.execute('COMMIT')
+    parse_data.set_pragmas(db, previous_pragmas)
+    db.close()
+
+
+# generate n rows shaped like the parsed corpus, book by book
+def synthetic_items(n):
+
+    words = ('arma virumque cano Troiae qui primus ab oris Italiam fato '
+             'profugus Laviniaque venit litora').split()
+
+    return [['Vergil', 'Aeneid ' + str(i * SYNTHETIC_BOOKS // n), 'Latin',
+             'P. Vergilius Maro', '70 - 19 B.C.', 'null', i,
+             ' '.join(words[(i + k) % len(words)] for k in range(8)),
+             'www.thelatinlibrary.com/vergil/aen' +
+             str(i * SYNTHETIC_BOOKS // n) + '.shtml']
+            for i in range(n)]
+
+
+# rows/sec of a load into a new database
+def measure(load, items, tmp, name):
+
+    database = os.path.join(tmp, name + '.db')
+
+    start = time.perf_counter()
+    load(items, database)
+
+    return len(items) / (time.perf_counter() - start)
+
+
+def main(synthetic):
+
+    if synthetic:
+        items = synthetic_items(synthetic)
+    else:
+        items = list(parse_data.parse_collections())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = measure(load_row_by_row, items, tmp, 'before')
+        after = measure(load_by_book, items, tmp, 'after')
+
+    print('Rows: ' + str(len(items)))
+    print('row by row: {:>10.0f} rows/s   by book: {:>10.0f} rows/s'
+          .format(before, after))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--synthetic', type=int, default=0)
+    args = parser.parse_args()
+
+    main(args.synthetic)
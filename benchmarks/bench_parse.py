@@ -0,0 +1,40 @@
+#!/usr/bin/python3
+
+# compare serial and process pool parsing of the downloaded collections
+# run from the directory containing 'www.thelatinlibrary.com/', e.g.
+#     python benchmarks/bench_parse.py --processes 4
+
+import time
+import argparse
+from latin_library import parse_data
+
+
+# time a call of parse_collections with the given number of processes
+def time_parse(processes):
+
+    start = time.perf_counter()
+    items = list(parse_data.parse_collections(processes))
+
+    return items, time.perf_counter() - start
+
+
+def main(processes):
+
+    serial_items, serial_time = time_parse(1)
+    pool_items, pool_time = time_parse(processes)
+
+    # the pool must produce exactly the same rows in the same order
+    assert pool_items == serial_items
+
+    print('Rows: ' + str(len(serial_items)))
+    print('Serial: {:.2f}s'.format(serial_time))
+    print('Pool ({} processes): {:.2f}s'.format(processes, pool_time))
+    print('Speedup: {:.2f}x'.format(serial_time / pool_time))
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--processes', type=int, default=4)
+    args = parser.parse_args()
+
+    main(args.processes)
@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+
+# top-10 latency of ranked search for common and rare terms
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_rank.py et in arma Iuppiter
+
+import sys
+from latin_library.query import Corpus
+from common import DEFAULT_TERMS, median_ms
+
+# number of timed runs per term
+RUNS = 20
+
+
+def main(terms):
+
+    # the result cache is cleared before every run, so each run queries the
+    # index
+    corpus = Corpus()
+    corpus.count(terms[0])
+
+    print('{:<12} {:>8} {:>12}'.format('term', 'matches', 'top-10 ms'))
+
+    for term in terms:
+        matches = corpus.count(term)
+        ms = median_ms(
+            lambda: corpus.cache.clear() or corpus.ranked(term), RUNS)
+        print('{:<12} {:>8} {:>12.2f}'.format(term, matches, ms))
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DEFAULT_TERMS)
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+# load test of the search service - concurrent keep-alive clients send
+# search, count and usage requests for a fixed time, then throughput and
+# client-side latency percentiles are printed along with the service's own
+# metrics. without --port a service is started in this process over
+# 'latin_library.db' in the current directory, e.g.
+#     python benchmarks/bench_service.py et in arma Iuppiter
+# or, against a service started with 'python -m latin_library.service',
+#     python benchmarks/bench_service.py --port 8000 --clients 32
+
+import json
+import time
+import argparse
+import threading
+import http.client
+import urllib.parse
+from latin_library import service
+from common import DEFAULT_TERMS
+
+# endpoints each client cycles through
+ENDPOINTS = ['/search?q={}', '/count?q={}', '/usage?q={}']
+
+
+# send requests over one connection until 'deadline', appending the
+# latency (ms) of each to 'latencies' and counting error responses
+def client(port, terms, deadline, latencies, errors):
+
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    targets = [endpoint.format(urllib.parse.quote(term))
+               for term in terms for endpoint in ENDPOINTS]
+
+    i = 0
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request('GET', targets[i % len(targets)])
+        response = conn.getresponse()
+        response.read()
+        latencies.append((time.perf_counter() - start) * 1000)
+        if response.status != 200:
+            errors.append(response.status)
+        i += 1
+
+    conn.close()
+
+
+def main(args):
+
+    terms = args.terms or DEFAULT_TERMS
+
+    stop = None
+    port = args.port
+    if port is None:
+        port, stop = service.run_in_thread(
+            service.SearchService(workers=args.workers))
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=client,
+                                args=(port, terms, deadline, latencies, errors))
+               for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    print('{} clients, {} requests in {} s: {:.0f} requests/s, {} errors'.format(
+        args.clients, len(latencies), args.seconds,
+        len(latencies) / args.seconds, len(errors)))
+    for p in (50, 95, 99):
+        print('p{:<3} {:8.2f} ms'.format(p, service.percentile(latencies, p)))
+
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/metrics')
+    print(json.dumps(json.loads(conn.getresponse().read()), indent=2))
+    conn.close()
+
+    if stop is not None:
+        stop()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('terms', nargs='*', help='search terms')
+    parser.add_argument('--port', type=int,
+                        help='port of a running service')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='number of concurrent clients')
+    parser.add_argument('--seconds', type=float, default=10,
+                        help='duration of the test')
+    parser.add_argument('--workers', type=int, default=service.WORKERS,
+                        help='query threads of an in-process service')
+    main(parser.parse_args())
@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+
+# full scans for regular expressions - reading every passage from the
+# database and matching each one, compared with matching the memory-mapped
+# snapshot written by 'parse_data --snapshot'
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_snapshot.py 'que\b' '^Arma' 'ae$'
+
+import re
+import sys
+import time
+import sqlite3
+from latin_library.query import DATABASE
+from latin_library.snapshot import SNAPSHOT, Snapshot, write_snapshot
+from common import median_ms
+
+# patterns used when none are given - a common ending, a rare line opening,
+# a line ending and a phrase across word boundaries
+DEFAULT_PATTERNS = [r'\w+que\b', r'^Arma\b', r'ae$', r'\bet\s+in\b']
+
+# number of timed runs per pattern
+RUNS = 5
+
+
+# number of verses matching a pattern, reading every passage from the
+# database
+def database_count(db, pattern):
+
+    regex = re.compile(pattern, re.MULTILINE)
+
+    return sum(1 for (passage,) in db.execute('SELECT passage FROM latin_text')
+               if regex.search(passage))
+
+
+def main(patterns):
+
+    start = time.perf_counter()
+    verse_count = write_snapshot(DATABASE, SNAPSHOT)
+    print('wrote {} verses in {:.0f} ms'.format(
+        verse_count, (time.perf_counter() - start) * 1000))
+
+    db = sqlite3.connect(DATABASE)
+    snapshot = Snapshot(SNAPSHOT)
+
+    print('{:<16} {:>8} {:>12} {:>8} {:>12}'.format(
+        'pattern', 'database', 'database ms', 'snapshot', 'snapshot ms'))
+
+    for pattern in patterns:
+        print('{:<16} {:>8} {:>12.1f} {:>8} {:>12.1f}'.format(
+            pattern, database_count(db, pattern),
+            median_ms(lambda: database_count(db, pattern), RUNS),
+            snapshot.count_matches(pattern),
+            median_ms(lambda: snapshot.count_matches(pattern), RUNS)))
+
+    snapshot.close()
+    db.close()
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DEFAULT_PATTERNS)
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+# cold start time of the search interface - importing it and running a
+# first search in a new interpreter. exits with status 1 if the median
+# exceeds the budget or the plotting modules were loaded by a text search
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_startup.py arma
+
+import sys
+import subprocess
+
+# maximum median milliseconds from import to the first search results
+BUDGET_MS = 250
+
+# number of cold starts timed
+RUNS = 5
+
+# run in each new interpreter - prints the milliseconds taken and whether
+# numpy or matplotlib were imported
+COLD_START = '''
+import sys
+import time
+start = time.perf_counter()
+from latin_library import search_interface
+search_interface.corpus.page({!r})
+print((time.perf_counter() - start) * 1000)
+print('numpy' in sys.modules or 'matplotlib' in sys.modules)
+'''
+
+
+def main(term):
+
+    times = []
+    for run in range(RUNS):
+        output = subprocess.run([sys.executable, '-c', COLD_START.format(term)],
+                                capture_output=True, text=True, check=True)
+        ms, plotting = output.stdout.split()
+        times.append(float(ms))
+
+    median = sorted(times)[len(times) // 2]
+    print('import + first search: {:.1f} ms (budget {} ms)'.format(median,
+                                                                   BUDGET_MS))
+    print('plotting modules loaded: ' + plotting)
+
+    if median > BUDGET_MS or plotting == 'True':
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main(sys.argv[1] if len(sys.argv) > 1 else 'arma')
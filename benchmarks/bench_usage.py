@@ -0,0 +1,34 @@
+#!/usr/bin/python3
+
+# compare usage counts from the precomputed term x book matrix with the
+# GROUP BY query over the fts index (the result cache is bypassed)
+# run from the directory containing 'latin_library.db', e.g.
+#     python benchmarks/bench_usage.py et in arma Iuppiter
+
+import sys
+from latin_library.query import Corpus
+from common import DEFAULT_TERMS, median_ms
+
+# number of timed runs per term
+RUNS = 50
+
+
+def main(terms):
+
+    # open the connection and load the book list before timing
+    corpus = Corpus()
+    corpus.matrix_usage(terms[0])
+
+    print('{:<12} {:>12} {:>12}'.format('term', 'GROUP BY ms', 'matrix ms'))
+
+    for term in terms:
+
+        # both paths must agree
+        assert corpus.matrix_usage(term) == corpus.fts_usage(term)
+
+        fts_ms = median_ms(lambda: corpus.fts_usage(term), RUNS)
+        matrix_ms = median_ms(lambda: corpus.matrix_usage(term), RUNS)
+        print('{:<12} {:>12.3f} {:>12.3f}'.format(term, fts_ms, matrix_ms))
+
+if __name__ == '__main__':
+    main(sys.argv[1:] or DEFAULT_TERMS)
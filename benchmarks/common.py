@@ -0,0 +1,22 @@
+#!/usr/bin/python3
+
+# helpers shared by the benchmark scripts, which are run from the
+# repository root (e.g. 'python benchmarks/bench_rank.py') and so import
+# this module from their own directory as 'common'
+
+import time
+
+# search terms used when none are given - two very common, two rare
+DEFAULT_TERMS = ['et', 'in', 'arma', 'Iuppiter']
+
+
+# median latency in milliseconds of 'runs' runs of the given call
+def median_ms(call, runs):
+
+    times = []
+    for run in range(runs):
+        start = time.perf_counter()
+        call()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return sorted(times)[len(times) // 2]
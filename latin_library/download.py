@@ -0,0 +1,248 @@
+#!/usr/bin/python3
+
+import os
+import json
+import time
+import threading
+import http.client
+import urllib.parse
+from html.parser import HTMLParser
+from concurrent.futures import ThreadPoolExecutor
+
+# site the collections are downloaded from
+BASE_URL = 'http://www.thelatinlibrary.com/'
+
+# local directory mirroring the site - same layout as 'wget -r'
+URL_ROOT = 'www.thelatinlibrary.com/'
+
+# file (in URL_ROOT) holding the etag / last-modified values of each page
+VALIDATORS_FILE = '.validators.json'
+
+# http statuses worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# collect the href of every link tag on a page
+class LinkParser(HTMLParser):
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'href' and value:
+                    self.links.append(value)
+
+
+# download pages of the site into a local mirror using a bounded pool of
+# worker threads - each thread keeps its own keep-alive connection, pages
+# are revalidated with etag / if-modified-since so unchanged pages are not
+# transferred again, and failed requests are retried with backoff
+class Downloader:
+
+    def __init__(self, base_url=BASE_URL, root=URL_ROOT, workers=8,
+                 retries=3, backoff=0.5, timeout=30):
+
+        self.base_url = base_url
+        self.root = root
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        url = urllib.parse.urlsplit(base_url)
+        self.scheme = url.scheme
+        self.host = url.netloc
+
+        # connection of each worker thread
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+        # local path -> {'etag': ..., 'last_modified': ...}
+        self.validators_path = os.path.join(root, VALIDATORS_FILE)
+        self.validators = {}
+        if os.path.exists(self.validators_path):
+            with open(self.validators_path) as f:
+                self.validators = json.load(f)
+
+    # connection of the calling thread, created on first use
+    def connection(self):
+
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            if self.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.host,
+                                                   timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host,
+                                                  timeout=self.timeout)
+
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+
+        return conn
+
+    # local file path of a site path ('dir/' is saved as 'dir/index.html'),
+    # or None if the path leads out of the mirror - percent-encoded '..'
+    # segments are only decoded here, after urljoin has normalized the path
+    def local_path(self, path):
+
+        path = urllib.parse.unquote(path.lstrip('/'))
+        if path == '' or path.endswith('/'):
+            path += 'index.html'
+
+        if '\x00' in path:
+            return None
+
+        root = os.path.realpath(self.root)
+        local_path = os.path.join(self.root, path)
+        if os.path.commonpath([root, os.path.realpath(local_path)]) != root:
+            return None
+
+        return local_path
+
+    # fetch a single site path into the local mirror
+    # returns 'downloaded', 'not modified' or 'not found'
+    def fetch(self, path):
+
+        local_path = self.local_path(path)
+        if local_path is None:
+            raise ValueError(path + ' is outside of ' + self.root)
+
+        headers = {}
+
+        # conditional request when a local copy exists
+        validators = self.validators.get(local_path, {})
+        if os.path.exists(local_path):
+            if 'etag' in validators:
+                headers['If-None-Match'] = validators['etag']
+            if 'last_modified' in validators:
+                headers['If-Modified-Since'] = validators['last_modified']
+
+        attempt = 0
+        while True:
+            try:
+                conn = self.connection()
+                conn.request('GET', '/' + path.lstrip('/'), headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+
+                if response.status not in RETRY_STATUSES:
+                    break
+
+                # server asked us to wait
+                delay = response.getheader('Retry-After')
+                error = http.client.HTTPException(
+                    str(response.status) + ' ' + path)
+
+            except (OSError, http.client.HTTPException) as e:
+
+                # drop the broken connection, a new one is opened on retry
+                conn.close()
+                delay = None
+                error = e
+
+            if attempt >= self.retries:
+                raise error
+
+            if delay is not None and delay.isdigit():
+                time.sleep(int(delay))
+            else:
+                time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+        # unchanged since the last download
+        if response.status == 304:
+            return 'not modified'
+
+        # like 'wget -r', a broken link does not stop the download
+        if response.status in (404, 410):
+            return 'not found'
+
+        if response.status != 200:
+            raise http.client.HTTPException(str(response.status) + ' ' + path)
+
+        # write the page atomically so a failed download never leaves a
+        # partial file for the parsers
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path + '.part', 'wb') as f:
+            f.write(body)
+        os.replace(local_path + '.part', local_path)
+
+        # remember validators for the next download
+        validators = {}
+        if response.getheader('ETag'):
+            validators['etag'] = response.getheader('ETag')
+        if response.getheader('Last-Modified'):
+            validators['last_modified'] = response.getheader('Last-Modified')
+        self.validators[local_path] = validators
+
+        return 'downloaded'
+
+    # site paths of the same-site links on a downloaded page
+    def page_links(self, path):
+
+        parser = LinkParser()
+        with open(self.local_path(path), encoding='utf-8',
+                  errors='replace') as f:
+            parser.feed(f.read())
+
+        page_url = urllib.parse.urljoin(self.base_url, path)
+        paths = []
+
+        for href in parser.links:
+            url = urllib.parse.urlsplit(urllib.parse.urljoin(page_url, href))
+
+            # like 'wget -r', links to other hosts are not followed, and
+            # neither are links that would be saved outside of the mirror
+            if url.netloc == self.host and url.path not in paths and \
+               self.local_path(url.path) is not None:
+                paths.append(url.path)
+
+        return paths
+
+    # download the given collection pages and every page they link to
+    # (the equivalent of 'wget -r -l 1' for each collection)
+    # returns a dict of site path -> status of the page (see fetch)
+    def download_collections(self, collections):
+
+        pages = [collection + '.html' for collection in collections]
+        statuses = {}
+
+        with ThreadPoolExecutor(self.workers) as pool:
+
+            # collection pages first, then the pages they link to
+            statuses.update(zip(pages, pool.map(self.fetch, pages)))
+
+            links = []
+            for page in pages:
+                for link in self.page_links(page):
+                    if link.lstrip('/') not in statuses and link not in links:
+                        links.append(link)
+
+            statuses.update(zip([link.lstrip('/') for link in links],
+                                pool.map(self.fetch, links)))
+
+        self.save_validators()
+
+        return statuses
+
+    # write the validators of all downloaded pages to disk
+    def save_validators(self):
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.validators_path, 'w') as f:
+            json.dump(self.validators, f, indent=0, sort_keys=True)
+
+    # close the connections of all worker threads
+    def close(self):
+
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
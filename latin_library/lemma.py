@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+import hashlib
+from latin_library.text import fold
+
+# lemma list used by parse_data when present - one inflected form per line
+# followed by its lemma(s), separated by whitespace ('#' starts a comment),
+# e.g. 'amavit amo' or 'amor amo amor'
+LEMMA_FILE = 'lemmas.txt'
+
+
+# read a lemma list into a dict of form -> list of lemmas, both spelled as
+# in the normalized index (see text.fold)
+def load_lemma_list(path):
+
+    forms = {}
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split('#', 1)[0].split()
+            if len(fields) < 2:
+                continue
+
+            lemmas = forms.setdefault(fold(fields[0]), [])
+            for lemma in fields[1:]:
+                lemma = fold(lemma)
+                if lemma not in lemmas:
+                    lemmas.append(lemma)
+
+    return forms
+
+
+# offline lemmatizer backed by a lookup list - called with a token of the
+# normalized index, it returns the lemmas of that token (an empty list for
+# forms the list does not know). parse_data accepts any callable with the
+# same signature, so other lemmatizers can be plugged in. 'digest'
+# identifies the lemma list, so parse_data only rebuilds the lemma table
+# when it changed
+class LookupLemmatizer:
+
+    def __init__(self, forms, digest=None):
+        self.forms = forms
+        self.digest = digest
+
+    # lemmatizer reading its forms from a lemma list file
+    @classmethod
+    def from_file(cls, path=LEMMA_FILE):
+
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+
+        return cls(load_lemma_list(path), digest)
+
+    def __call__(self, token):
+        return self.forms.get(token, [])
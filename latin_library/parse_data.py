@@ -1,10 +1,22 @@
 #!/usr/bin/python3
 
 import os
+import json
+import bisect
 import sqlite3
 import codecs
+import hashlib
+import array
 import re
+import argparse
+import itertools
+import collections
+import multiprocessing
 from bs4 import BeautifulSoup
+from latin_library.download import Downloader
+from latin_library.text import normalize, normalize_tokens, trigrams
+from latin_library.lemma import LEMMA_FILE, LookupLemmatizer
+from latin_library.snapshot import SNAPSHOT, write_snapshot
 
 # root shared by all collection urls
 URL_ROOT = 'www.thelatinlibrary.com/'
@@ -15,16 +27,50 @@ URL_EXTENSIONS = ['cassiodorus',
                   'verg',
                   'silius']
 
+# placeholder chapter for rows parsed before the first chapter heading of a
+# book - the chapter is carried over from the end of the previous book and
+# is filled in once the books of a collection are put back in order
+CARRIED_CHAPTER = '\x00carried'
+
+# sqlite database created from the parsed collections
+DATABASE = 'latin_library.db'
+
+# latin_manifest row holding the digest of the lemma list the lemma table
+# was built from, rather than a book
+LEMMA_MANIFEST_KEY = 'lemma list'
+
+# docids reserved for the verses of each book - the verses of a book are
+# numbered from block * BOOK_DOCIDS + 1, where its block is one of the
+# COLLECTION_BLOCKS blocks of its collection (from collection number *
+# COLLECTION_BLOCKS on). the books of a collection are given blocks in book
+# order, BLOCK_GAP apart, so a book added later fits between its
+# neighbours, and docid order is corpus order however often the books were
+# re-indexed (see book_blocks)
+BOOK_DOCIDS = 2 ** 20
+COLLECTION_BLOCKS = 2 ** 26
+BLOCK_GAP = 2 ** 12
+
 
 # download the given collection from 'www.thelatinlibrary.com/{collection}.html'
+# pages that have not changed since the last download are not fetched again
 def download_collection(collection):
-    os.system('wget -r -l 1 ' + URL_ROOT + collection + '.html')
+    return download_collections([collection])
 
 
-# parse the 'cassiodorus' collection into database item attribute lists
-def parse_cassiodorus():
+# download the given collections and the book pages they link to
+# concurrently, in a pool of 'workers' threads
+def download_collections(collections, workers=8):
 
-    cassiodorus_items = []
+    downloader = Downloader(workers=workers)
+    statuses = downloader.download_collections(collections)
+    downloader.close()
+
+    return statuses
+
+
+# parse the initial page of the 'cassiodorus' collection into the attributes
+# shared by all of its books along with the book titles and links
+def parse_cassiodorus_index():
 
     # first collection
     collection = URL_EXTENSIONS[0]
@@ -52,170 +98,176 @@ def parse_cassiodorus():
         books.append(tag.string)
         links.append(URL_ROOT + tag.get('href'))
 
-    # iterate over books
-    for book_num in range(len(books)):
+    return title, author, dates, books, links
 
-        # create beautiful soup object for current book page
-        with codecs.open(links[book_num], 
-                         encoding='utf-8', 
-                         errors='replace') as f:
-            soup = BeautifulSoup(f, 'html.parser')
 
-        # update some book fields to more descriptive values
-        if book_num < 13:
-            books[book_num] = soup.title.string.strip()[13:]       
+# parse a single 'cassiodorus' book page into database item attribute lists
+# returns the items along with the chapter in effect at the end of the book
+def parse_cassiodorus_book(book_num, book, link, title, author, dates):
+
+    cassiodorus_items = []
+
+    # chapter is carried over from the previous book until a heading is found
+    chapter = CARRIED_CHAPTER
+
+    # create beautiful soup object for current book page
+    with codecs.open(link, encoding='utf-8', errors='replace') as f:
+        soup = BeautifulSoup(f, 'html.parser')
 
-        # extract all p tags and remove irrelavant tags at beginning and end
-        paragraphs = soup.find_all('p')[2:-2]
+    # update some book fields to more descriptive values
+    if book_num < 13:
+        book = soup.title.string.strip()[13:]
 
-        # special parsing case for 'Orationum Reliquiae'
-        if book_num == 14:
-            
-            # verse counter
-            v_count = 1
+    # extract all p tags and remove irrelavant tags at beginning and end
+    paragraphs = soup.find_all('p')[2:-2]
 
-            # iterate over relevant p tags
-            for p in paragraphs:
+    # special parsing case for 'Orationum Reliquiae'
+    if book_num == 14:
 
-                # intentionally ignore some meaningless p tags in this book
-                if len(p.string.strip()) > 5:
-                    
-                    # set verse with counter and use content of p tag as passage        
-                    verse = str(v_count)
-                    passage = p.string.strip()
+        # verse counter
+        v_count = 1
+
+        # iterate over relevant p tags
+        for p in paragraphs:
+
+            # intentionally ignore some meaningless p tags in this book
+            if len(p.string.strip()) > 5:
+
+                # set verse with counter and use content of p tag as passage
+                verse = str(v_count)
+                passage = p.string.strip()
+
+                v_count += 1
+
+                # remove unexpected newline characters from some attributes
+                title = re.sub('\n', '', title)
+                book = re.sub('\n', '', book)
+                author = re.sub('\n', '', author)
+                dates = re.sub('\n', '', dates)
+                chapter = re.sub('\n', '', chapter)
 
-                    v_count += 1
+                # add attribute list to items to return
+                cassiodorus_items.append([title, book,
+                                         'Latin',
+                                         author,
+                                         dates,
+                                         'null',
+                                         verse,
+                                         passage,
+                                         link])
 
-                    # remove unexpected newline characters from some attributes
+    # special parsing case for 'de Musica'
+    elif book_num == 16:
+
+        # iterate over relevant p tags
+        for p in paragraphs:
+
+            # extract chapter names
+            if p.b is not None:
+                chapter = p.b.string.strip()
+
+            # chapter content
+            elif p.string is not None and p.string.strip() != '':
+
+                paragraph = p.string.strip()
+
+                # split content by 'x.' where x is a number (the verse num)
+                verses_passages = re.split('(\d+\.)', paragraph)
+
+                # ignore the first element (text before the first 'x.')
+                vp_count = 1
+                while vp_count < len(verses_passages) - 1:
+
+                    # extract verse number and passage text
+                    verse = verses_passages[vp_count]
+                    passage = verses_passages[vp_count+1].strip()
+
+                    # increment to next verse,passage group
+                    vp_count += 2
+
+                    # remove unexpected newline characters from attributes
                     title = re.sub('\n', '', title)
-                    books[book_num] = re.sub('\n', '', books[book_num])
+                    book = re.sub('\n', '', book)
                     author = re.sub('\n', '', author)
                     dates = re.sub('\n', '', dates)
                     chapter = re.sub('\n', '', chapter)
 
                     # add attribute list to items to return
-                    cassiodorus_items.append([title, books[book_num], 
-                                             'Latin', 
-                                             author, 
-                                             dates, 
-                                             'null', 
-                                             verse, 
-                                             passage, 
-                                             links[book_num]])
-                
-        # special parsing case for 'de Musica'
-        elif book_num == 16:
-            
-            # iterate over relevant p tags
-            for p in paragraphs:
-                
-                # extract chapter names
-                if p.b is not None:
-                    chapter = p.b.string.strip()
-
-                # chapter content
-                elif p.string is not None and p.string.strip() != '':
-                    
-                    paragraph = p.string.strip()  
-
-                    # split content by 'x.' where x is a number (the verse num)
-                    verses_passages = re.split('(\d+\.)', paragraph)
-
-                    # ignore the first element (text before the first 'x.')
-                    vp_count = 1
-                    while vp_count < len(verses_passages) - 1:
-                        
-                        # extract verse number and passage text
-                        verse = verses_passages[vp_count]
-                        passage = verses_passages[vp_count+1].strip() 
-
-                        # increment to next verse,passage group
-                        vp_count += 2
-
-                        # remove unexpected newline characters from attributes
-                        title = re.sub('\n', '', title)
-                        books[book_num] = re.sub('\n', '', books[book_num])
-                        author = re.sub('\n', '', author)
-                        dates = re.sub('\n', '', dates)
-                        chapter = re.sub('\n', '', chapter)
-
-                        # add attribute list to items to return
-                        cassiodorus_items.append([title, books[book_num], 
-                                                 'Latin', 
-                                                 author, 
-                                                 dates, 
-                                                 chapter, 
-                                                 verse, 
-                                                 passage,  
-                                                 links[book_num]])        
-    
-        # general parsing case for remaining books
-        else:
-            # track verse number in the case where a verse number is not given
-            next_verse_num = 1  
-
-            # iterate over relevant p tags
-            for p in paragraphs:
-
-                # extract chapter names
-                if p.b is not None:                
-                    chapter = p.b.string.strip()
-                    next_verse_num = 1            # new chapter, reset verse num
-                
-                # chapter content
-                elif p.string is not None and p.string.strip() != '':
-
-                    paragraph = p.string.strip()
-
-                    # if the paragraph does not begin with a verse number, 
-                    # insert one using information about the current chapter 
-                    # and previoius verse numbers        
-                    if paragraph[0] != '[':
-
-                        paragraph = '[' + str(next_verse_num) + '] ' + paragraph
-                   
-                    # split content by '[x]' where x is a number (the verse num)
-                    verses_passages = re.split('(\[\d*\])', paragraph)
-
-                    # ignore the first element (text before the first '[x]')
-                    vp_count = 1
-                    while vp_count < len(verses_passages) - 1:
-                        
-                        # extract verse number and passage text
-                        verse = verses_passages[vp_count][1:-1]
-                        passage = verses_passages[vp_count+1].strip()
-
-                        # update next verse number in case 
-                        # the next paragraph doesn't have one
-                        next_verse_num = int(verse) + 1
-
-                        # increment to next verse,passage group
-                        vp_count += 2
-            
-                        # remove unexpected newline characters from attributes
-                        title = re.sub('\n', '', title)
-                        books[book_num] = re.sub('\n', '', books[book_num])
-                        author = re.sub('\n', '', author)
-                        dates = re.sub('\n', '', dates)
-                        chapter = re.sub('\n', '', chapter)
-
-                        # add attribute list to items to return
-                        cassiodorus_items.append([title, books[book_num], 
-                                                 'Latin', 
-                                                 author, 
-                                                 dates, 
-                                                 chapter, 
-                                                 verse, 
-                                                 passage, 
-                                                 links[book_num]])         
-
-    return cassiodorus_items    
-
-
-# parse the 'statius' collection into database item attribute lists
-def parse_statius():
+                    cassiodorus_items.append([title, book,
+                                             'Latin',
+                                             author,
+                                             dates,
+                                             chapter,
+                                             verse,
+                                             passage,
+                                             link])
+
+    # general parsing case for remaining books
+    else:
+        # track verse number in the case where a verse number is not given
+        next_verse_num = 1
+
+        # iterate over relevant p tags
+        for p in paragraphs:
 
-    statius_items = []
+            # extract chapter names
+            if p.b is not None:
+                chapter = p.b.string.strip()
+                next_verse_num = 1            # new chapter, reset verse num
+
+            # chapter content
+            elif p.string is not None and p.string.strip() != '':
+
+                paragraph = p.string.strip()
+
+                # if the paragraph does not begin with a verse number,
+                # insert one using information about the current chapter
+                # and previoius verse numbers
+                if paragraph[0] != '[':
+
+                    paragraph = '[' + str(next_verse_num) + '] ' + paragraph
+
+                # split content by '[x]' where x is a number (the verse num)
+                verses_passages = re.split('(\[\d*\])', paragraph)
+
+                # ignore the first element (text before the first '[x]')
+                vp_count = 1
+                while vp_count < len(verses_passages) - 1:
+
+                    # extract verse number and passage text
+                    verse = verses_passages[vp_count][1:-1]
+                    passage = verses_passages[vp_count+1].strip()
+
+                    # update next verse number in case
+                    # the next paragraph doesn't have one
+                    next_verse_num = int(verse) + 1
+
+                    # increment to next verse,passage group
+                    vp_count += 2
+
+                    # remove unexpected newline characters from attributes
+                    title = re.sub('\n', '', title)
+                    book = re.sub('\n', '', book)
+                    author = re.sub('\n', '', author)
+                    dates = re.sub('\n', '', dates)
+                    chapter = re.sub('\n', '', chapter)
+
+                    # add attribute list to items to return
+                    cassiodorus_items.append([title, book,
+                                             'Latin',
+                                             author,
+                                             dates,
+                                             chapter,
+                                             verse,
+                                             passage,
+                                             link])
+
+    return cassiodorus_items, chapter
+
+
+# parse the initial page of the 'statius' collection into the attributes
+# shared by all of its books along with the book titles and links
+def parse_statius_index():
 
     # second collection
     collection = URL_EXTENSIONS[1]
@@ -244,130 +296,133 @@ def parse_statius():
         books.append(tag.string)
         links.append(URL_ROOT + tag.get('href'))
 
-    # iterate over books
-    for book_num in range(len(books)):
-        
-        # create beautiful soup object for current book page
-        with codecs.open(links[book_num], 
-                         encoding='utf-8', 
-                         errors='replace') as f:
+    return title, author, dates, books, links
 
-            # insert neccessary formatting to html of 2 books
-            if book_num == 13 or book_num == 16:
-                text = re.sub('<br>', '<br>\n', f.read())
-                text = re.sub('<BR>', '<BR>\n', text)
-                soup = BeautifulSoup(text, 'html.parser')
 
-            else:
-                soup = BeautifulSoup(f, 'html.parser')
+# parse a single 'statius' book page into database item attribute lists
+# returns the items along with the chapter in effect at the end of the book
+def parse_statius_book(book_num, book, link, title, author, dates):
 
-        # update book field to a more descriptive value
-        books[book_num] = soup.title.string.strip()[9:]
+    statius_items = []
 
-        # default chapter value
-        chapter = 'null'
+    # create beautiful soup object for current book page
+    with codecs.open(link, encoding='utf-8', errors='replace') as f:
 
-        # verse counter
-        verse = 1
+        # insert neccessary formatting to html of 2 books
+        if book_num == 13 or book_num == 16:
+            text = re.sub('<br>', '<br>\n', f.read())
+            text = re.sub('<BR>', '<BR>\n', text)
+            soup = BeautifulSoup(text, 'html.parser')
 
-        # special parsing case for beginning of these 4 files
-        if book_num >= 12 and book_num <= 16:
+        else:
+            soup = BeautifulSoup(f, 'html.parser')
 
-            # all relevant p tags
-            p_tags = soup.find_all('p')[2:-1]
+    # update book field to a more descriptive value
+    book = soup.title.string.strip()[9:]
 
-            # beginning of these files is a chapter, verse combo
-            chapter = p_tags[0].get_text().strip()
-            passage = p_tags[1].get_text().strip()
+    # default chapter value
+    chapter = 'null'
 
-            # remove unexpected newline characters from attributes
-            title = re.sub('\n', '', title)
-            books[book_num] = re.sub('\n', '', books[book_num])
-            author = re.sub('\n', '', author)
-            dates = re.sub('\n', '', dates)
-            chapter = re.sub('\n', '', chapter)
+    # verse counter
+    verse = 1
 
-            # add attribute list to items to return
-            statius_items.append([title, books[book_num], 
-                                 'Latin', 
-                                 author, 
-                                 dates, 
-                                 chapter, 
-                                 verse, 
-                                 passage, 
-                                 links[book_num]])
-
-            # update p_tags
-            p_tags = p_tags[2:]
-
-        # general case for all other files
-        else:
-            # only relevant p tag
-            p_tags = soup.find_all('p')[2:3]
-    
-        # iterate over p tags
-        for p in p_tags:
+    # special parsing case for beginning of these 4 files
+    if book_num >= 12 and book_num <= 16:
 
-            # extract chapter names
-            if p.b is not None:
-                chapter = p.get_text().strip()
-                verse = 1
+        # all relevant p tags
+        p_tags = soup.find_all('p')[2:-1]
 
-            # chapter content
-            else:
-                # extract relevant p tag text
-                p_text = p.get_text()
+        # beginning of these files is a chapter, verse combo
+        chapter = p_tags[0].get_text().strip()
+        passage = p_tags[1].get_text().strip()
 
-                # split the relevant text into lines
-                p_lines = re.split('\n', p_text)
+        # remove unexpected newline characters from attributes
+        title = re.sub('\n', '', title)
+        book = re.sub('\n', '', book)
+        author = re.sub('\n', '', author)
+        dates = re.sub('\n', '', dates)
+        chapter = re.sub('\n', '', chapter)
 
-                # iterate over relevant lines
-                for i in range(1, len(p_lines) - 1):
+        # add attribute list to items to return
+        statius_items.append([title, book,
+                             'Latin',
+                             author,
+                             dates,
+                             chapter,
+                             verse,
+                             passage,
+                             link])
 
-                    # ignore blank lines
-                    if p_lines[i].strip() != '':
+        # update p_tags
+        p_tags = p_tags[2:]
 
-                        # attempt to split the line by 'x' 
-                        # where x is any number of digits (the verse number)
-                        split_line = re.split('(\d+)', p_lines[i].strip())
-                        
-                        # split success - verse number explicitly given                
-                        if len(split_line) > 1:
+    # general case for all other files
+    else:
+        # only relevant p tag
+        p_tags = soup.find_all('p')[2:3]
 
-                            # set verse number to explicitly given value 
-                            # in case simple line counter is off
-                            verse = int(split_line[1].strip())
+    # iterate over p tags
+    for p in p_tags:
 
-                        # extract passage text
-                        passage = split_line[0].strip()                   
+        # extract chapter names
+        if p.b is not None:
+            chapter = p.get_text().strip()
+            verse = 1
 
-                        # remove unexpected newline characters from attributes
-                        title = re.sub('\n', '', title)
-                        books[book_num] = re.sub('\n', '', books[book_num])
-                        author = re.sub('\n', '', author)
-                        dates = re.sub('\n', '', dates)
-                        chapter = re.sub('\n', '', chapter)
+        # chapter content
+        else:
+            # extract relevant p tag text
+            p_text = p.get_text()
 
-                        # add attribute list to items to return
-                        statius_items.append([title, books[book_num], 
-                                             'Latin', 
-                                             author, 
-                                             dates, 
-                                             chapter, 
-                                             verse, 
-                                             passage, 
-                                             links[book_num]])
+            # split the relevant text into lines
+            p_lines = re.split('\n', p_text)
 
-                        # increment verse counter
-                        verse += 1
+            # iterate over relevant lines
+            for i in range(1, len(p_lines) - 1):
 
-    return statius_items
+                # ignore blank lines
+                if p_lines[i].strip() != '':
 
+                    # attempt to split the line by 'x'
+                    # where x is any number of digits (the verse number)
+                    split_line = re.split('(\d+)', p_lines[i].strip())
 
-# parse the 'virgil' collection into database item attribute lists
-def parse_virgil():
-    
-    virgil_items = []
+                    # split success - verse number explicitly given
+                    if len(split_line) > 1:
+
+                        # set verse number to explicitly given value
+                        # in case simple line counter is off
+                        verse = int(split_line[1].strip())
+
+                    # extract passage text
+                    passage = split_line[0].strip()
+
+                    # remove unexpected newline characters from attributes
+                    title = re.sub('\n', '', title)
+                    book = re.sub('\n', '', book)
+                    author = re.sub('\n', '', author)
+                    dates = re.sub('\n', '', dates)
+                    chapter = re.sub('\n', '', chapter)
+
+                    # add attribute list to items to return
+                    statius_items.append([title, book,
+                                         'Latin',
+                                         author,
+                                         dates,
+                                         chapter,
+                                         verse,
+                                         passage,
+                                         link])
+
+                    # increment verse counter
+                    verse += 1
+
+    return statius_items, chapter
+
+
+# parse the initial page of the 'virgil' collection into the attributes
+# shared by all of its books along with the book titles and links
+def parse_virgil_index():
 
     # third collection
     collection = URL_EXTENSIONS[2]
@@ -394,105 +449,108 @@ def parse_virgil():
     # get the link strings and href content from all but the last 2 link tags
     for tag in link_tags[:-2]:
         books.append(tag.string)
-        links.append(URL_ROOT + tag.get('href'))  
+        links.append(URL_ROOT + tag.get('href'))
 
     # replace some book names with a more desciptive version
     for i in range(len(books)):
         if 'Liber' in books[i]:
-            books[i] = re.sub('Liber', 'Georgicon', books[i]) 
+            books[i] = re.sub('Liber', 'Georgicon', books[i])
 
-    # iterate over books
-    for book_num in range(len(books)):
+    return title, author, dates, books, links
 
-        # create beautiful soup object for current book page
-        with codecs.open(links[book_num], 
-                         encoding='utf-8', 
-                         errors='replace') as f:    
 
-            # insert neccessary formatting to html of 8 books
-            if ((book_num >= 16 and book_num <= 21) 
-                or book_num == 24 or book_num == 25):
+# parse a single 'virgil' book page into database item attribute lists
+# returns the items along with the chapter in effect at the end of the book
+def parse_virgil_book(book_num, book, link, title, author, dates):
 
-                text = re.sub('<br>', '<br>\n', f.read())
-                text = re.sub('<BR>', '<BR>\n', text)
-                soup = BeautifulSoup(text, 'html.parser')
+    virgil_items = []
 
-            else:
-                soup = BeautifulSoup(f, 'html.parser')      
+    # create beautiful soup object for current book page
+    with codecs.open(link, encoding='utf-8', errors='replace') as f:
 
-        # split text of html page into lines, ignoring the first 9 and last 5
-        p_lines = soup.get_text().strip().split('\n')[9:-5]
+        # insert neccessary formatting to html of 8 books
+        if ((book_num >= 16 and book_num <= 21)
+            or book_num == 24 or book_num == 25):
 
-        # default chapter value
-        chapter = 'null'
+            text = re.sub('<br>', '<br>\n', f.read())
+            text = re.sub('<BR>', '<BR>\n', text)
+            soup = BeautifulSoup(text, 'html.parser')
 
-        # verse counter
-        verse = 1  
-
-        # iterate over relevant lines
-        for i in range(len(p_lines)):
-
-            # special case in 'ecloga' books 
-            # line is significantly indented and contains unwanted data
-            if re.match(r'^\s{10,}', p_lines[i]):
-
-                # strip to remove indentation
-                p_lines[i] = p_lines[i].strip()                   
-            
-                # beginning with the 2nd letter, 
-                # find the end of the current 'word' (it's a name in this case)
-                j = 1
-                while j < len(p_lines[i]) and p_lines[i][j].islower():
-                    j += 1
-            
-                # remove leading 'word' from line
-                p_lines[i] = p_lines[i][j:].strip()
-
-
-            # ignore blank lines and lines beginning with whitespace
-            if p_lines[i].strip() != '':
-
-                # attempt to split the line by 'x'
-                # where x is any number of digits (the verse number)
-                split_line = re.split('(\d+)', p_lines[i].strip())
-                
-                # split success - verse number explicitly given                
-                if len(split_line) > 1:
-
-                    # set verse number to explicitly given value 
-                    # in case simple line counter is off
-                    verse = int(split_line[1].strip())
-
-                # extract passage text
-                passage = split_line[0].strip()                   
-
-                # remove unexpected newline characters from attributes
-                title = re.sub('\n', '', title)
-                books[book_num] = re.sub('\n', '', books[book_num])
-                author = re.sub('\n', '', author)
-                dates = re.sub('\n', '', dates)
-                chapter = re.sub('\n', '', chapter)
+        else:
+            soup = BeautifulSoup(f, 'html.parser')
 
-                # add attribute list to items to return
-                virgil_items.append([title, books[book_num], 
-                                    'Latin', 
-                                    author, 
-                                    dates, 
-                                    chapter, 
-                                    verse, 
-                                    passage, 
-                                    links[book_num]])
-
-                # increment verse counter
-                verse += 1
-            
-    return virgil_items
-
-
-# parse the 'silius' collection into database item attribute lists
-def parse_silius():
-    
-    silius_items = []
+    # split text of html page into lines, ignoring the first 9 and last 5
+    p_lines = soup.get_text().strip().split('\n')[9:-5]
+
+    # default chapter value
+    chapter = 'null'
+
+    # verse counter
+    verse = 1
+
+    # iterate over relevant lines
+    for i in range(len(p_lines)):
+
+        # special case in 'ecloga' books
+        # line is significantly indented and contains unwanted data
+        if re.match(r'^\s{10,}', p_lines[i]):
+
+            # strip to remove indentation
+            p_lines[i] = p_lines[i].strip()
+
+            # beginning with the 2nd letter,
+            # find the end of the current 'word' (it's a name in this case)
+            j = 1
+            while j < len(p_lines[i]) and p_lines[i][j].islower():
+                j += 1
+
+            # remove leading 'word' from line
+            p_lines[i] = p_lines[i][j:].strip()
+
+
+        # ignore blank lines and lines beginning with whitespace
+        if p_lines[i].strip() != '':
+
+            # attempt to split the line by 'x'
+            # where x is any number of digits (the verse number)
+            split_line = re.split('(\d+)', p_lines[i].strip())
+
+            # split success - verse number explicitly given
+            if len(split_line) > 1:
+
+                # set verse number to explicitly given value
+                # in case simple line counter is off
+                verse = int(split_line[1].strip())
+
+            # extract passage text
+            passage = split_line[0].strip()
+
+            # remove unexpected newline characters from attributes
+            title = re.sub('\n', '', title)
+            book = re.sub('\n', '', book)
+            author = re.sub('\n', '', author)
+            dates = re.sub('\n', '', dates)
+            chapter = re.sub('\n', '', chapter)
+
+            # add attribute list to items to return
+            virgil_items.append([title, book,
+                                'Latin',
+                                author,
+                                dates,
+                                chapter,
+                                verse,
+                                passage,
+                                link])
+
+            # increment verse counter
+            verse += 1
+
+    return virgil_items, chapter
+
+
+# parse the initial page of the 'silius' collection into the attributes
+# shared by all of its books along with the book titles and links
+def parse_silius_index():
 
     # fourth collection
     collection = URL_EXTENSIONS[3]
@@ -519,178 +577,968 @@ def parse_silius():
     # get the link strings and href content from all but the last 2 link tags
     for tag in link_tags[:-2]:
         books.append(tag.string)
-        links.append(URL_ROOT + tag.get('href'))  
+        links.append(URL_ROOT + tag.get('href'))
 
     # replace book names with a more desciptive version
     for i in range(len(books)):
         if 'Liber' in books[i]:
-            books[i] = re.sub('Liber', 'Punica', books[i]) 
-
-    # iterate over books
-    for book_num in range(len(books)):
-    
-        # create beautiful soup object for current book page
-        with codecs.open(links[book_num], 
-                         encoding='utf-8', 
-                         errors='replace') as f:
-                soup = BeautifulSoup(f, 'html.parser')
-
-        # split text of html page into lines, ignoring first 9 and last 6 lines
-        p_lines = soup.get_text().strip().split('\n')[9:-6]
-
-        # fix special parsing issue for 2 books 
-        # verse numbers on their own line instead of at the end of the right line
-        if book_num == 15 or book_num == 16:
-            
-            j = 0
-            while True:
-
-                # exit loop condition
-                if j >= len(p_lines):
-                    break
-
-                # if this is a verse number line, 
-                # concatenate it with the previous line 
-                # and delete the verse number line    
-                if re.match(r'\d+', p_lines[j]):
-                    p_lines[j-1] = p_lines[j-1] + p_lines[j]
-                    del p_lines[j]
+            books[i] = re.sub('Liber', 'Punica', books[i])
 
-                j += 1
+    return title, author, dates, books, links
 
-        # default chapter value
-        chapter = 'null'
 
-        # verse counter
-        verse = 1  
+# parse a single 'silius' book page into database item attribute lists
+# returns the items along with the chapter in effect at the end of the book
+def parse_silius_book(book_num, book, link, title, author, dates):
 
-        # iterate over relevant lines
-        for i in range(len(p_lines)):
+    silius_items = []
 
-            # ignore blank lines
-            if p_lines[i].strip() != '':
+    # create beautiful soup object for current book page
+    with codecs.open(link, encoding='utf-8', errors='replace') as f:
+            soup = BeautifulSoup(f, 'html.parser')
 
-                # attempt to split the line by 'x' 
-                # where x is any number of digits (the verse number)
-                split_line = re.split('(\d+)', p_lines[i].strip())
-                
-                # split success - verse number explicitly given                
-                if len(split_line) > 1:
+    # split text of html page into lines, ignoring first 9 and last 6 lines
+    p_lines = soup.get_text().strip().split('\n')[9:-6]
 
-                    # set verse number to explicitly given value 
-                    # in case simple line counter is off
-                    verse = int(split_line[1].strip())
+    # fix special parsing issue for 2 books
+    # verse numbers on their own line instead of at the end of the right line
+    if book_num == 15 or book_num == 16:
 
-                # extract passage text
-                passage = split_line[0].strip()              
+        j = 0
+        while True:
 
-                # remove unexpected newline characters from attributes
-                title = re.sub('\n', '', title)
-                books[book_num] = re.sub('\n', '', books[book_num])
-                author = re.sub('\n', '', author)
-                dates = re.sub('\n', '', dates)
-                chapter = re.sub('\n', '', chapter)
+            # exit loop condition
+            if j >= len(p_lines):
+                break
 
-                # add attribute list to items to return
-                silius_items.append([title, books[book_num], 
-                                    'Latin', 
-                                    author, 
-                                    dates, 
-                                    chapter, 
-                                    verse, 
-                                    passage, 
-                                    links[book_num]])
+            # if this is a verse number line,
+            # concatenate it with the previous line
+            # and delete the verse number line
+            if re.match(r'\d+', p_lines[j]):
+                p_lines[j-1] = p_lines[j-1] + p_lines[j]
+                del p_lines[j]
+
+            j += 1
+
+    # default chapter value
+    chapter = 'null'
+
+    # verse counter
+    verse = 1
+
+    # iterate over relevant lines
+    for i in range(len(p_lines)):
+
+        # ignore blank lines
+        if p_lines[i].strip() != '':
+
+            # attempt to split the line by 'x'
+            # where x is any number of digits (the verse number)
+            split_line = re.split('(\d+)', p_lines[i].strip())
+
+            # split success - verse number explicitly given
+            if len(split_line) > 1:
+
+                # set verse number to explicitly given value
+                # in case simple line counter is off
+                verse = int(split_line[1].strip())
+
+            # extract passage text
+            passage = split_line[0].strip()
+
+            # remove unexpected newline characters from attributes
+            title = re.sub('\n', '', title)
+            book = re.sub('\n', '', book)
+            author = re.sub('\n', '', author)
+            dates = re.sub('\n', '', dates)
+            chapter = re.sub('\n', '', chapter)
+
+            # add attribute list to items to return
+            silius_items.append([title, book,
+                                'Latin',
+                                author,
+                                dates,
+                                chapter,
+                                verse,
+                                passage,
+                                link])
+
+            # increment verse counter
+            verse += 1
+
+    return silius_items, chapter
+
+
+# (index parser, book parser) pairs for each collection,
+# in the same order as URL_EXTENSIONS
+COLLECTION_PARSERS = [(parse_cassiodorus_index, parse_cassiodorus_book),
+                      (parse_statius_index, parse_statius_book),
+                      (parse_virgil_index, parse_virgil_book),
+                      (parse_silius_index, parse_silius_book)]
+
+
+# create the list of per-book parsing tasks for the given collection
+# each task is (collection number, book number, book, link, title, author, dates)
+def book_tasks(collection_num):
+
+    # parse the initial page of the collection
+    parse_index = COLLECTION_PARSERS[collection_num][0]
+    title, author, dates, books, links = parse_index()
+
+    return [(collection_num, book_num, str(books[book_num]), links[book_num],
+             title, author, dates) for book_num in range(len(books))]
 
-                # increment verse counter
-                verse += 1
 
-    return silius_items
+# run a single per-book parsing task - module level so it can be sent to
+# worker processes
+def parse_book_task(task):
+
+    collection_num = task[0]
+    parse_book = COLLECTION_PARSERS[collection_num][1]
+
+    return parse_book(*task[1:])
+
+
+# fill in carried over chapters for the per-book results of one collection
+# given in book order, yielding the items one at a time
+def merge_book_results(book_results):
+
+    # chapter in effect at the end of the previous book
+    chapter = 'null'
+
+    for book_items, last_chapter in book_results:
+
+        # rows parsed before the first chapter heading of the book
+        for item in book_items:
+            if item[5] == CARRIED_CHAPTER:
+                item[5] = chapter
+
+        # a book without any chapter headings leaves the chapter unchanged
+        if last_chapter != CARRIED_CHAPTER:
+            chapter = last_chapter
+
+        yield from book_items
+
+
+# parse the given collection serially, yielding database item attribute lists
+# one book page is held in memory at a time
+def parse_collection(collection_num):
+    return merge_book_results(parse_book_task(task)
+                              for task in book_tasks(collection_num))
+
+
+# parse the 'cassiodorus' collection, yielding database item attribute lists
+def parse_cassiodorus():
+    return parse_collection(0)
+
+
+# parse the 'statius' collection, yielding database item attribute lists
+def parse_statius():
+    return parse_collection(1)
+
+
+# parse the 'virgil' collection, yielding database item attribute lists
+def parse_virgil():
+    return parse_collection(2)
+
+
+# parse the 'silius' collection, yielding database item attribute lists
+def parse_silius():
+    return parse_collection(3)
+
+
+# parse the given tasks in a pool of worker processes, yielding
+# (collection number, result) pairs in task order - at most 'window' books
+# are parsed ahead of the consumer so memory stays bounded
+def parse_books_in_pool(tasks, processes, window=None):
+
+    # default to two books in flight per worker process
+    if window is None:
+        window = 2 * (processes or os.cpu_count() or 1)
+
+    with multiprocessing.Pool(processes) as pool:
+
+        pending = collections.deque()
+
+        for task in tasks:
+            pending.append((task[0],
+                            pool.apply_async(parse_book_task, (task,))))
+
+            # wait for the oldest book once the window is full
+            if len(pending) >= window:
+                collection_num, result = pending.popleft()
+                yield collection_num, result.get()
+
+        # remaining books
+        while pending:
+            collection_num, result = pending.popleft()
+            yield collection_num, result.get()
 
 
 # parse the downloaded collections,
-# creating a list of attribute lists to insert into a database later
-def parse_collections():
+# yielding attribute lists to insert into a database as they are parsed
+# with processes > 1 (or None for one per cpu) the individual book pages of
+# all collections are parsed in a pool of worker processes - the resulting
+# items are identical to, and in the same order as, the serial case
+def parse_collections(processes=1):
 
-    # list of attribute lists for database insertion later
-    passage_items = []
+    # serial case - parse individual collections one after another
+    if processes == 1:
+        yield from parse_cassiodorus()
+        yield from parse_statius()
+        yield from parse_virgil()
+        yield from parse_silius()
 
-    # parse individual collections and build list of attribute lists
-    passage_items.extend(parse_cassiodorus())
-    passage_items.extend(parse_statius())
-    passage_items.extend(parse_virgil())
-    passage_items.extend(parse_silius())
+        return
 
-    return passage_items
+    # per-book tasks for all collections, in collection and book order
+    tasks = []
+    for collection_num in range(len(COLLECTION_PARSERS)):
+        tasks.extend(book_tasks(collection_num))
 
+    # merge the per-book results of each collection separately
+    results = parse_books_in_pool(tasks, processes)
+    for collection_num, group in itertools.groupby(results,
+                                                   key=lambda r: r[0]):
+        yield from merge_book_results(result for _, result in group)
 
-# create and populate a sqlite3 database with a pre-defined schema 
-# given a list of attribute lists
-def populate_database(items):
 
-    # create database connection
-    db = sqlite3.connect('latin_library.db')
-    c = db.cursor()
+# pragmas applied to the connection while bulk loading an empty database
+# (a new file, or one cleared by --rebuild) - there is nothing in it to
+# lose and the build can always be rerun from the downloaded pages, so
+# durability is traded for speed until the load has committed
+BULK_PRAGMAS = [('journal_mode', 'MEMORY'),
+                ('synchronous', 'OFF'),
+                ('cache_size', '-65536'),
+                ('temp_store', 'MEMORY')]
+
+# pragmas applied to the connection while updating an existing database -
+# the update runs in place on the database searches read, so the rollback
+# journal and synchronous writes are kept and a crash mid-update leaves the
+# database as it was before the update
+UPDATE_PRAGMAS = [('cache_size', '-65536'),
+                  ('temp_store', 'MEMORY')]
+
+
+# set the given (name, value) pragmas on a database connection,
+# returning their previous values so they can be restored afterwards
+def set_pragmas(db, pragmas):
+
+    previous = []
+
+    for name, value in pragmas:
+        previous.append((name, db.execute('PRAGMA ' + name).fetchone()[0]))
+        db.execute('PRAGMA {} = {}'.format(name, value))
+
+    return previous
+
+
+# increment the build generation of the database (its user_version) -
+# readers compare it to detect that cached results are out of date
+def next_generation(c):
+
+    generation = c.execute('PRAGMA user_version').fetchone()[0]
+    c.execute('PRAGMA user_version = ' + str(generation + 1))
 
-    # create latin_text table with appropriate attributes
-    c.execute('''CREATE TABLE latin_text (title text, 
-                                          book text, 
-                                          language text, 
-                                          author text, 
-                                          dates text, 
-                                          chapter text, 
-                                          verse integer, 
-                                          passage text, 
-                                          link text)''')
-
-    # insert table row for each set of passage attributes
-    for index in range(0, len(items)):
-        c.execute('INSERT INTO latin_text VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', 
-                  items[index])
-
-    # commit changes and close db connection
-    db.commit()
+
+# drop every table, view and index of the database, keeping the file (and
+# its build generation) so open read-only connections see the rebuild
+def clear_database(database=DATABASE):
+
+    db = sqlite3.connect(database, isolation_level=None)
+    c = db.cursor()
+    c.execute('BEGIN')
+
+    # views first, then fts tables (which drop their own shadow tables)
+    for kind, pattern in (('view', '%'), ('table', 'CREATE VIRTUAL%'),
+                          ('table', '%')):
+        c.execute('''SELECT name FROM sqlite_master
+                     WHERE type = ? AND sql LIKE ?
+                     AND name NOT LIKE 'sqlite_%' ''', [kind, pattern])
+        for (name,) in c.fetchall():
+            c.execute('DROP ' + kind.upper() + ' IF EXISTS "' + name + '"')
+
+    c.execute('COMMIT')
     db.close()
 
 
-# create and populate an fts4 table from the previously created latin_text table
-def create_fts_table():
+# precompute the term x book matrix of usage counts served to usage charts
+# - the number of verses of each book containing each token of the
+# normalized spelling index, as counted by 'SELECT book, COUNT(*) ... WHERE
+# latin_norm_fts MATCH term GROUP BY book'. each term is one latin_usage row
+# whose counts blob holds the non-zero cells as (latin_usage_book id, count)
+# pairs of unsigned ints
+def build_usage_matrix(c):
+
+    c.execute('DROP TABLE IF EXISTS latin_usage')
+    c.execute('DROP TABLE IF EXISTS latin_usage_book')
+
+    c.execute('''CREATE TABLE latin_usage_book (id integer PRIMARY KEY,
+                                                book text UNIQUE,
+                                                title text)''')
+    c.execute('''CREATE TABLE latin_usage (term text PRIMARY KEY,
+                                           counts blob) WITHOUT ROWID''')
+
+    # book name -> column of the matrix (books are grouped by name, as in
+    # the GROUP BY query) and term -> {column: count}
+    book_ids = {}
+    matrix = collections.defaultdict(collections.Counter)
+
+    # passages are streamed through a second cursor
+    for book, title, passage in c.connection.execute(
+            'SELECT book, title, passage FROM latin_text'):
+
+        if book not in book_ids:
+            book_ids[book] = len(book_ids) + 1
+            c.execute('INSERT INTO latin_usage_book VALUES (?, ?, ?)',
+                      [book_ids[book], book, title])
+
+        # each verse counts once per term
+        book_id = book_ids[book]
+        for term in set(normalize_tokens(passage)):
+            matrix[term][book_id] += 1
+
+    c.executemany('INSERT INTO latin_usage VALUES (?, ?)',
+                  ((term, array.array('I', itertools.chain.from_iterable(
+                       sorted(counts.items()))).tobytes())
+                   for term, counts in matrix.items()))
+
+
+# rebuild the lemma table mapping each token of the normalized spelling
+# index to its lemma(s) - 'lemmatizer' is called with each distinct token
+# and returns the token's lemmas (see lemma.LookupLemmatizer). search_interface
+# resolves a lemma to its verses by joining latin_lemma to latin_norm_fts
+def build_lemma_index(c, lemmatizer):
+
+    c.execute('DELETE FROM latin_lemma')
+
+    # vocabulary of the normalized index
+    c.execute('''CREATE VIRTUAL TABLE temp.latin_norm_terms
+                 USING fts4aux(main, latin_norm_fts)''')
+    tokens = [row[0] for row in c.execute(
+        "SELECT term FROM temp.latin_norm_terms WHERE col = '*'")]
+    c.execute('DROP TABLE temp.latin_norm_terms')
+
+    c.executemany('INSERT OR IGNORE INTO latin_lemma VALUES (?, ?)',
+                  ((lemma, token) for token in tokens
+                   for lemma in lemmatizer(token)))
+
+
+# rebuild the vocabulary of the normalized spelling index and its trigram
+# index, used by fuzzy searches to find the words closest to a misspelled
+# one - latin_vocab holds each token with the number of verses containing
+# it, and latin_trigram each (trigram, token length, token id) of the
+# tokens, so the tokens of about the same length sharing trigrams with a
+# word are a range scan per trigram
+def build_trigram_index(c):
+
+    c.execute('DROP TABLE IF EXISTS latin_trigram')
+    c.execute('DROP TABLE IF EXISTS latin_vocab')
+
+    c.execute('''CREATE TABLE latin_vocab (id integer PRIMARY KEY,
+                                           term text UNIQUE,
+                                           documents integer)''')
+    c.execute('''CREATE TABLE latin_trigram (trigram text,
+                                             length integer,
+                                             term_id integer,
+                                             PRIMARY KEY (trigram, length,
+                                                          term_id))
+                 WITHOUT ROWID''')
+
+    # vocabulary of the normalized index
+    c.execute('''CREATE VIRTUAL TABLE temp.latin_norm_terms
+                 USING fts4aux(main, latin_norm_fts)''')
+    c.execute('''INSERT INTO latin_vocab (term, documents)
+                 SELECT term, documents FROM temp.latin_norm_terms
+                 WHERE col = '*' ''')
+    c.execute('DROP TABLE temp.latin_norm_terms')
+
+    c.executemany('INSERT INTO latin_trigram VALUES (?, ?, ?)',
+                  ((trigram, len(term), term_id)
+                   for term_id, term in c.connection.execute(
+                       'SELECT id, term FROM latin_vocab')
+                   for trigram in trigrams(term)))
+
+
+# add (docid, passage) rows to the normalized spelling index - passages are
+# indexed in their normalized form (see text.normalize) under the docid of
+# their latin_fts row, so searches can match any spelling variant while
+# results are still displayed from latin_fts
+def index_normalized(c, rows):
+
+    c.executemany('INSERT INTO latin_norm_fts (docid, passage) VALUES (?, ?)',
+                  ((docid, normalize(passage)) for docid, passage in rows))
+
+
+# create any missing tables of the incrementally built database
+# latin_fts docids are the rowids of the corresponding latin_text rows, and
+# latin_manifest records, for each book link, the content hash of the book,
+# the chapter carried into / out of the book when it was last parsed and the
+# block of docids it was numbered from (see BOOK_DOCIDS)
+# with 'normalized', see create_normalized_schema
+def create_schema(c, normalized=False):
+
+    if normalized:
+        create_normalized_schema(c)
+
+    else:
+        c.execute('''CREATE TABLE IF NOT EXISTS latin_text (title text,
+                                                            book text,
+                                                            language text,
+                                                            author text,
+                                                            dates text,
+                                                            chapter text,
+                                                            verse integer,
+                                                            passage text,
+                                                            link text)''')
+
+        # rows are replaced a book (link) at a time
+        c.execute('''CREATE INDEX IF NOT EXISTS latin_text_link
+                     ON latin_text (link)''')
+
+        # citation lookups - a verse or range of verses of a book chapter
+        c.execute('''CREATE INDEX IF NOT EXISTS latin_text_citation
+                     ON latin_text (book, chapter, verse)''')
+
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS latin_fts
+                     USING fts4(passage, link, title, book, chapter, verse)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS latin_manifest (
+                     link text PRIMARY KEY,
+                     digest text,
+                     chapter_in text,
+                     chapter_out text,
+                     block integer)''')
+
+    # databases built before books kept their place in docid order
+    columns = [row[1] for row in
+               c.execute('PRAGMA table_info(latin_manifest)').fetchall()]
+    if 'block' not in columns:
+        c.execute('ALTER TABLE latin_manifest ADD COLUMN block integer')
+
+    # normalized spelling index, see index_normalized
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS latin_norm_fts
+                 USING fts4(passage)''')
+
+    # lemmas of the tokens of the normalized index, see build_lemma_index
+    c.execute('''CREATE TABLE IF NOT EXISTS latin_lemma
+                     (lemma text, token text, PRIMARY KEY (lemma, token))
+                 WITHOUT ROWID''')
+
+
+# create the tables of the normalized layout - collection and book
+# attributes are stored once in latin_collection / latin_book, passages
+# refer to their book by id, and latin_fts is an external content index
+# over the passages so their text is only stored in latin_passage
+# latin_text is a view with the columns of the original table, and the
+# latin_fts columns are unchanged, so searches work with either layout
+def create_normalized_schema(c):
+
+    c.execute('''CREATE TABLE IF NOT EXISTS latin_collection (
+                     id integer PRIMARY KEY,
+                     title text,
+                     language text,
+                     author text,
+                     dates text,
+                     UNIQUE (title, language, author, dates))''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS latin_book (
+                     id integer PRIMARY KEY,
+                     collection_id integer REFERENCES latin_collection (id),
+                     book text,
+                     link text UNIQUE)''')
+
+    c.execute('''CREATE TABLE IF NOT EXISTS latin_passage (
+                     id integer PRIMARY KEY,
+                     book_id integer REFERENCES latin_book (id),
+                     chapter text,
+                     verse integer,
+                     passage text)''')
+
+    # passages are replaced a book at a time
+    c.execute('''CREATE INDEX IF NOT EXISTS latin_passage_book
+                 ON latin_passage (book_id)''')
+
+    # citation lookups - the book by name, then a verse or range of verses
+    # of one of its chapters
+    c.execute('''CREATE INDEX IF NOT EXISTS latin_book_book
+                 ON latin_book (book)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS latin_passage_citation
+                 ON latin_passage (book_id, chapter, verse)''')
+
+    # compatibility view with the columns of the original latin_text table
+    c.execute('''CREATE VIEW IF NOT EXISTS latin_text AS
+                 SELECT c.title, b.book, c.language, c.author, c.dates,
+                        p.chapter, p.verse, p.passage, b.link
+                 FROM latin_passage p
+                 JOIN latin_book b ON b.id = p.book_id
+                 JOIN latin_collection c ON c.id = b.collection_id''')
+
+    # content of the fts index - looked up by rowid for every returned row
+    c.execute('''CREATE VIEW IF NOT EXISTS latin_fts_content AS
+                 SELECT p.id AS rowid, p.passage, b.link, c.title, b.book,
+                        p.chapter, p.verse
+                 FROM latin_passage p
+                 JOIN latin_book b ON b.id = p.book_id
+                 JOIN latin_collection c ON c.id = b.collection_id''')
+
+    # only passages are searched, the other columns are not tokenized
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS latin_fts
+                 USING fts4(content="latin_fts_content",
+                            passage, link, title, book, chapter, verse,
+                            notindexed=link, notindexed=title,
+                            notindexed=book, notindexed=chapter,
+                            notindexed=verse)''')
+
+
+# True if the database was created with the normalized layout
+def is_normalized(c):
+
+    c.execute('''SELECT count(*) FROM sqlite_master
+                 WHERE type = 'table' AND name = 'latin_passage' ''')
+
+    return c.fetchone()[0] > 0
+
+
+# content hash of a book - covers the book page and what the book's rows
+# and parser take from the collection page (the book's name and number and
+# the collection's title, author and dates), but not the rest of that page,
+# so adding a book to a collection leaves the digests of the others alone
+def book_digest(task):
+
+    with open(task[3], 'rb') as f:
+        page = f.read()
+
+    metadata = json.dumps(task[1:3] + task[4:], ensure_ascii=False)
+
+    return hashlib.sha1(metadata.encode('utf-8') + b'\n' + page).hexdigest()
+
+
+# 'count' blocks spread out between the blocks 'low' and 'high', at most
+# BLOCK_GAP apart - None if they do not fit
+def spread_blocks(count, low, high):
+
+    gap = min(BLOCK_GAP, (high - low) // (count + 1))
+    if gap == 0:
+        return None
+
+    return [low + gap * (i + 1) for i in range(count)]
+
+
+# blocks of the books at the given links of a collection, in book order,
+# given the blocks they were indexed at ('indexed', link -> block) - the
+# longest run of books whose blocks are still in book order keep them, and
+# the other books (new ones, moved ones) are given blocks in the gaps
+# between those. None if the gaps are too small
+def collection_blocks(links, indexed, first):
+
+    # longest increasing run of the indexed blocks within the collection
+    tails, tail_books, previous = [], [], {}
+    for i, link in enumerate(links):
+        block = indexed.get(link)
+        if block is None or not first < block < first + COLLECTION_BLOCKS:
+            continue
+
+        k = bisect.bisect_left(tails, block)
+        previous[i] = tail_books[k - 1] if k > 0 else None
+        if k == len(tails):
+            tails.append(block)
+            tail_books.append(i)
+        else:
+            tails[k] = block
+            tail_books[k] = i
 
-    # create database connection
-    db = sqlite3.connect('latin_library.db')
+    blocks = [None] * len(links)
+    i = tail_books[-1] if tail_books else None
+    while i is not None:
+        blocks[i] = indexed[links[i]]
+        i = previous[i]
+
+    # fill each run of books without a block
+    low, run = first, []
+    for i in range(len(links) + 1):
+        high = first + COLLECTION_BLOCKS if i == len(links) else blocks[i]
+        if high is None:
+            run.append(i)
+            continue
+
+        spread = spread_blocks(len(run), low, high)
+        if spread is None:
+            return None
+        for j, block in zip(run, spread):
+            blocks[j] = block
+
+        low, run = high, []
+
+    return blocks
+
+
+# docid block of each book (see BOOK_DOCIDS) given the per-book tasks of
+# all collections and the blocks the books were indexed at ('indexed',
+# link -> block) - adding, removing or moving a book only gives that book
+# a new block. the books of a collection whose gaps ran out are all given
+# new blocks
+def book_blocks(tasks, indexed):
+
+    blocks = {}
+
+    for collection_num, group in itertools.groupby(tasks,
+                                                   key=lambda task: task[0]):
+        links = [task[3] for task in group]
+        first = collection_num * COLLECTION_BLOCKS
+
+        collection = collection_blocks(links, indexed, first)
+        if collection is None:
+            collection = spread_blocks(len(links), first,
+                                       first + COLLECTION_BLOCKS)
+        if collection is None:
+            raise ValueError('more than ' + str(COLLECTION_BLOCKS - 1) +
+                             ' books in collection ' + str(collection_num))
+
+        blocks.update(zip(links, collection))
+
+    return blocks
+
+
+# docids of the verses of the book at a block (see BOOK_DOCIDS) - or,
+# without a block, None for each verse so they are numbered after the
+# existing rows
+def book_docids(block, count):
+
+    if block is None:
+        return [None] * count
+
+    if count > BOOK_DOCIDS:
+        raise ValueError('more than ' + str(BOOK_DOCIDS) + ' verses in book ' +
+                         'block ' + str(block))
+
+    first = block * BOOK_DOCIDS + 1
+
+    return range(first, first + count)
+
+
+# delete the rows of a book from both tables and insert the given items,
+# numbered from the book's block of docids if one is given (see book_docids)
+def replace_book_rows(c, link, items, normalized=False, block=None):
+
+    if normalized:
+        replace_normalized_book_rows(c, link, items, block)
+        return
+
+    c.execute('''DELETE FROM latin_fts WHERE docid IN
+                 (SELECT rowid FROM latin_text WHERE link = ?)''', [link])
+    c.execute('''DELETE FROM latin_norm_fts WHERE docid IN
+                 (SELECT rowid FROM latin_text WHERE link = ?)''', [link])
+    c.execute('DELETE FROM latin_text WHERE link = ?', [link])
+
+    c.executemany('''INSERT INTO latin_text
+                         (rowid, title, book, language, author, dates,
+                          chapter, verse, passage, link)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                  [[docid] + list(item) for docid, item in
+                   zip(book_docids(block, len(items)), items)])
+    c.execute('''INSERT INTO latin_fts
+                     (docid, passage, link, title, book, chapter, verse)
+                 SELECT rowid, passage, link, title, book, chapter, verse
+                 FROM latin_text WHERE link = ?''', [link])
+    index_normalized(c, c.execute(
+        'SELECT rowid, passage FROM latin_text WHERE link = ?',
+        [link]).fetchall())
+
+
+# normalized layout version of replace_book_rows
+def replace_normalized_book_rows(c, link, items, block=None):
+
+    # the external content index reads the old values of the rows it
+    # removes, so it is updated before the passages are deleted
+    c.execute('''DELETE FROM latin_fts WHERE docid IN
+                 (SELECT p.id FROM latin_passage p
+                  JOIN latin_book b ON b.id = p.book_id
+                  WHERE b.link = ?)''', [link])
+    c.execute('''DELETE FROM latin_norm_fts WHERE docid IN
+                 (SELECT p.id FROM latin_passage p
+                  JOIN latin_book b ON b.id = p.book_id
+                  WHERE b.link = ?)''', [link])
+    c.execute('''DELETE FROM latin_passage WHERE book_id IN
+                 (SELECT id FROM latin_book WHERE link = ?)''', [link])
+
+    # book removed from its collection
+    if len(items) == 0:
+        c.execute('DELETE FROM latin_book WHERE link = ?', [link])
+        return
+
+    # title, book, language, author and dates are the same for every item
+    title, book, language, author, dates = items[0][:5]
+
+    c.execute('''INSERT OR IGNORE INTO latin_collection
+                     (title, language, author, dates)
+                 VALUES (?, ?, ?, ?)''', [title, language, author, dates])
+    c.execute('''SELECT id FROM latin_collection
+                 WHERE title = ? AND language = ? AND author = ?
+                 AND dates = ?''', [title, language, author, dates])
+    collection_id = c.fetchone()[0]
+
+    c.execute('''INSERT OR IGNORE INTO latin_book (link) VALUES (?)''', [link])
+    c.execute('''UPDATE latin_book SET collection_id = ?, book = ?
+                 WHERE link = ?''', [collection_id, book, link])
+    c.execute('SELECT id FROM latin_book WHERE link = ?', [link])
+    book_id = c.fetchone()[0]
+
+    c.executemany('''INSERT INTO latin_passage
+                         (id, book_id, chapter, verse, passage)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  [(docid, book_id, item[5], item[6], item[7])
+                   for docid, item in
+                   zip(book_docids(block, len(items)), items)])
+    c.execute('''INSERT INTO latin_fts
+                     (docid, passage, link, title, book, chapter, verse)
+                 SELECT p.id, p.passage, ?, ?, ?, p.chapter, p.verse
+                 FROM latin_passage p WHERE p.book_id = ?''',
+              [link, title, book, book_id])
+    index_normalized(c, c.execute(
+        'SELECT id, passage FROM latin_passage WHERE book_id = ?',
+        [book_id]).fetchall())
+
+
+# bring the database up to date with the downloaded collections, re-parsing
+# and re-indexing only the books whose pages changed since the last build
+# (creating the database from scratch if it does not exist yet)
+# a new database is created with the normalized layout if 'normalized' is
+# set, an existing database keeps the layout it was created with
+# returns the number of books that were re-parsed
+# with a lemmatizer, the lemma table is rebuilt (see build_lemma_index) if
+# the books or the lemmatizer changed since it was built, otherwise it is
+# kept as it is
+def update_database(processes=1, database=DATABASE, normalized=False,
+                    lemmatizer=None):
+
+    # create database connection - transactions are managed explicitly
+    db = sqlite3.connect(database, isolation_level=None)
     c = db.cursor()
 
-    # create latin_fts table with appropriate attributes
-    c.execute('''CREATE VIRTUAL TABLE latin_fts USING fts4(passage, 
-                                                           link, 
-                                                           title, 
-                                                           book, 
-                                                           chapter, 
-                                                           verse)''')
-    
-    # populate latin_fts table
-    c.execute('''INSERT INTO latin_fts 
-                 SELECT passage, link, title, book, chapter, verse 
-                 FROM latin_text''')
-
-    # commit changes and close db connection
-    db.commit()
+    # an empty database is bulk loaded, an existing one updated in place -
+    # the settings are restored once the update has committed (the journal
+    # mode cannot change inside a transaction)
+    empty = c.execute('SELECT count(*) FROM sqlite_master').fetchone()[0] == 0
+    previous_pragmas = set_pragmas(db, BULK_PRAGMAS if empty
+                                   else UPDATE_PRAGMAS)
+    c.execute('BEGIN')
+
+    # layout of an existing database
+    if not empty:
+        normalized = is_normalized(c)
+
+    # databases built before the normalized spelling index existed
+    c.execute('''SELECT count(*) FROM sqlite_master
+                 WHERE name = 'latin_norm_fts' ''')
+    missing_norm_fts = c.fetchone()[0] == 0
+
+    # databases built before fuzzy searches existed
+    c.execute('''SELECT count(*) FROM sqlite_master
+                 WHERE name = 'latin_trigram' ''')
+    missing_trigrams = c.fetchone()[0] == 0
+
+    create_schema(c, normalized)
+
+    # index the existing passages of such a database
+    if missing_norm_fts:
+        if normalized:
+            rows = c.connection.execute('SELECT id, passage FROM latin_passage')
+        else:
+            rows = c.connection.execute('SELECT rowid, passage FROM latin_text')
+        index_normalized(c, rows)
+
+    # link -> (digest, chapter_in, chapter_out, block) as of the last build
+    manifest = {row[0]: row[1:] for row in
+                c.execute('''SELECT link, digest, chapter_in, chapter_out,
+                                    block
+                             FROM latin_manifest WHERE link != ?''',
+                          [LEMMA_MANIFEST_KEY])}
+
+    # per-book tasks and current content hashes for all collections
+    tasks = []
+    digests = {}
+    for collection_num in range(len(COLLECTION_PARSERS)):
+        for task in book_tasks(collection_num):
+            tasks.append(task)
+            digests[task[3]] = book_digest(task)
+
+    # block of docids of each book, which keeps it in corpus order
+    blocks = book_blocks(tasks, {link: row[3]
+                                 for link, row in manifest.items()})
+
+    # books indexed anywhere but at their block - books no longer linked
+    # from their collection page, books that moved, and books indexed
+    # before books kept their place. their rows are deleted first, so the
+    # books now at their blocks cannot collide with them
+    misplaced = set(
+        link for (link,) in
+        c.execute('SELECT DISTINCT link FROM latin_text').fetchall()
+        if link not in blocks or
+        manifest.get(link, (None,) * 4)[3] != blocks[link])
+
+    for link in misplaced:
+        replace_book_rows(c, link, [], normalized)
+
+    removed = set(manifest) - set(digests)
+    for link in removed:
+        c.execute('DELETE FROM latin_manifest WHERE link = ?', [link])
+
+    # books that are new, whose pages changed or that were misplaced
+    changed = [task for task in tasks
+               if manifest.get(task[3], (None,))[0] != digests[task[3]] or
+               task[3] in misplaced]
+
+    # parse changed books lazily, in a pool if requested
+    if processes == 1:
+        results = ((task[0], parse_book_task(task)) for task in changed)
+    else:
+        results = parse_books_in_pool(changed, processes)
+
+    changed = set(task[3] for task in changed)
+    parsed_count = 0
+    collection_num = None
+
+    # walk all books in order, tracking the chapter carried between books
+    for task in tasks:
+        link = task[3]
+
+        # chapters are only carried over within a collection
+        if task[0] != collection_num:
+            collection_num = task[0]
+            chapter = 'null'
+
+        if link in changed:
+            items, last_chapter = next(results)[1]
+
+        # an unchanged book must still be re-parsed if the chapter carried
+        # into it changed
+        elif manifest[link][1] != chapter:
+            items, last_chapter = parse_book_task(task)
+
+        # unchanged book - its rows are kept as they are
+        else:
+            if manifest[link][2] != CARRIED_CHAPTER:
+                chapter = manifest[link][2]
+            continue
+
+        # fill in carried over chapters and replace the rows of the book
+        for item in items:
+            if item[5] == CARRIED_CHAPTER:
+                item[5] = chapter
+
+        replace_book_rows(c, link, items, normalized, blocks[link])
+        c.execute('''INSERT OR REPLACE INTO latin_manifest
+                         (link, digest, chapter_in, chapter_out, block)
+                     VALUES (?, ?, ?, ?, ?)''',
+                  [link, digests[link], chapter, last_chapter, blocks[link]])
+        parsed_count += 1
+
+        if last_chapter != CARRIED_CHAPTER:
+            chapter = last_chapter
+
+    # precomputed usage counts, vocabulary and lemmas, and let readers know
+    # the contents changed
+    modified = parsed_count > 0 or len(removed | misplaced) > 0 or \
+        missing_norm_fts
+    if modified:
+        build_usage_matrix(c)
+
+    if modified or missing_trigrams:
+        build_trigram_index(c)
+
+    # the lemma table is rebuilt for new tokens or a changed lemmatizer - a
+    # lemmatizer without a 'digest' (see lemma.LookupLemmatizer) is taken to
+    # have changed
+    lemmas_changed = False
+    if lemmatizer is not None:
+        digest = getattr(lemmatizer, 'digest', None)
+        c.execute('SELECT digest FROM latin_manifest WHERE link = ?',
+                  [LEMMA_MANIFEST_KEY])
+        lemmas_changed = modified or digest is None or \
+            c.fetchone() != (digest,)
+
+    # the table kept without a lemmatizer lacks the new tokens, so it is
+    # rebuilt by the next update with one
+    elif modified:
+        c.execute('DELETE FROM latin_manifest WHERE link = ?',
+                  [LEMMA_MANIFEST_KEY])
+
+    if lemmas_changed:
+        build_lemma_index(c, lemmatizer)
+        c.execute('''INSERT OR REPLACE INTO latin_manifest (link, digest)
+                     VALUES (?, ?)''', [LEMMA_MANIFEST_KEY, digest])
+
+    if modified or missing_trigrams or lemmas_changed:
+        next_generation(c)
+
+    # commit changes, restore settings and close db connection
+    c.execute('COMMIT')
+    set_pragmas(db, previous_pragmas)
     db.close()
 
+    return parsed_count
+
 
-def main():
+def main(processes=1, rebuild=False, normalized=False, lemmas=None,
+         snapshot=None):
+
+    # lemma list, if one is given or found in the working directory
+    lemmatizer = None
+    if lemmas is None and os.path.exists(LEMMA_FILE):
+        lemmas = LEMMA_FILE
+    if lemmas is not None:
+        lemmatizer = LookupLemmatizer.from_file(lemmas)
 
     # download all collections
-    for extension in URL_EXTENSIONS:
-        download_collection(extension)
-    
-    # parse the collections into 'items' corresponding to database rows
-    items = parse_collections()
-
-    # create and populate a database with the parsed items
-    populate_database(items)
-
-    # create and populate an fts table for use in phase 2
-    create_fts_table()
-    
+    download_collections(URL_EXTENSIONS)
+
+    # start over from an empty database
+    if rebuild:
+        clear_database()
+
+    # parse the collections into 'items' corresponding to database rows and
+    # (re)index the books whose pages changed since the last build
+    parsed_count = update_database(processes, normalized=normalized,
+                                   lemmatizer=lemmatizer)
+    print('Updated ' + str(parsed_count) + ' books')
+
+    # compact copy of the passages for regular expression scans
+    if snapshot is not None:
+        verse_count = write_snapshot(DATABASE, snapshot)
+        print('Wrote ' + str(verse_count) + ' verses to ' + snapshot)
+
 if __name__ == "__main__":
-    main()
+
+    parser = argparse.ArgumentParser()
+
+    # number of worker processes used to parse book pages
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='parse book pages in a pool of this many '
+                             'processes (0 = one per cpu)')
+
+    # ignore the existing database and rebuild it from scratch
+    parser.add_argument('--rebuild', action='store_true',
+                        help='rebuild the database from scratch')
+
+    # layout used when the database is created
+    parser.add_argument('--normalized', action='store_true',
+                        help='store collections, books and passages in '
+                             'separate tables with an external content '
+                             'fts index')
+
+    # lemma list used to build the lemma table
+    parser.add_argument('--lemmas', default=None,
+                        help='lemma list file, one form followed by its '
+                             'lemma(s) per line (default: ' + LEMMA_FILE +
+                             ' if present)')
+
+    # snapshot of the passages written after the update
+    parser.add_argument('--snapshot', nargs='?', const=SNAPSHOT, default=None,
+                        help='also write a memory-mapped snapshot of the '
+                             'passages for regular expression scans '
+                             '(default: ' + SNAPSHOT + ')')
+    args = parser.parse_args()
+
+    main(args.processes or None, args.rebuild, args.normalized, args.lemmas,
+         args.snapshot)
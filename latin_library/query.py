@@ -0,0 +1,922 @@
+#!/usr/bin/python3
+
+import os
+import re
+import math
+import array
+import sqlite3
+import threading
+import collections
+import urllib.parse
+from latin_library.vocabulary import Vocabulary, COMPLETIONS
+from latin_library.text import single_token, fold, normalize_search_term, \
+    trigrams, edit_distance, QUERY_OPERATORS, NEAR_OPERATOR, TOKEN_PATTERN
+
+# sqlite database created by parse_data
+DATABASE = 'latin_library.db'
+
+# page cache (in KiB, as a negative cache_size) and memory map size of
+# each search connection
+CACHE_SIZE_KB = 65536
+MMAP_SIZE = 256 * 2 ** 20
+
+# number of search results fetched at a time
+PAGE_SIZE = 20
+
+# number of results returned by a ranked search
+TOP_K = 10
+
+# maximum number of result rows held by the query result cache
+CACHE_ROWS = 100000
+
+# characters of context shown on each side of a concordance match
+CONTEXT_CHARS = 40
+
+# separates the verses of concordance context spanning several verses
+VERSE_SEPARATOR = ' / '
+
+# runs of whitespace, shown as a single space in concordance context
+WHITESPACE = re.compile(r'\s+')
+
+# a citation - a book name and a verse number, separated by a space, with
+# an optional chapter before the verse ('Aeneid IV 100', 'Aeneid 4.100',
+# 'Variae I Caput 1.2'). see Corpus.cite
+CITATION = re.compile(r'(.+?)\s+(?:(\S+)\.)?(\d+)')
+
+# roman numerals of the values making up a number, largest first
+ROMAN_NUMERALS = [(1000, 'm'), (900, 'cm'), (500, 'd'), (400, 'cd'),
+                  (100, 'c'), (90, 'xc'), (50, 'l'), (40, 'xl'), (10, 'x'),
+                  (9, 'ix'), (5, 'v'), (4, 'iv'), (1, 'i')]
+
+# vocabulary words a fuzzy search matches for each word of a search term
+FUZZY_TERMS = 5
+
+# vocabulary words sharing the most trigrams with a word whose edit
+# distance to it is computed
+FUZZY_CANDIDATES = 200
+
+# bm25 term frequency saturation and length normalization parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# docids of the verses containing any form of a lemma (bound twice) - the
+# forms listed for it in latin_lemma, plus the lemma itself, are each
+# matched against the normalized spelling index in a single join
+LEMMA_DOCIDS = '''SELECT DISTINCT latin_norm_fts.docid
+                  FROM (SELECT token FROM latin_lemma WHERE lemma = ?
+                        UNION SELECT ?) AS forms
+                  JOIN latin_norm_fts
+                  ON latin_norm_fts.passage MATCH forms.token'''
+
+# names of the columns of a result row, as selected from latin_fts
+RESULT_FIELDS = ('passage', 'link', 'title', 'book', 'chapter', 'verse')
+
+# a matching verse and its location - 'title' is the collection and
+# 'chapter' is 'null' for verses outside any chapter
+Hit = collections.namedtuple('Hit', RESULT_FIELDS)
+
+# a matching verse of a ranked search along with its bm25 score
+RankedHit = collections.namedtuple('RankedHit', RESULT_FIELDS + ('score',))
+
+# a keyword-in-context line of a concordance - the matching text of a
+# verse with the context before and after it
+KwicLine = collections.namedtuple('KwicLine', ['left', 'match', 'right',
+                                               'book', 'chapter', 'verse',
+                                               'link'])
+
+# number of matching verses in a book, and the collection of the book
+BookCount = collections.namedtuple('BookCount', ['book', 'count', 'title'])
+
+
+# a Hit as a dict of RESULT_FIELDS - the 'null' chapter of verses
+# outside any chapter becomes None
+def result_dict(result):
+
+    fields = dict(zip(RESULT_FIELDS, result))
+    if fields['chapter'] == 'null':
+        fields['chapter'] = None
+
+    return fields
+
+
+# (start, end) byte ranges of the matches in a utf-8 passage, from the
+# result of fts offsets() - the tokens of a phrase (or of adjacent terms)
+# are joined into a single match
+def match_spans(text, offsets):
+
+    values = [int(value) for value in offsets.split()]
+
+    # a single matching token
+    if len(values) == 4:
+        return [(values[2], values[2] + values[3])] if values[0] == 0 else []
+
+    # (column, term, byte offset, size) of each matching token - only those
+    # in the passage column count
+    tokens = sorted((values[i + 2], values[i + 2] + values[i + 3])
+                    for i in range(0, len(values), 4) if values[i] == 0)
+
+    spans = []
+    for start, end in tokens:
+
+        # only spaces and punctuation between this token and the last
+        if spans and TOKEN_PATTERN.search(
+                text[spans[-1][1]:start].decode('utf-8')) is None:
+            spans[-1] = (spans[-1][0], max(end, spans[-1][1]))
+        else:
+            spans.append((start, end))
+
+    return spans
+
+
+# a number written in (lowercase) roman numerals
+def roman(number):
+
+    numerals = ''
+    for value, numeral in ROMAN_NUMERALS:
+        count, number = divmod(number, value)
+        numerals += numeral * count
+
+    return numerals
+
+
+# the ways a book or chapter name may be written in a citation, lowercased -
+# as it is, and with a trailing number in roman numerals ('Aeneid 4' for
+# 'Aeneid IV') and the other way around
+def name_keys(name):
+
+    words = name.lower().split()
+    keys = [' '.join(words)]
+
+    if words and words[-1].isdigit() and int(words[-1]) > 0:
+        keys.append(' '.join(words[:-1] + [roman(int(words[-1]))]))
+
+    return keys
+
+
+# the largest edit distance at which a vocabulary word is taken for a
+# misspelling of a word - one edit for short words, two for longer ones
+def fuzzy_distance(word):
+    return 1 if len(word) <= 5 else 2
+
+
+# the name of a book or chapter a citation gives as 'words', from a dict
+# of name_keys -> names, or None if there is no such name
+def lookup_name(names, words):
+
+    for key in name_keys(' '.join(words)):
+        if key in names:
+            return names[key]
+
+    return None
+
+
+# bm25 relevance of the passage of a matching row, given the blob returned
+# by matchinfo(latin_fts, 'pcnalx') - registered as an sql function on
+# every search connection so rows can be ranked inside sqlite
+def bm25(matchinfo):
+
+    info = array.array('I', matchinfo)
+
+    # number of phrases, columns and rows in the table
+    phrases, columns, rows = info[0], info[1], info[2]
+
+    # average passage length and length of this passage (in tokens)
+    avg_length = max(info[3], 1)
+    length = info[3 + columns]
+
+    score = 0.0
+
+    for i in range(phrases):
+
+        # hits in this passage and number of passages with a hit
+        x = 3 + 2 * columns + 3 * columns * i
+        hits, docs = info[x], info[x + 2]
+
+        if hits > 0:
+            idf = math.log(1 + (rows - docs + 0.5) / (docs + 0.5))
+            score += idf * (hits * (BM25_K1 + 1) /
+                            (hits + BM25_K1 * (1 - BM25_B + BM25_B *
+                                               length / avg_length)))
+
+    return score
+
+
+# hands out long-lived read-only connections to the database - one per
+# thread, opened on first use and reused for every query in that thread
+class ConnectionManager:
+
+    def __init__(self, database=DATABASE, cache_size_kb=CACHE_SIZE_KB,
+                 mmap_size=MMAP_SIZE):
+
+        self.database = database
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+
+        # connection of each thread, and all connections for closing
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    # open a new read-only connection with the search settings
+    def open(self):
+
+        uri = ('file:' + urllib.parse.quote(os.path.abspath(self.database))
+               + '?mode=ro')
+
+        # only used by the thread that opened it, but may be closed by another
+        db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        db.execute('PRAGMA cache_size = -' + str(self.cache_size_kb))
+        db.execute('PRAGMA mmap_size = ' + str(self.mmap_size))
+
+        # ranking function used by ranked searches
+        db.create_function('bm25', 1, bm25, deterministic=True)
+
+        return db
+
+    # connection of the calling thread
+    def connection(self):
+
+        # connections are not shared with forked processes
+        if os.getpid() != self.pid:
+            self.local = threading.local()
+            self.connections = []
+            self.pid = os.getpid()
+
+        db = getattr(self.local, 'db', None)
+
+        if db is None:
+            db = self.open()
+            self.local.db = db
+            with self.lock:
+                self.connections.append(db)
+
+        return db
+
+    # close the connections of all threads
+    def close(self):
+
+        with self.lock:
+            for db in self.connections:
+                db.close()
+            self.connections = []
+
+        self.local = threading.local()
+
+
+# normalize a search term for use as a cache key - whitespace is collapsed
+# and ascii terms are lowercased (the fts tokenizer folds ascii case), so
+# trivially different spellings of a query share one entry
+def normalize_query(search_term):
+
+    tokens = []
+    for token in search_term.split():
+        if token not in QUERY_OPERATORS and token.isascii() and \
+           NEAR_OPERATOR.fullmatch(token) is None:
+            token = token.lower()
+        tokens.append(token)
+
+    return ' '.join(tokens)
+
+
+# least recently used cache of query results, bounded by the total number of
+# result rows it holds - entries belong to one build generation of the
+# database and the whole cache is dropped when the generation changes
+class ResultCache:
+
+    def __init__(self, max_rows=CACHE_ROWS):
+
+        self.max_rows = max_rows
+        self.entries = collections.OrderedDict()
+        self.rows = 0
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # number of rows an entry counts for
+    def size(self, value):
+
+        if isinstance(value, tuple):
+            return sum(self.size(item) for item in value)
+
+        if isinstance(value, (list, dict)):
+            return len(value)
+
+        return 1
+
+    # drop every entry
+    def clear(self):
+
+        with self.lock:
+            self.entries.clear()
+            self.rows = 0
+
+    # cached value for 'key' in the given build generation, computing and
+    # storing it with 'compute' on a miss
+    def lookup(self, key, generation, compute):
+
+        with self.lock:
+
+            # database was rebuilt since the entries were stored
+            if generation != self.generation:
+                self.entries.clear()
+                self.rows = 0
+                self.generation = generation
+
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+
+            self.misses += 1
+
+        value = compute()
+
+        with self.lock:
+
+            # a result larger than the whole cache is not stored
+            if generation == self.generation and key not in self.entries and \
+               self.size(value) <= self.max_rows:
+
+                self.entries[key] = value
+                self.rows += self.size(value)
+
+                # evict least recently used entries
+                while self.rows > self.max_rows:
+                    old_key, old_value = self.entries.popitem(last=False)
+                    self.rows -= self.size(old_value)
+
+        return value
+
+    # (hits, misses, entries, rows) counters
+    def info(self):
+        return self.hits, self.misses, len(self.entries), self.rows
+
+
+# the lemma table key of a lemma entered by the user
+def lemma_key(lemma):
+    return fold(lemma.strip())
+
+
+# queries over the database built by parse_data - owns the read-only
+# connections (one per thread) and the result cache, and returns results
+# as Hit / RankedHit / BookCount records. safe to share between threads
+class Corpus:
+
+    def __init__(self, database=DATABASE, cache_size_kb=CACHE_SIZE_KB,
+                 mmap_size=MMAP_SIZE, cache_rows=CACHE_ROWS):
+
+        self.connections = ConnectionManager(database, cache_size_kb,
+                                             mmap_size)
+        self.cache = ResultCache(cache_rows)
+
+        # (build generation, Vocabulary) of the completions, loaded on
+        # first use
+        self.vocab = None
+
+    # read-only connection of the calling thread
+    def connection(self):
+        return self.connections.connection()
+
+    # build generation of the database - incremented by parse_data whenever
+    # the database contents change
+    def generation(self):
+
+        c = self.connection().execute('PRAGMA user_version')
+
+        return c.fetchone()[0]
+
+    # cached result of a query - 'mode' and 'params' distinguish the kinds of
+    # results kept for the same search term
+    def cached(self, mode, search_term, params, compute):
+
+        key = (mode, normalize_query(search_term)) + tuple(params)
+
+        return self.cache.lookup(key, self.generation(), compute)
+
+    # whether the database has the normalized spelling index built by
+    # parse_data (databases built before it existed only have latin_fts) -
+    # only checked when a query result is not cached
+    def has_normalized_index(self):
+
+        c = self.connection().cursor()
+        c.execute('''SELECT count(*) FROM sqlite_master
+                     WHERE name = 'latin_norm_fts' ''')
+
+        return c.fetchone()[0] > 0
+
+    # where to match a search term - returns the tables to select from, the
+    # fts table the term is matched against and the term to match. with the
+    # normalized spelling index, the term is normalized and matched against
+    # it and the matching latin_fts rows (same docid) are returned
+    def match_source(self, search_term):
+
+        if self.has_normalized_index():
+            return ('latin_norm_fts JOIN latin_fts '
+                    'ON latin_fts.docid = latin_norm_fts.docid',
+                    'latin_norm_fts', normalize_search_term(search_term))
+
+        return 'latin_fts', 'latin_fts', search_term
+
+    # number of verses matching a search term - run separately from the row
+    # fetch, so no passage text is read to obtain it. with 'lemma', the
+    # verses containing any form of the lemma are counted
+    def count(self, search_term, lemma=False):
+
+        def count():
+            c = self.connection().cursor()
+
+            if lemma:
+                key = lemma_key(search_term)
+                c.execute('SELECT COUNT(*) FROM (' + LEMMA_DOCIDS + ')',
+                          [key, key])
+
+            else:
+                source, fts, term = self.match_source(search_term)
+                c.execute('SELECT COUNT(*) FROM {0} WHERE {0}.passage MATCH ?'
+                          .format(fts), [term])
+
+            return c.fetchone()[0]
+
+        return self.cached('lemma count' if lemma else 'count', search_term,
+                           [], count)
+
+    # one page of search results following the verse with docid 'after'
+    # (keyset pagination - later pages never re-read earlier ones)
+    # returns a list of Hits and the docid to pass as 'after' for the next
+    # page (None after the last page). with 'lemma', verses containing any
+    # form of the lemma are returned
+    def page(self, search_term, page_size=PAGE_SIZE, after=0, lemma=False):
+
+        def page():
+            c = self.connection().cursor()
+
+            if lemma:
+                key = lemma_key(search_term)
+                c.execute('''SELECT docid, * FROM latin_fts
+                             WHERE docid IN (''' + LEMMA_DOCIDS + ''')
+                             AND docid > ?
+                             ORDER BY docid LIMIT ?''',
+                          [key, key, after, page_size])
+
+            else:
+                source, fts, term = self.match_source(search_term)
+                c.execute('''SELECT {1}.docid, latin_fts.* FROM {0}
+                             WHERE {1}.passage MATCH ? AND {1}.docid > ?
+                             ORDER BY {1}.docid LIMIT ?'''.format(source, fts),
+                          [term, after, page_size])
+
+            rows = c.fetchall()
+            hits = [Hit._make(row[1:]) for row in rows]
+
+            # short page - no more results
+            if len(rows) < page_size:
+                return hits, None
+
+            return hits, rows[-1][0]
+
+        return self.cached('lemma page' if lemma else 'page', search_term,
+                           [page_size, after], page)
+
+    # lazily iterate over all Hits for a search term, fetching them from the
+    # database one page at a time
+    def search(self, search_term, page_size=PAGE_SIZE, lemma=False):
+
+        after = 0
+
+        while after is not None:
+            hits, after = self.page(search_term, page_size, after, lemma)
+            yield from hits
+
+    # the k most relevant verses for a search term as RankedHits, ranked by
+    # bm25 inside sqlite - only the best k rows are kept while the matches
+    # are scanned
+    def ranked(self, search_term, k=TOP_K):
+
+        def ranked():
+            source, fts, term = self.match_source(search_term)
+
+            c = self.connection().cursor()
+            c.execute('''SELECT latin_fts.*,
+                                bm25(matchinfo({1}, 'pcnalx')) AS score
+                         FROM {0} WHERE {1}.passage MATCH ?
+                         ORDER BY score DESC LIMIT ?'''.format(source, fts),
+                      [term, k])
+
+            return [RankedHit._make(row) for row in c.fetchall()]
+
+        return self.cached('ranked', search_term, [k], ranked)
+
+    # KwicLines of a search term, one per match in each matching verse,
+    # with up to 'width' characters of context on each side - with 'span',
+    # the context runs on into the 'span' verses before and after the verse
+    # in the same book. matches are located by the fts offsets() of
+    # latin_fts, which point into the text as it is displayed, so unlike
+    # search the original spelling is matched (ascii case aside). streamed
+    # from a single query, without tokenizing passages in python
+    def concordance(self, search_term, width=CONTEXT_CHARS, span=0):
+
+        # neighbouring verses, joined into one string each
+        neighbours = ''
+        params = [search_term]
+        if span > 0:
+            neighbours = ''',
+                (SELECT group_concat(passage, ?) FROM
+                    (SELECT passage FROM latin_fts AS n
+                     WHERE n.docid BETWEEN latin_fts.docid - ?
+                                       AND latin_fts.docid - 1
+                     AND n.link = latin_fts.link ORDER BY n.docid)),
+                (SELECT group_concat(passage, ?) FROM
+                    (SELECT passage FROM latin_fts AS n
+                     WHERE n.docid BETWEEN latin_fts.docid + 1
+                                       AND latin_fts.docid + ?
+                     AND n.link = latin_fts.link ORDER BY n.docid))'''
+            params = [VERSE_SEPARATOR, span, VERSE_SEPARATOR, span,
+                      search_term]
+
+        c = self.connection().cursor()
+        c.execute('''SELECT passage, book, chapter, verse, link,
+                            offsets(latin_fts){}
+                     FROM latin_fts WHERE latin_fts.passage MATCH ?
+                     ORDER BY docid'''.format(neighbours), params)
+
+        for row in c:
+            passage, location, offsets = row[0], row[1:5], row[5]
+            before = after = None
+            if span > 0:
+                before, after = row[6], row[7]
+
+            # offsets are in bytes of the utf-8 passage
+            text = passage.encode('utf-8')
+
+            for start, end in match_spans(text, offsets):
+
+                # only a window of bytes either side is decoded - enough for
+                # 'width' characters once runs of whitespace are collapsed
+                # (a character cut at the far edge of a window is dropped)
+                window = 16 * width
+                left = text[max(0, start - window):start].decode('utf-8',
+                                                                 'ignore')
+                right = text[end:end + window].decode('utf-8', 'ignore')
+                if before is not None:
+                    left = before + VERSE_SEPARATOR + left
+                if after is not None:
+                    right = right + VERSE_SEPARATOR + after
+
+                left = WHITESPACE.sub(' ', left[-4 * width:])[-width:]
+                right = WHITESPACE.sub(' ', right[:4 * width])[:width]
+
+                yield KwicLine(left, text[start:end].decode('utf-8'), right,
+                               *location)
+
+    # whether the database was created with the normalized layout (see
+    # parse_data.create_normalized_schema)
+    def is_normalized(self):
+
+        c = self.connection().cursor()
+        c.execute('''SELECT count(*) FROM sqlite_master
+                     WHERE type = 'table' AND name = 'latin_passage' ''')
+
+        return c.fetchone()[0] > 0
+
+    # (book, link) pairs of the books of the corpus by name_keys of their
+    # names, alone and preceded by their collection title - book names
+    # such as 'Liber I' are shared by many collections
+    def books(self):
+
+        def books():
+            c = self.connection().cursor()
+            if self.is_normalized():
+                c.execute('''SELECT c.title, b.book, b.link
+                             FROM latin_book b
+                             JOIN latin_collection c ON c.id = b.collection_id
+                             ORDER BY b.id''')
+            else:
+                c.execute('''SELECT title, book, link FROM latin_text
+                             WHERE rowid IN (SELECT MIN(rowid) FROM latin_text
+                                             GROUP BY link)
+                             ORDER BY rowid''')
+
+            names = {}
+            for title, book, link in c.fetchall():
+                for key in name_keys(book) + name_keys(title + ' ' + book):
+                    if (book, link) not in names.setdefault(key, []):
+                        names[key].append((book, link))
+
+            return names
+
+        return self.cached('books', '', [], books)
+
+    # chapter names of a book by name_keys - chapters are also known by
+    # their last word ('Caput 1' as '1')
+    def chapters(self, book):
+
+        def chapters():
+            c = self.connection().cursor()
+            c.execute('SELECT DISTINCT chapter FROM latin_text WHERE book = ?',
+                      [book])
+
+            names = {}
+            for chapter, in c.fetchall():
+                last_word = ' '.join(chapter.split()[-1:])
+                for key in name_keys(chapter) + name_keys(last_word):
+                    names.setdefault(key, chapter)
+
+            return names
+
+        # the book is matched exactly, so it is not normalized for the key
+        return self.cached('chapters', '', [book], chapters)
+
+    # Hits of the verses numbered 'first' to 'last' of a book chapter
+    # ('null' for verses outside any chapter), in order - a single range
+    # scan of the citation index. with a 'link', only the verses of the
+    # book at that link (of those sharing its name) are returned
+    def verses(self, book, chapter, first, last, link=None):
+
+        def verses():
+            c = self.connection().cursor()
+            c.execute('''SELECT passage, link, title, book, chapter, verse
+                         FROM latin_text
+                         WHERE book = ? AND chapter = ?
+                         AND verse BETWEEN ? AND ?
+                         AND (? IS NULL OR link = ?)
+                         ORDER BY verse''',
+                      [book, chapter, first, last, link, link])
+
+            return [Hit._make(row) for row in c.fetchall()]
+
+        return self.cached('verses', '', [book, chapter, first, last, link],
+                           verses)
+
+    # Hits of the verses within 'context' verses of a hit (in its chapter),
+    # the hit included
+    def around(self, hit, context):
+        return self.verses(hit.book, hit.chapter, hit.verse - context,
+                           hit.verse + context, hit.link)
+
+    # Hits of the verse a citation refers to, along with 'context' verses
+    # either side - an empty list if there is no such verse. book and
+    # chapter names are matched ignoring case, and a number ending one may
+    # be given in arabic numerals, so 'aeneid 4.100' finds verse 100 of
+    # 'Aeneid IV' (or of chapter 4 of 'Aeneid'). a book name shared by
+    # several collections can be preceded by the collection title
+    # ('Vergil Aeneid IV 100'), otherwise the verse is looked up in each
+    def cite(self, reference, context=0):
+
+        m = CITATION.fullmatch(reference.strip())
+        if m is None:
+            raise ValueError('not a citation: ' + reference)
+
+        words = m.group(1).split()
+        number = [] if m.group(2) is None else [m.group(2)]
+        verse = int(m.group(3))
+
+        # (book, chapter) names the citation may stand for - the number
+        # before the verse may end the book name, otherwise any trailing
+        # words of the name belong to the chapter
+        candidates = []
+        if number:
+            candidates.append((words + number, []))
+        for i in range(len(words), 0, -1):
+            candidates.append((words[:i], words[i:] + number))
+
+        books = self.books()
+        for book_words, chapter_words in candidates:
+
+            hits = []
+            for book, link in lookup_name(books, book_words) or []:
+
+                if chapter_words:
+                    chapter = lookup_name(self.chapters(book), chapter_words)
+                    if chapter is None:
+                        continue
+                else:
+                    chapter = 'null'
+
+                verses = self.verses(book, chapter, verse - context,
+                                     verse + context, link)
+                if any(hit.verse == verse for hit in verses):
+                    hits.extend(verses)
+
+            if hits:
+                return hits
+
+        return []
+
+    # the vocabulary words closest to a word, as (word, edit distance,
+    # number of verses) - at most 'limit' words within 'max_distance' edits
+    # (see fuzzy_distance), closest and then most common first. candidates
+    # are the words of about the same length sharing the most trigrams
+    # with it, found in the trigram index built by parse_data (databases
+    # built before it existed have none, so nothing is found)
+    def similar_terms(self, word, max_distance=None, limit=FUZZY_TERMS):
+
+        word = fold(word)
+        if max_distance is None:
+            max_distance = fuzzy_distance(word)
+
+        def similar():
+            grams = trigrams(word)
+
+            # an edit changes at most 4 of the trigrams of a word (3, or 4
+            # for a swap of adjacent characters)
+            c = self.connection().cursor()
+            try:
+                c.execute('''SELECT v.term, v.documents
+                             FROM (SELECT term_id, COUNT(*) AS shared
+                                   FROM latin_trigram
+                                   WHERE trigram IN ({})
+                                   AND length BETWEEN ? AND ?
+                                   GROUP BY term_id HAVING shared >= ?
+                                   ORDER BY shared DESC LIMIT ?) AS best
+                             JOIN latin_vocab v ON v.id = best.term_id'''.format(
+                                 ', '.join('?' * len(grams))),
+                          grams + [len(word) - max_distance,
+                                   len(word) + max_distance,
+                                   max(1, len(grams) - 4 * max_distance),
+                                   FUZZY_CANDIDATES])
+            except sqlite3.OperationalError:
+                return []
+
+            terms = []
+            for term, documents in c.fetchall():
+                distance = edit_distance(word, term, max_distance)
+                if distance <= max_distance:
+                    terms.append((distance, -documents, term))
+
+            return [(term, distance, -documents)
+                    for distance, documents, term in sorted(terms)[:limit]]
+
+        return self.cached('similar', word, [max_distance, limit], similar)
+
+    # the vocabulary of the corpus, loaded into memory once per build
+    # generation (see vocabulary.py)
+    def vocabulary(self):
+
+        generation = self.generation()
+
+        vocab = self.vocab
+        if vocab is None or vocab[0] != generation:
+            vocab = (generation, Vocabulary.from_connection(self.connection()))
+            self.vocab = vocab
+
+        return vocab[1]
+
+    # the vocabulary words beginning with a prefix as (word, number of
+    # verses), most common first - words are spelled as in the normalized
+    # index, so they can be searched for as they are
+    def complete(self, prefix, limit=COMPLETIONS):
+        return self.vocabulary().complete(prefix, limit)
+
+    # whether the fts query syntax of the connections is the enhanced one,
+    # where parentheses group terms and implicit AND binds tighter than OR
+    def enhanced_query_syntax(self):
+
+        def enhanced():
+            c = self.connection().cursor()
+            c.execute('PRAGMA compile_options')
+
+            return any(row[0] == 'ENABLE_FTS3_PARENTHESIS'
+                       for row in c.fetchall())
+
+        return self.cached('query syntax', '', [], enhanced)
+
+    # search term of a fuzzy search - each word of 'search_term' is
+    # replaced by the vocabulary words closest to it (see similar_terms),
+    # any of which may match, so all of them are found by a single MATCH.
+    # the rest of the query syntax is ignored. returns None if there is a
+    # word with no close vocabulary word, as nothing can match then
+    def fuzzy_query(self, search_term):
+
+        groups = []
+        words = [word for word in TOKEN_PATTERN.findall(search_term)
+                 if word not in QUERY_OPERATORS]
+
+        for word in words:
+            terms = [term for term, distance, documents
+                     in self.similar_terms(word)]
+            if len(terms) == 0:
+                return None
+
+            group = ' OR '.join(terms)
+            if len(terms) > 1 and len(words) > 1 and \
+               self.enhanced_query_syntax():
+                group = '(' + group + ')'
+            groups.append(group)
+
+        if len(groups) == 0:
+            return None
+
+        return ' '.join(groups)
+
+    # BookCounts of a search term from the fts index
+    def fts_usage(self, search_term):
+
+        source, fts, term = self.match_source(search_term)
+
+        c = self.connection().cursor()
+        c.execute('''SELECT latin_fts.book, COUNT(*), latin_fts.title
+                     FROM {0}
+                     WHERE {1}.passage MATCH ?
+                     GROUP BY latin_fts.book'''.format(source, fts), [term])
+
+        return [BookCount._make(row) for row in c.fetchall()]
+
+    # book names and titles of the columns of the usage matrix, by id
+    def usage_books(self):
+
+        def books():
+            c = self.connection().cursor()
+            c.execute('SELECT id, book, title FROM latin_usage_book')
+
+            return {row[0]: row[1:] for row in c.fetchall()}
+
+        return self.cached('usage books', '', [], books)
+
+    # BookCounts of a search term from the usage matrix precomputed by
+    # parse_data - one primary key lookup. returns None if the search term
+    # is not a single plain term or the database has no usage matrix
+    def matrix_usage(self, search_term):
+
+        term = single_token(search_term)
+        if term is None:
+            return None
+
+        # the matrix counts the tokens of the normalized index when there
+        # is one
+        if self.has_normalized_index():
+            term = fold(term)
+
+        c = self.connection().cursor()
+        try:
+            c.execute('SELECT counts FROM latin_usage WHERE term = ?', [term])
+        except sqlite3.OperationalError:
+            return None
+
+        row = c.fetchone()
+        if row is None:
+            return []
+
+        # (book id, count) pairs
+        counts = array.array('I', row[0])
+        books = self.usage_books()
+
+        return sorted(BookCount(books[counts[i]][0], counts[i + 1],
+                                books[counts[i]][1])
+                      for i in range(0, len(counts), 2))
+
+    # BookCounts of the verses containing any form of a lemma
+    def lemma_usage(self, lemma):
+
+        key = lemma_key(lemma)
+
+        c = self.connection().cursor()
+        c.execute('''SELECT book, COUNT(*), title
+                     FROM latin_fts
+                     WHERE docid IN (''' + LEMMA_DOCIDS + ''')
+                     GROUP BY book''', [key, key])
+
+        return [BookCount._make(row) for row in c.fetchall()]
+
+    # number of matching verses in each book, as BookCounts - single terms
+    # are served from the usage matrix, anything else (phrases,
+    # operators...) from the fts index. with 'lemma', verses containing any
+    # form of the lemma are counted
+    def usage(self, search_term, lemma=False):
+
+        def usage():
+            if lemma:
+                return self.lemma_usage(search_term)
+
+            results = self.matrix_usage(search_term)
+            if results is None:
+                results = self.fts_usage(search_term)
+
+            return results
+
+        return self.cached('lemma usage' if lemma else 'usage', search_term,
+                           [], usage)
+
+    # number of matching verses in each book, as a dict of book -> count
+    def usage_map(self, search_term, lemma=False):
+        return {book: count
+                for book, count, title in self.usage(search_term, lemma)}
+
+    # collection titles in the order of the collection list - each
+    # collection has its own range of docids (see parse_data.BOOK_DOCIDS),
+    # so the order does not change when books are re-indexed
+    def collections(self):
+
+        def titles():
+            c = self.connection().cursor()
+            c.execute('''SELECT title FROM latin_fts
+                         GROUP BY title ORDER BY MIN(docid)''')
+
+            return [row[0] for row in c.fetchall()]
+
+        return self.cached('collections', '', [], titles)
+
+    # close the connections of all threads
+    def close(self):
+        self.connections.close()
@@ -1,12 +1,19 @@
 #!/usr/bin/python3
 
-import subprocess
-import sqlite3
+import io
+import os
+import re
+import sys
 import json
-import numpy as np
-from matplotlib.lines import Line2D
-from matplotlib import pyplot as plt
-from matplotlib import patches as mpatches
+import argparse
+import sqlite3
+import itertools
+from latin_library.query import Corpus, PAGE_SIZE, TOP_K, CONTEXT_CHARS, \
+    CITATION, result_dict
+
+# numpy and matplotlib take hundreds of milliseconds to import and are only
+# needed for usage charts, so they are imported by the chart functions when
+# a chart is first drawn rather than here
 
 # prompt to display to user during input loop
 input_prompt = 'Enter the corresponding number to choose an action:' + '\n'
@@ -14,170 +21,329 @@ input_prompt += '1. Latin term search' + '\n'
 input_prompt += '2. English term search' + '\n' 
 input_prompt += '3. Usage chart - Latin term' + '\n'
 input_prompt += '4. Usage chart - English term' + '\n'
-input_prompt += '5. Quit' + '\n\n'
+input_prompt += '5. Ranked Latin term search' + '\n'
+input_prompt += '6. Latin lemma search' + '\n'
+input_prompt += '7. Usage chart - Latin lemma' + '\n'
+input_prompt += '8. Latin concordance (keyword in context)' + '\n'
+input_prompt += '9. Citation lookup' + '\n'
+input_prompt += '10. Fuzzy Latin term search (tolerates misspellings)' + '\n'
+input_prompt += '11. Quit' + '\n\n'
 input_prompt += '>> '
 
+# menu option that ends the input loop
+quit_option = '11'
+
+# kinds of query run by batch mode
+BATCH_MODES = ('search', 'ranked', 'count', 'usage', 'concordance')
+
+# english queries of a batch translated together - the batch is read and
+# answered this many queries at a time
+BATCH_WINDOW = 64
+
+# verses of context on each side of a match in menu concordances
+CONCORDANCE_SPAN = 1
+
+# verses shown on each side of a verse looked up by citation
+CITATION_CONTEXT = 2
+
+# bar colors of usage charts, assigned to collections in the order of the
+# collection list (and repeated if there are more collections than colors)
+CHART_COLORS = ['r', 'g', 'b', 'y', 'c', 'm', 'tab:orange', 'tab:purple',
+                'tab:brown', 'tab:gray']
+
+# size (in inches) and resolution of rendered usage charts
+CHART_SIZE = (18.5, 10.5)
+CHART_DPI = 72
+
+# queries of the menu, batch mode and usage charts - results are cached
+# and shared by all threads (see query.py)
+corpus = Corpus()
 
-# translate an english phrase to an appropriate latin phrase
+# translation client used by translate
+translator = None
+
+
+# the translation client used by translate, created on first use - the
+# http client is not needed by latin searches
+def translation_client():
+
+    global translator
+
+    if translator is None:
+        from latin_library.translation import TranslationClient
+        translator = TranslationClient()
+
+    return translator
+
+
+# translate an english phrase to an appropriate latin phrase - if no
+# appropriate translation is found, the english phrase is returned
+# unchanged. translations are cached on disk, see translation.py
 def translate(english_phrase):
+    return translation_client().translate(english_phrase)
+
+
+# translate many english phrases concurrently, with at most 'workers'
+# requests in flight (see translation.TranslationClient.translate_many)
+# yields (english, latin) pairs as they finish, ready to be searched or
+# charted - with 'errors', the latin of a phrase that could not be
+# translated is the exception
+def translate_many(english_phrases, workers=None, errors=False):
 
-    # wget command using free translation api
-    # returns json object with possible translations
-    c1 = ['wget', '-q', '-O', '-', 'http://mymemory.translated.net/api/get?q=' 
-                                   + english_phrase + '&langpair=en|la']
-    p1 = subprocess.Popen(c1, stdout=subprocess.PIPE)
+    if workers is None:
+        return translation_client().translate_many(english_phrases,
+                                                   errors=errors)
 
-    # use python json.tool to get json object in a usable form
-    c2 = ['python', '-m', 'json.tool']
-    p2 = subprocess.Popen(c2, stdin=p1.stdout, stdout=subprocess.PIPE)    
+    return translation_client().translate_many(english_phrases,
+                                               workers=workers, errors=errors)
 
-    # decode result of above command and create json object from it
-    result = json.loads(p2.stdout.read().decode('utf-8'))
 
-    # extract 'best' translation - if no appropriate translation is found, 
-    # the english phrase will be returned unchanged (handles many error cases) 
-    return result['responseData']['translatedText']  
+# display a single search result (a query.Hit)
+def print_result(result):
+
+    # display search result
+    print('Search Result')
+    print('-----------------------------------------------------------')
+    print(result.passage + '\n')
+
+    # display location of search result in its original document
+    print('Full Text: ' + result.link)
+
+    # additional location info = collection
+    print('Collection: ' + result.title)
+
+    # additional location info = book
+    print('Book: ' + result.book)
+
+    # additional location info - chapter (optional)
+    if result.chapter != 'null':
+        print('Chapter: ' + result.chapter)
+
+    # additional location info - verse
+    print('Verse: ' + str(result.verse) + '\n\n')
+
+
+# display the verses around a verse (query.Hits, in order), marking the
+# verse itself
+def print_context(verses, verse):
+
+    for result in verses:
+        marker = '>' if result.verse == verse else ' '
+        print('{} {:>5}  {}'.format(marker, result.verse, result.passage))
+
+    print('')
 
 
 # search the created fts table for a latin phrase
 # return results paired with their locations in their original documents
-def search(search_term):
+# results are displayed as they are fetched - with a page_size, the user is
+# asked whether to continue after each page. with 'lemma', the search term
+# is a lemma and verses containing any of its forms are displayed. with
+# 'context', each result is followed by the verses around it
+def search(search_term, page_size=None, lemma=False, context=0):
 
     # command line formatting
-    print('\nSearch Term: ' + search_term + '\n')
+    if lemma:
+        print('\nSearch Lemma: ' + search_term + '\n')
+    else:
+        print('\nSearch Term: ' + search_term + '\n')
 
-    # create database connection
-    db = sqlite3.connect('latin_library.db')
-    c = db.cursor()
+    # total number of results, counted separately from the row fetch
+    total = corpus.count(search_term, lemma)
 
-    # execute sqlite3 statement to obtain search results
-    c.execute('SELECT * FROM latin_fts WHERE passage MATCH ?', [search_term])
-    results = c.fetchall()
-    
     # search term found case
-    if len(results) > 0:
+    if total > 0:
 
-        # iterate over search results
-        for result in results:
-            
-            # display search result
-            print('Search Result')
-            print('-----------------------------------------------------------')
-            print(result[0] + '\n')
-            
-            # display location of search result in its original document
-            print('Full Text: ' + result[1])
-            
-            # additional location info = collection
-            print('Collection: ' + result[2])
-
-            # additional location info = book
-            print('Book: ' + result[3])
-
-            # additional location info - chapter (optional)
-            if result[4] != 'null':
-                print('Chapter: ' + result[4])
-
-            # additional location info - verse
-            print('Verse: ' + str(result[5]) + '\n\n')
+        print('Results: ' + str(total) + '\n')
+
+        # iterate over search results as they are fetched
+        shown = 0
+        for result in corpus.search(search_term, page_size or PAGE_SIZE,
+                                    lemma):
+
+            print_result(result)
+            if context > 0:
+                print_context(corpus.around(result, context), result.verse)
+            shown += 1
+
+            # end of a page - ask the user whether to display the next one
+            if page_size and shown % page_size == 0 and shown < total:
+                answer = input('Showing ' + str(shown) + ' of ' + str(total)
+                               + ' - press enter for more, q to stop: ')
+                if answer.strip().lower() == 'q':
+                    break
 
     # search term not found case
     else:
         print('\nNo Results\n')
 
-    # commit changes and close db connection
-    db.commit()
-    db.close()
+
+# search for the vocabulary words closest to the words of a latin phrase,
+# so misspelled words still find verses - the words searched for are
+# displayed before the results
+def fuzzy_search(search_term, page_size=None):
+
+    query = corpus.fuzzy_query(search_term)
+
+    # some word has no close vocabulary word
+    if query is None:
+        print('\nFuzzy Search Term: ' + search_term + '\n')
+        print('\nNo Results\n')
+        return
+
+    print('\nFuzzy Search Term: ' + search_term + ' (' + query + ')')
+    search(query, page_size)
+
+
+# display the k most relevant verses for a latin phrase
+def ranked_search(search_term, k=TOP_K):
+
+    # command line formatting
+    print('\nRanked Search Term: ' + search_term + '\n')
+
+    results = corpus.ranked(search_term, k)
+
+    # search term found case
+    if len(results) > 0:
+        for rank, result in enumerate(results, 1):
+            print('Rank: {} (score {:.3f})'.format(rank, result.score))
+            print_result(result)
+
+    # search term not found case
+    else:
+        print('\nNo Results\n')
+
+
+# display the concordance of a latin phrase - one line per match, aligned
+# on the match, with its context and location
+def concordance(search_term, width=CONTEXT_CHARS, span=CONCORDANCE_SPAN):
+
+    # command line formatting
+    print('\nConcordance: ' + search_term + '\n')
+
+    shown = 0
+    for line in corpus.concordance(search_term, width, span):
+
+        location = line.book
+        if line.chapter != 'null':
+            location += ', ' + line.chapter
+        location += ', ' + str(line.verse)
+
+        print('{:>{width}} [{}] {:<{width}}  {}'.format(
+            line.left, line.match, line.right, location, width=width))
+        shown += 1
+
+    # search term not found case
+    if shown == 0:
+        print('\nNo Results\n')
+
+
+# display the verse a citation refers to (e.g. 'Aeneid IV 100') with the
+# verses around it
+def cite(reference, context=CITATION_CONTEXT):
+
+    # command line formatting
+    print('\nCitation: ' + reference + '\n')
+
+    try:
+        verses = corpus.cite(reference, context)
+    except ValueError as e:
+        print(str(e) + '\n')
+        return
+
+    # the verses of each book found, under its location
+    verse = int(CITATION.fullmatch(reference.strip()).group(3))
+    for (link, book, chapter), group in itertools.groupby(
+            verses, lambda result: (result.link, result.book, result.chapter)):
+
+        location = book if chapter == 'null' else book + ', ' + chapter
+        print(location + ' (' + link + ')')
+        print_context(list(group), verse)
+
+    # citation not found case
+    if len(verses) == 0:
+        print('\nNo Results\n')
+
+
+# bars of the usage chart for a search term (or lemma) - (book, count,
+# color) tuples by decreasing count, with bars colored by collection
+def usage_chart_bars(search_term, lemma=False):
+
+    titles = corpus.collections()
+    bars = [(book, count,
+             CHART_COLORS[titles.index(title) % len(CHART_COLORS)])
+            for book, count, title in corpus.usage(search_term, lemma)]
+
+    # sort by decreasing occurence count
+    return sorted(bars, key=lambda x: x[1], reverse=True)
+
+
+# draw the usage chart for a search term on a matplotlib figure - a figure
+# that already shows a usage chart is updated in place, keeping its axes,
+# ticks and legend, which is much faster than drawing a new figure
+def draw_usage_chart(fig, search_term, bars):
+
+    import numpy as np
+    from matplotlib import patches as mpatches
+
+    # first chart drawn on the figure - create the axes and the legend of
+    # the collection colors
+    if len(fig.axes) == 0:
+        ax = fig.add_subplot(111)
+        titles = corpus.collections()
+        ax.legend(handles=[mpatches.Patch(
+                      color=CHART_COLORS[i % len(CHART_COLORS)], label=title)
+                  for i, title in enumerate(titles)], loc='upper right')
+
+    # remove the bars of the previous chart
+    else:
+        ax = fig.axes[0]
+        for container in list(ax.containers):
+            container.remove()
+
+    # plot bar chart using search term occurences
+    ys = np.arange(len(bars))
+    ax.bar(ys, [y for x, y, c in bars], width=.4,
+           color=[c for x, y, c in bars])
+    ax.set_xticks(ys + .4 / 2)
+    ax.set_xticklabels([x for x, y, c in bars])
+
+    # x and y labels for usage chart
+    ax.set_xlabel('Books with at least 1 occurence of \'' + search_term + '\'')
+    ax.set_ylabel('Number of occurrences of \'' + search_term + '\'')
+
+    # format the xlabels for readability
+    fig.autofmt_xdate()
+
+    # set x range to the bars and y range to be 0 through the max value + 1
+    # for visual appeal
+    ax.set_xlim([-.5, len(bars)])
+    ax.set_ylim([0, max(y for x, y, c in bars) + 1])
 
 
 # create and display a usage chart for the given search term 
 # across all books in which the search term occurs
-def usageChart(search_term):
-
-    # create database connection
-    db = sqlite3.connect('latin_library.db')
-    c = db.cursor()
+# with 'lemma', verses containing any form of the lemma are counted
+def usageChart(search_term, lemma=False):
 
     # command line formatting
     print('\nUsage Chart: ' + search_term)
-    
-    # statement to obtain counts of search results by book along with book names
-    c.execute('''SELECT book, COUNT(*), title 
-                 FROM latin_fts 
-                 WHERE passage MATCH ? 
-                 GROUP BY book''', [search_term]);
-    results = c.fetchall()
+
+    bars = usage_chart_bars(search_term, lemma)
 
     # search term found case
-    if len(results) > 0:
+    if len(bars) > 0:
 
-        unsorted_data = []
-        x_data = []
-        y_data = []
-        colors = []
-        max_y = 0
-
-        # iterate over search results
-        for i in range(len(results)):
-    
-            # track max y value for plot formatting later
-            if results[i][1] > max_y:
-                max_y = results[i][1]
-            
-            # set colors of bars to group them by collection
-            if results[i][2] == 'Cassiodorus':
-                color = 'r'
-
-            elif results[i][2] == 'Statius':
-                color = 'g'
-
-            elif results[i][2] == 'Vergil':
-                color = 'b'
-
-            elif results[i][2] == 'Silius':
-                color = 'y'
-
-            # add book name, occurence count, and bar color to list of data
-            unsorted_data.append((results[i][0], results[i][1], color))
-         
-        # sort unsorted_data by decreasing occurence count
-        sorted_data = sorted(unsorted_data, key=lambda x: x[1], reverse=True)
-        
-        # add sorted values to data lists for plotting
-        for x,y,c in sorted_data:
-            x_data.append(x)
-            y_data.append(y)
-            colors.append(c)
+        from matplotlib import pyplot as plt
 
-        # plot bar chart using search term occurences
         fig = plt.figure()
         fig.set_size_inches(18.5, 10.5, forward=True)
-        fig.canvas.set_window_title('Usage Chart for \'' + search_term + '\'')
-        ys = np.arange(len(y_data))
-        barlist=plt.bar(ys, y_data, width=.4)
-        plt.xticks(ys + .4 / 2, x_data)
-
-        # x and y labels for usage chart
-        plt.xlabel('Books with at least 1 occurence of \'' + search_term + '\'')
-        plt.ylabel('Number of occurrences of \'' + search_term + '\'')
-
-        # set colors of bars depending on collection
-        for i in range(len(barlist)):
-            barlist[i].set_color(colors[i])
-
-        # create legend for bars
-        labels = ['R', 'G', 'B', 'Y']
-        l_vals = ['Cassiodorus', 'Statius', 'Vergil', 'Silius']
-        pls = [Line2D([0], [0], linestyle='none', 
-               marker=r'$\mathregular{{{}}}$'.format(l)) for l in labels]
-        plt.legend(pls, l_vals, numpoints=1, markerscale=2, loc='upper right')
-        
-        # format the xlabels for readability
-        fig.autofmt_xdate()
+        # through the figure manager, which has set_window_title in every
+        # matplotlib version (the canvas no longer does since 3.6)
+        fig.canvas.manager.set_window_title(
+            'Usage Chart for \'' + search_term + '\'')
+        draw_usage_chart(fig, search_term, bars)
 
-        # set y range to be 0 through the max value + 1 for visual appeal
-        plt.ylim([0, max_y+1])
-        
         # display barplot
         plt.show() 
 
@@ -185,28 +351,199 @@ def usageChart(search_term):
     else:
         print('\nNo Results\n')
 
-    # commit changes and close db connection
-    db.commit()
-    db.close()
+
+# renders usage charts of search terms (or lemmas) without a display - one
+# figure is drawn on an agg canvas and reused for every chart. charts are
+# written to 'directory' as usage_<term>.<fmt> (png or svg), or returned as
+# bytes without a directory
+class UsageChartRenderer:
+
+    def __init__(self, directory=None, fmt='png', lemma=False,
+                 dpi=CHART_DPI):
+
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.fig = Figure(figsize=CHART_SIZE)
+        FigureCanvasAgg(self.fig)
+
+        self.directory = directory
+        self.fmt = fmt
+        self.lemma = lemma
+        self.dpi = dpi
+
+    # the chart of a search term - its file path or bytes, None if the
+    # term is not found
+    def render(self, search_term):
+
+        bars = usage_chart_bars(search_term, self.lemma)
+        if len(bars) == 0:
+            return None
+
+        draw_usage_chart(self.fig, search_term, bars)
+
+        if self.directory is None:
+            output = io.BytesIO()
+            self.fig.savefig(output, format=self.fmt, dpi=self.dpi)
+            return output.getvalue()
+
+        name = re.sub(r'\W+', '_', search_term.strip()) or 'chart'
+        path = os.path.join(self.directory, 'usage_' + name + '.' + self.fmt)
+        self.fig.savefig(path, format=self.fmt, dpi=self.dpi)
+
+        return path
+
+
+# render the usage charts of many search terms (or lemmas) on one figure
+# (see UsageChartRenderer)
+# returns a dict of term -> file path or bytes (None for terms not found)
+def render_usage_charts(search_terms, directory=None, fmt='png',
+                        lemma=False, dpi=CHART_DPI):
+
+    renderer = UsageChartRenderer(directory, fmt, lemma, dpi)
+
+    return {search_term: renderer.render(search_term)
+            for search_term in search_terms}
+
+
+# json objects answering one batch query - one per hit in 'search' and
+# 'ranked' mode, one per match in 'concordance' mode, one per query in
+# 'count' mode ({'count': n}) and 'usage' mode ({'counts': {book: n}}).
+# 'limit' caps the hits of a query (ranked mode returns the TOP_K best
+# without one) and with 'lemma', search, count and usage queries are lemmas
+def batch_records(query, mode='search', limit=None, lemma=False):
+
+    if mode == 'search':
+        results = itertools.islice(corpus.search(query, PAGE_SIZE, lemma),
+                                   limit)
+        for result in results:
+            yield dict(query=query, **result_dict(result))
+
+    elif mode == 'ranked':
+        for result in corpus.ranked(query, limit or TOP_K):
+            yield dict(query=query, score=result.score,
+                       **result_dict(result[:6]))
+
+    elif mode == 'concordance':
+        lines = itertools.islice(corpus.concordance(query), limit)
+        for line in lines:
+            record = dict(query=query, **line._asdict())
+            if record['chapter'] == 'null':
+                record['chapter'] = None
+            yield record
+
+    elif mode == 'count':
+        yield {'query': query, 'count': corpus.count(query, lemma)}
+
+    elif mode == 'usage':
+        yield {'query': query, 'counts': corpus.usage_map(query, lemma)}
+
+    else:
+        raise ValueError('unknown batch mode: ' + mode)
+
+
+# (english, latin) pairs of english queries, translated concurrently
+# BATCH_WINDOW queries at a time so the queries are read as they are
+# answered - the latin of a query that could not be translated is the
+# exception
+def translated_queries(queries):
+
+    while True:
+        window = list(itertools.islice(queries, BATCH_WINDOW))
+        if len(window) == 0:
+            return
+
+        yield from translate_many(window, errors=True)
+
+
+# run queries without prompting - one query per line of 'lines' (blank
+# lines are skipped), with results written to 'output' as json lines (see
+# batch_records). lines are read as the queries are answered, all queries
+# share the connection of the calling thread, and a query the index
+# rejects yields an {'error': ...} object instead of stopping the batch.
+# with 'english', the queries are translated to latin first (concurrently,
+# see translated_queries) and records also hold the english query - a
+# query that could not be translated yields an {'error': ...} object too
+# returns the number of queries run
+def run_batch(lines, output=sys.stdout, mode='search', limit=None,
+              lemma=False, english=False):
+
+    queries = (line.strip() for line in lines)
+    queries = (query for query in queries if query != '')
+
+    if english:
+        pairs = translated_queries(queries)
+    else:
+        pairs = ((query, query) for query in queries)
+
+    count = 0
+    for english_query, query in pairs:
+
+        if isinstance(query, Exception):
+            output.write(json.dumps(
+                {'english': english_query,
+                 'error': 'translation failed: ' + str(query)},
+                ensure_ascii=False) + '\n')
+            count += 1
+            continue
+
+        try:
+            for record in batch_records(query, mode, limit, lemma):
+                if english:
+                    record = dict(english=english_query, **record)
+                output.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        except sqlite3.OperationalError as e:
+            record = {'query': query, 'error': str(e)}
+            if english:
+                record = dict(english=english_query, **record)
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+        count += 1
+
+    output.flush()
+
+    return count
+
+
+# complete latin words at the prompts with the tab key, from the words of
+# the corpus beginning with what has been typed (most common first) - only
+# where the readline module is available
+def enable_completion():
+
+    try:
+        import readline
+    except ImportError:
+        return
+
+    def completer(text, state):
+        words = [word for word, documents in corpus.complete(text)]
+        return words[state] if state < len(words) else None
+
+    readline.set_completer(completer)
+    readline.parse_and_bind('tab: complete')
 
 
 def main():
 
+    enable_completion()
+
     user_input = ''
 
     # loop until user selects quit option
-    while user_input != '5':
+    while user_input != quit_option:
 
         # user selection
         user_input = input(input_prompt)
         
         # latin term search case
         if user_input == '1':
-            search(input('\nEnter a Latin search term: '))
+            search(input('\nEnter a Latin search term: '), PAGE_SIZE)
 
         # english term search case
         elif user_input == '2':
-            search(translate(input('\nEnter an English search term: ')))
+            search(translate(input('\nEnter an English search term: ')),
+                   PAGE_SIZE)
 
         # usage chart latin term case
         elif user_input == '3':
@@ -216,12 +553,87 @@ def main():
         elif user_input == '4':
             usageChart(translate(input('\nEnter an English search term: ')))
 
+        # ranked latin term search case
+        elif user_input == '5':
+            ranked_search(input('\nEnter a Latin search term: '))
+
+        # latin lemma search case
+        elif user_input == '6':
+            search(input('\nEnter a Latin lemma: '), PAGE_SIZE, lemma=True)
+
+        # usage chart latin lemma case
+        elif user_input == '7':
+            usageChart(input('\nEnter a Latin lemma: '), lemma=True)
+
+        # latin concordance case
+        elif user_input == '8':
+            concordance(input('\nEnter a Latin search term: '))
+
+        # citation lookup case
+        elif user_input == '9':
+            cite(input('\nEnter a citation (e.g. Aeneid IV 100): '))
+
+        # fuzzy latin term search case
+        elif user_input == '10':
+            fuzzy_search(input('\nEnter a Latin search term: '), PAGE_SIZE)
+
         # quit case
-        elif user_input != '5':
+        elif user_input != quit_option:
             print('Invalid Input')
 
         # output formatting
         print('')
 
 if __name__ == '__main__':
-    main()
+
+    parser = argparse.ArgumentParser()
+
+    # render usage charts without a display instead of the input loop
+    parser.add_argument('--charts', nargs='+', metavar='TERM',
+                        help='render the usage charts of these terms to '
+                             'files and exit')
+    parser.add_argument('--output', default='.',
+                        help='directory the charts are written to')
+    parser.add_argument('--format', default='png', choices=['png', 'svg'],
+                        help='file format of the charts')
+    parser.add_argument('--lemma', action='store_true',
+                        help='treat terms as lemmas')
+    parser.add_argument('--english', action='store_true',
+                        help='translate the terms from english first')
+
+    # run queries from a file (or stdin) and write json lines to stdout
+    parser.add_argument('--batch', metavar='FILE',
+                        help='run the queries in FILE (- for stdin), one '
+                             'per line, and write json lines to stdout')
+    parser.add_argument('--mode', default='search', choices=BATCH_MODES,
+                        help='kind of query run in batch mode')
+    parser.add_argument('--limit', type=int, default=None,
+                        help='maximum number of hits per batch query')
+    args = parser.parse_args()
+
+    if args.batch:
+        if args.batch == '-':
+            run_batch(sys.stdin, sys.stdout, args.mode, args.limit,
+                      args.lemma, args.english)
+        else:
+            with open(args.batch, encoding='utf-8') as f:
+                run_batch(f, sys.stdout, args.mode, args.limit, args.lemma,
+                          args.english)
+
+    elif args.charts:
+
+        # english terms are translated concurrently and each chart is
+        # rendered on the same figure as soon as its translation arrives
+        if args.english:
+            pairs = translate_many(args.charts)
+        else:
+            pairs = ((term, term) for term in args.charts)
+
+        renderer = UsageChartRenderer(args.output, args.format, args.lemma)
+        for english, term in pairs:
+            path = renderer.render(term)
+            if english != term:
+                term = english + ' -> ' + term
+            print(term + ': ' + (path or 'No Results'))
+    else:
+        main()
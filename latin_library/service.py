@@ -0,0 +1,440 @@
+#!/usr/bin/python3
+
+import json
+import time
+import asyncio
+import argparse
+import sqlite3
+import threading
+import collections
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from latin_library.query import Corpus, DATABASE, PAGE_SIZE, TOP_K, \
+    COMPLETIONS, result_dict
+
+# address the service listens on by default
+HOST = '127.0.0.1'
+PORT = 8000
+
+# number of threads (each with its own read-only connection) running queries
+WORKERS = 4
+
+# seconds a request may take before it is answered with 504 - a query still
+# running by then is interrupted, and one still waiting for a worker is
+# never run
+REQUEST_TIMEOUT = 5.0
+
+# number of sqlite virtual machine instructions between checks of whether
+# the request of a running query timed out
+PROGRESS_STEPS = 1000
+
+# seconds an idle keep-alive connection is kept open
+IDLE_TIMEOUT = 30.0
+
+# largest number of hits returned by one request
+MAX_LIMIT = 1000
+
+# number of recent latencies kept per endpoint for the percentiles
+LATENCY_WINDOW = 1024
+
+# beginnings of the sqlite errors caused by the fts query syntax of a
+# search term - answered with 400, any other sqlite error with 500
+QUERY_SYNTAX_ERRORS = ('malformed MATCH expression', 'fts5: syntax error')
+
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 500: 'Internal Server Error',
+                502: 'Bad Gateway', 504: 'Gateway Timeout'}
+
+
+# error answered to the client with an http status and a message
+class RequestError(Exception):
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# request counts and latencies of each endpoint
+class Metrics:
+
+    def __init__(self, window=LATENCY_WINDOW):
+
+        self.window = window
+        self.started = time.time()
+        self.requests = collections.Counter()
+        self.errors = collections.Counter()
+        self.latencies = collections.defaultdict(
+            lambda: collections.deque(maxlen=self.window))
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    # record a finished request
+    def record(self, endpoint, status, seconds):
+
+        with self.lock:
+            self.requests[endpoint] += 1
+            if status >= 400:
+                self.errors[endpoint] += 1
+            self.latencies[endpoint].append(seconds * 1000)
+
+    # counts and latency percentiles (in milliseconds) of every endpoint
+    def snapshot(self):
+
+        with self.lock:
+            endpoints = {}
+
+            for endpoint, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                endpoints[endpoint] = {
+                    'requests': self.requests[endpoint],
+                    'errors': self.errors[endpoint],
+                    'p50_ms': round(percentile(latencies, 50), 3),
+                    'p95_ms': round(percentile(latencies, 95), 3),
+                    'p99_ms': round(percentile(latencies, 99), 3),
+                    'max_ms': round(latencies[-1], 3)}
+
+            return {'uptime_s': round(time.time() - self.started, 3),
+                    'in_flight': self.in_flight,
+                    'endpoints': endpoints}
+
+
+# the p-th percentile of a sorted list of values
+def percentile(values, p):
+    return values[min(len(values) - 1, len(values) * p // 100)]
+
+
+# http/json service over the search index - requests are handled on an
+# asyncio event loop and queries run in a pool of threads, each with its
+# own read-only connection, so a slow query never blocks the loop.
+# endpoints (GET, parameters in the query string):
+#     /search?q=...&limit=20&after=0&lemma=0   matching verses, a page at a time
+#     /ranked?q=...&k=10                        most relevant verses
+#     /count?q=...&lemma=0                      number of matching verses
+#     /usage?q=...&lemma=0                      matching verses by book
+#     /complete?q=...&limit=10                  words beginning with q
+#     /translate?q=...                          english to latin
+#     /metrics                                  request counts and latencies
+class SearchService:
+
+    def __init__(self, database=DATABASE, workers=WORKERS,
+                 timeout=REQUEST_TIMEOUT, translator=None):
+
+        self.corpus = Corpus(database)
+        self.pool = ThreadPoolExecutor(workers)
+        self.timeout = timeout
+        self.metrics = Metrics()
+
+        # translation requests wait on the network, so they get their own
+        # threads rather than holding up queries
+        self.translator = translator
+        self.translation_pool = ThreadPoolExecutor(workers)
+
+        # the listening server and the task serving each client connection
+        self.server = None
+        self.clients = set()
+
+        self.routes = {'/search': self.search, '/ranked': self.ranked,
+                       '/count': self.count, '/usage': self.usage,
+                       '/complete': self.complete,
+                       '/translate': self.translate,
+                       '/metrics': self.report}
+
+    # run a blocking query in the pool, interrupting it if it takes longer
+    # than the request timeout - the query checks a flag of its own call
+    # rather than being interrupted through the connection, which the
+    # worker may already be using for the next request
+    async def query(self, call):
+
+        timed_out = threading.Event()
+
+        def run():
+
+            # the request timed out while the call waited for a worker
+            if timed_out.is_set():
+                raise RequestError(504, 'query timed out')
+
+            db = self.corpus.connection()
+            db.set_progress_handler(timed_out.is_set, PROGRESS_STEPS)
+            try:
+                return call()
+            finally:
+                db.set_progress_handler(None, 0)
+
+        future = asyncio.get_running_loop().run_in_executor(self.pool, run)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+
+        except asyncio.TimeoutError:
+            timed_out.set()
+            raise RequestError(504, 'query timed out')
+
+        except sqlite3.OperationalError as e:
+            if str(e).startswith(QUERY_SYNTAX_ERRORS):
+                raise RequestError(400, str(e))
+            raise
+
+    async def search(self, params):
+
+        q, lemma = search_term(params), flag(params, 'lemma')
+        limit = integer(params, 'limit', PAGE_SIZE, 1, MAX_LIMIT)
+        after = integer(params, 'after', 0, 0)
+
+        hits, after = await self.query(
+            lambda: self.corpus.page(q, limit, after, lemma))
+
+        return {'query': q, 'hits': [result_dict(hit) for hit in hits],
+                'after': after}
+
+    async def ranked(self, params):
+
+        q = search_term(params)
+        k = integer(params, 'k', TOP_K, 1, MAX_LIMIT)
+
+        hits = await self.query(lambda: self.corpus.ranked(q, k))
+
+        return {'query': q,
+                'hits': [dict(result_dict(hit[:6]), score=hit.score)
+                         for hit in hits]}
+
+    async def complete(self, params):
+
+        q = search_term(params)
+        limit = integer(params, 'limit', COMPLETIONS, 1, MAX_LIMIT)
+
+        completions = await self.query(lambda: self.corpus.complete(q, limit))
+
+        return {'query': q,
+                'completions': [{'term': term, 'documents': documents}
+                                for term, documents in completions]}
+
+    async def count(self, params):
+
+        q, lemma = search_term(params), flag(params, 'lemma')
+
+        return {'query': q,
+                'count': await self.query(lambda: self.corpus.count(q, lemma))}
+
+    async def usage(self, params):
+
+        q, lemma = search_term(params), flag(params, 'lemma')
+
+        return {'query': q, 'counts': await self.query(
+            lambda: self.corpus.usage_map(q, lemma))}
+
+    async def translate(self, params):
+
+        q = search_term(params)
+
+        # created on first use
+        if self.translator is None:
+            from latin_library.translation import TranslationClient
+            self.translator = TranslationClient()
+
+        future = asyncio.get_running_loop().run_in_executor(
+            self.translation_pool, self.translator.translate, q)
+        try:
+            latin = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise RequestError(504, 'translation timed out')
+        except Exception as e:
+            raise RequestError(502, 'translation failed: ' + str(e))
+
+        return {'query': q, 'latin': latin}
+
+    async def report(self, params):
+        return self.metrics.snapshot()
+
+    # answer one request - returns the http status and the json body
+    async def respond(self, method, target):
+
+        url = urllib.parse.urlsplit(target)
+
+        if url.path not in self.routes:
+            return 404, {'error': 'not found: ' + url.path}
+        if method != 'GET':
+            return 405, {'error': 'method not allowed: ' + method}
+
+        try:
+            params = urllib.parse.parse_qs(url.query)
+            return 200, await self.routes[url.path](params)
+        except RequestError as e:
+            return e.status, {'error': str(e)}
+
+        # any other failure (a damaged database, a bug) is still answered,
+        # and counted in the metrics
+        except Exception as e:
+            return 500, {'error': 'internal error: ' + str(e)}
+
+    # serve the requests of one (keep-alive) client connection
+    async def handle(self, reader, writer):
+
+        task = asyncio.current_task()
+        self.clients.add(task)
+        try:
+            while True:
+
+                # request line and headers
+                try:
+                    line = await asyncio.wait_for(reader.readline(),
+                                                  IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not line:
+                    break
+
+                start = time.perf_counter()
+                try:
+                    method, target, version = line.decode('latin-1').split()
+                except ValueError:
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                # a body is not used by any endpoint
+                length = int(headers.get('content-length', 0) or 0)
+                if length > 0:
+                    await reader.readexactly(length)
+
+                self.metrics.in_flight += 1
+                try:
+                    status, result = await self.respond(method, target)
+                finally:
+                    self.metrics.in_flight -= 1
+
+                # connections are kept alive unless the client says otherwise
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and \
+                    (version == 'HTTP/1.1' or connection == 'keep-alive')
+
+                body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+                writer.write(('HTTP/1.1 {} {}\r\n'
+                              'Content-Type: application/json; charset=utf-8\r\n'
+                              'Content-Length: {}\r\n'
+                              'Connection: {}\r\n\r\n').format(
+                                  status, HTTP_REASONS[status], len(body),
+                                  'keep-alive' if keep_alive else 'close'
+                              ).encode('latin-1') + body)
+                await writer.drain()
+
+                self.metrics.record(urllib.parse.urlsplit(target).path,
+                                    status, time.perf_counter() - start)
+
+                if not keep_alive:
+                    break
+
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+
+        finally:
+            self.clients.discard(task)
+            writer.close()
+
+    # start listening - returns the asyncio server
+    async def start(self, host=HOST, port=PORT):
+
+        self.server = await asyncio.start_server(self.handle, host, port)
+        return self.server
+
+    # serve until interrupted
+    async def serve(self, host=HOST, port=PORT):
+
+        server = await self.start(host, port)
+        async with server:
+            await server.serve_forever()
+
+    # stop listening and drop the open client connections
+    async def stop(self):
+
+        self.server.close()
+        clients = list(self.clients)
+        for task in clients:
+            task.cancel()
+        await asyncio.gather(*clients, return_exceptions=True)
+
+    # stop the worker threads and close their connections
+    def close(self):
+
+        self.pool.shutdown()
+        self.translation_pool.shutdown()
+        self.corpus.close()
+
+
+# the search term of a request
+def search_term(params):
+
+    if 'q' not in params or params['q'][0].strip() == '':
+        raise RequestError(400, 'missing parameter: q')
+
+    return params['q'][0]
+
+
+# an integer parameter of a request, between 'low' and 'high'
+def integer(params, name, default, low, high=None):
+
+    if name not in params:
+        return default
+
+    try:
+        value = int(params[name][0])
+    except ValueError:
+        raise RequestError(400, 'not an integer: ' + name)
+
+    if value < low or (high is not None and value > high):
+        raise RequestError(400, 'out of range: ' + name)
+
+    return value
+
+
+# a boolean parameter of a request ('1' / 'true' / 'yes')
+def flag(params, name):
+    return params.get(name, ['0'])[0].lower() in ('1', 'true', 'yes')
+
+
+# run a service on its own event loop in a background thread (for tests
+# and load testing) - returns the port it listens on and a function that
+# stops it
+def run_in_thread(service, host=HOST, port=0):
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(service.start(host, port))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(service.stop(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        service.close()
+
+    return server.sockets[0].getsockname()[1], stop
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=HOST,
+                        help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT,
+                        help='port to listen on')
+    parser.add_argument('--database', default=DATABASE,
+                        help='database built by parse_data')
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help='number of query threads (and connections)')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help='seconds before a request times out')
+    args = parser.parse_args()
+
+    service = SearchService(args.database, args.workers, args.timeout)
+    print('Serving on http://{}:{}/'.format(args.host, args.port))
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
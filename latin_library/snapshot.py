@@ -0,0 +1,359 @@
+#!/usr/bin/python3
+
+import os
+import re
+import sys
+import json
+import mmap
+import array
+import bisect
+import struct
+import sqlite3
+import collections
+import urllib.parse
+from latin_library.query import Hit, DATABASE
+
+# file parse_data writes the snapshot to
+SNAPSHOT = 'latin_library.snapshot'
+
+# first bytes of a snapshot, followed by the length of its json header
+MAGIC = b'LATSNAP2'
+HEADER_LENGTH = struct.Struct('<I')
+
+# sections are aligned to this many bytes so the columns can be cast in place
+ALIGNMENT = 8
+
+# bytes of text (whole verses, at least one) decoded at a time for str
+# patterns
+CHUNK_BYTES = 2 ** 20
+
+# columns stored after the passage text, with their array typecodes -
+# 'offsets' has one more entry than there are verses (the end of the text),
+# 'books', 'chapters' and 'verses' index the value lists of the header.
+# docids take 64 bits, the books' blocks of docids being spread out (see
+# parse_data.BOOK_DOCIDS)
+COLUMNS = (('offsets', 'I'), ('docids', 'Q'), ('books', 'I'),
+           ('chapters', 'I'), ('verses', 'I'))
+
+# a verse matching a regular expression - 'spans' are the (start, end)
+# character positions of the matches in the passage of 'hit', 'docid' the
+# row of the verse in the database
+ScanHit = collections.namedtuple('ScanHit', ['hit', 'spans', 'docid'])
+
+
+# index of a value in a list of distinct values, added if not seen before
+def intern(values, indexes, value):
+
+    if value not in indexes:
+        indexes[value] = len(values)
+        values.append(value)
+
+    return indexes[value]
+
+
+# position rounded up to the alignment of the sections
+def aligned(position):
+    return -(-position // ALIGNMENT) * ALIGNMENT
+
+
+# write a snapshot of the verses of a database - their passages as a single
+# block of utf-8 text (one verse per line, in docid order) followed by
+# fixed width columns of offsets into the text and of the other fields
+def write_snapshot(database=DATABASE, path=SNAPSHOT):
+
+    db = sqlite3.connect(database)
+    generation = db.execute('PRAGMA user_version').fetchone()[0]
+
+    # a line break before the first verse too, as a search starting inside
+    # the mapping only matches '^' after one
+    text = bytearray(b'\n')
+    columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+    values = {'books': [], 'chapters': [], 'verses': []}
+    indexes = {'books': {}, 'chapters': {}, 'verses': {}}
+
+    # the fts table reads the content of either database layout
+    rows = db.execute('''SELECT docid, passage, link, title, book, chapter,
+                                verse
+                         FROM latin_fts ORDER BY docid''')
+    for docid, passage, link, title, book, chapter, verse in rows:
+
+        # line breaks inside a passage would start a new 'line' for '^' and
+        # '$' in the middle of a verse
+        columns['offsets'].append(len(text))
+        text += passage.replace('\n', ' ').encode('utf-8') + b'\n'
+
+        columns['docids'].append(docid)
+        columns['books'].append(
+            intern(values['books'], indexes['books'], (link, title, book)))
+        columns['chapters'].append(
+            intern(values['chapters'], indexes['chapters'], chapter))
+        columns['verses'].append(
+            intern(values['verses'], indexes['verses'], verse))
+
+    db.close()
+    columns['offsets'].append(len(text))
+
+    # offsets of the sections from the end of the header, which is padded
+    # to the alignment
+    sections = {}
+    position = 0
+    for name, data in [('text', text)] + \
+            [(name, columns[name]) for name, typecode in COLUMNS]:
+        length = len(data) * getattr(data, 'itemsize', 1)
+        sections[name] = [position, length]
+        position = aligned(position + length)
+
+    header = {'generation': generation, 'verses': len(columns['docids']),
+              'byteorder': sys.byteorder, 'sections': sections,
+              'values': values}
+    header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    start = aligned(len(MAGIC) + HEADER_LENGTH.size + len(header))
+
+    # write to a temporary file first, so a snapshot open elsewhere is only
+    # ever replaced by a complete one
+    with open(path + '.tmp', 'wb') as f:
+        f.write(MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        for name, data in [('text', text)] + \
+                [(name, columns[name]) for name, typecode in COLUMNS]:
+            f.seek(start + sections[name][0])
+            f.write(data)
+
+    os.replace(path + '.tmp', path)
+
+    return len(columns['docids'])
+
+
+# compile a regular expression for a snapshot - '^' and '$' match at the
+# start and end of every verse. str patterns are matched against the text
+# (decoded a chunk of verses at a time) with the usual unicode semantics,
+# bytes patterns against its utf-8 bytes, which is faster but leaves '.',
+# '\w' and character classes to match single bytes
+def compile_pattern(pattern, flags=0):
+
+    if isinstance(pattern, re.Pattern):
+        flags, pattern = pattern.flags, pattern.pattern
+
+    return re.compile(pattern, flags | re.MULTILINE)
+
+
+# a snapshot written by write_snapshot, mapped into memory - regular
+# expressions run over the whole text at once, and only the verses they
+# match are read into python objects. given the database it was written
+# from, a snapshot older than the database's current build is not opened
+class Snapshot:
+
+    def __init__(self, path=SNAPSHOT, database=None):
+
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(path + ' is not a corpus snapshot')
+
+        start = len(MAGIC) + HEADER_LENGTH.size
+        length, = HEADER_LENGTH.unpack(self.map[len(MAGIC):start])
+        header = json.loads(self.map[start:start + length].decode('utf-8'))
+        start = aligned(start + length)
+
+        if header['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError(path + ' was written on a ' +
+                             header['byteorder'] + ' endian machine')
+
+        self.generation = header['generation']
+        if database is not None and self.is_stale(database):
+            self.close()
+            raise ValueError(path + ' was written before the last update of '
+                             + database)
+
+        self.count = header['verses']
+        self.books = [tuple(book) for book in header['values']['books']]
+        self.chapters = header['values']['chapters']
+        self.verses = header['values']['verses']
+
+        # views of the sections - nothing is copied out of the mapping
+        self.view = memoryview(self.map)
+        offset, length = header['sections']['text']
+        self.text_start = start + offset
+        self.text_end = self.text_start + length
+        self.columns = {}
+        for name, typecode in COLUMNS:
+            offset, length = header['sections'][name]
+            self.columns[name] = self.view[
+                start + offset:start + offset + length].cast(typecode)
+
+    def __len__(self):
+        return self.count
+
+    # whether the database was updated after the snapshot was written, so
+    # the snapshot may return verses the database no longer has
+    def is_stale(self, database=DATABASE):
+
+        # read-only, so a missing database is not created
+        db = sqlite3.connect('file:' + urllib.parse.quote(
+            os.path.abspath(database)) + '?mode=ro', uri=True)
+        try:
+            generation = db.execute('PRAGMA user_version').fetchone()[0]
+        finally:
+            db.close()
+
+        return generation != self.generation
+
+    # release the views before the mapping, which cannot close while they
+    # are in use
+    def close(self):
+
+        if hasattr(self, 'columns'):
+            for column in self.columns.values():
+                column.release()
+            self.view.release()
+        self.map.close()
+        self.file.close()
+
+    # (start, end) positions in the mapping of the text of verse i,
+    # without its line break
+    def span(self, i):
+
+        offsets = self.columns['offsets']
+
+        return (self.text_start + offsets[i],
+                self.text_start + offsets[i + 1] - 1)
+
+    # the Hit of verse i
+    def hit(self, i):
+
+        start, end = self.span(i)
+        link, title, book = self.books[self.columns['books'][i]]
+
+        return Hit(self.map[start:end].decode('utf-8'), link, title, book,
+                   self.chapters[self.columns['chapters'][i]],
+                   self.verses[self.columns['verses'][i]])
+
+    # True if a byte position of the text is not inside a character
+    def on_character(self, position):
+        return self.map[position] & 0xc0 != 0x80
+
+    # (verse index, position of the first match in the verse) of every verse
+    # matching a compiled pattern, in order - in characters for a str
+    # pattern, in bytes for a bytes pattern
+    def matching(self, regex):
+
+        if self.count == 0:
+            return
+
+        if isinstance(regex.pattern, str):
+            yield from self.matching_text(regex)
+        else:
+            yield from self.matching_bytes(regex)
+
+    # matching for a bytes pattern. the text is searched as a whole - the
+    # verse is only looked up (by binary search over the offsets) once
+    # something matched, and a match running on into the next verse is
+    # searched for again within its own verse. matches that begin or end
+    # inside a character are not matches of the text
+    def matching_bytes(self, regex):
+
+        offsets = self.columns['offsets']
+        position = self.span(0)[0]
+
+        # up to the end of the last verse, where an empty line would follow
+        # its line break
+        while True:
+            match = regex.search(self.map, position, self.text_end - 1)
+            if match is None:
+                return
+
+            i = bisect.bisect_right(offsets,
+                                    match.start() - self.text_start) - 1
+            start, end = self.span(i)
+
+            for match in regex.finditer(self.map, match.start(), end):
+                if self.on_character(match.start()) and \
+                   self.on_character(match.end()):
+                    yield i, match.start() - start
+                    break
+
+            position = end + 1
+
+    # matching for a str pattern. the text is decoded a chunk of whole
+    # verses at a time and each chunk searched as a whole - the verse of a
+    # match is found by counting the line breaks before it, and a match
+    # running on into the next verse is searched for again within its own
+    # verse
+    def matching_text(self, regex):
+
+        offsets = self.columns['offsets']
+        first = 0
+
+        while first < self.count:
+
+            # verses first to last - 1, without the line break of the last
+            last = bisect.bisect_left(offsets, offsets[first] + CHUNK_BYTES,
+                                      first + 1, self.count)
+            chunk = self.map[self.span(first)[0]:
+                             self.span(last - 1)[1]].decode('utf-8')
+
+            i, line_start, position = first, 0, 0
+            while True:
+                match = regex.search(chunk, position)
+                if match is None:
+                    break
+
+                i += chunk.count('\n', line_start, match.start())
+                line_start = chunk.rfind('\n', 0, match.start()) + 1
+                line_end = chunk.find('\n', match.start())
+                if line_end == -1:
+                    line_end = len(chunk)
+
+                if match.end() > line_end:
+                    match = regex.search(chunk, match.start(), line_end)
+                if match is not None:
+                    yield i, match.start() - line_start
+
+                position = line_end + 1
+                if position > len(chunk):
+                    break
+
+            first = last
+
+    # the verses matching a pattern (at most 'limit' of them), with the
+    # (start, end) character positions of all matches in each
+    def search(self, pattern, flags=0, limit=None):
+
+        regex = compile_pattern(pattern, flags)
+        hits = []
+
+        for i, first in self.matching(regex):
+            if limit is not None and len(hits) == limit:
+                break
+
+            start, end = self.span(i)
+            passage = self.map[start:end]
+
+            if isinstance(regex.pattern, str):
+                spans = [match.span() for match in
+                         regex.finditer(passage.decode('utf-8'), first)]
+
+            # byte positions in the verse to character positions
+            else:
+                spans = []
+                for match in regex.finditer(passage, first):
+                    if self.on_character(start + match.start()) and \
+                       self.on_character(start + match.end()):
+                        before = len(passage[:match.start()].decode('utf-8'))
+                        spans.append((before, before + len(
+                            match.group(0).decode('utf-8'))))
+
+            hits.append(ScanHit(self.hit(i), spans, self.columns['docids'][i]))
+
+        return hits
+
+    # number of verses matching a pattern - each verse is counted at its
+    # first match and the search goes on from the next verse
+    def count_matches(self, pattern, flags=0):
+
+        return sum(1 for i, first in
+                   self.matching(compile_pattern(pattern, flags)))
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+
+import re
+import string
+import unicodedata
+
+# a token as split by the sqlite fts4 'simple' tokenizer - a run of ascii
+# letters and digits and/or any characters outside of ascii
+TOKEN_PATTERN = re.compile('[0-9A-Za-z\u0080-\U0010ffff]+')
+
+# the 'simple' tokenizer only folds the case of ascii letters
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+# fts query operators - a search term equal to one of these is not a term
+QUERY_OPERATORS = ('AND', 'OR', 'NOT', 'NEAR')
+
+# the proximity operator, optionally with the largest number of tokens
+# allowed between its terms ('NEAR/3') - 'near/3' is two plain terms
+NEAR_OPERATOR = re.compile('NEAR(/[0-9]+)?')
+
+
+# split text into the tokens the fts index holds for it
+def tokenize(text):
+    return [token.translate(ASCII_LOWER)
+            for token in TOKEN_PATTERN.findall(text)]
+
+
+# the indexed token a search term stands for if it is a single plain term
+# (no operators, phrases, prefixes or column filters), otherwise None
+def single_token(search_term):
+
+    search_term = search_term.strip()
+
+    if search_term in QUERY_OPERATORS or \
+       TOKEN_PATTERN.fullmatch(search_term) is None:
+        return None
+
+    return search_term.translate(ASCII_LOWER)
+
+
+# words ending in -que, -ne or -ve (after folding) that are not a word
+# followed by the enclitic
+QUE_EXCEPTIONS = {'atque', 'neque', 'quoque', 'itaque', 'usque', 'namque',
+                  'quisque', 'quaeque', 'quodque', 'quidque', 'quicque',
+                  'cuiusque', 'cuique', 'quemque', 'quamque', 'quaque',
+                  'quique', 'quorumque', 'quarumque', 'quibusque',
+                  'quosque', 'quasque', 'uterque', 'utraque', 'utrumque',
+                  'utriusque', 'utrique', 'utrosque', 'utrasque', 'ubique',
+                  'undique', 'denique', 'utique', 'plerumque', 'quandoque',
+                  'cumque', 'absque', 'aeque', 'inique', 'oblique',
+                  'peraeque', 'susque', 'utcumque', 'quocumque'}
+NE_EXCEPTIONS = {'bene', 'sine', 'paene', 'pene', 'mane', 'nonne'}
+VE_EXCEPTIONS = {'siue', 'neue'}
+
+# pronouns the enclitic -ne attaches to that the suffix rule below misses
+NE_STEMS = {'egone': 'ego', 'tune': 'tu', 'nonne': 'non'}
+
+
+# fold a token for the normalized index - lowercase, diacritics removed,
+# ligatures expanded, and 'j' / 'v' spelled as 'i' / 'u'
+def fold(token):
+
+    token = unicodedata.normalize('NFD', token.lower())
+    token = ''.join(ch for ch in token if not unicodedata.combining(ch))
+
+    return token.replace('æ', 'ae').replace('œ', 'oe').replace(
+        'j', 'i').replace('v', 'u')
+
+
+# the word a folded token consists of if it ends in one of the enclitics
+# -que, -ne or -ve, otherwise None. -ne and -ve are far more often part of
+# the word itself (ratione, carmine, breve...), so they are only split off
+# after a consonant ending (estne, uidesne, plusue) or a known pronoun
+def split_enclitic(token):
+
+    if token.endswith('que'):
+        stem = token[:-3]
+        if len(stem) >= 2 and token not in QUE_EXCEPTIONS:
+            return stem
+
+    elif token in NE_STEMS:
+        return NE_STEMS[token]
+
+    elif token.endswith('ne'):
+        stem = token[:-2]
+        if len(stem) >= 3 and stem[-1] in 'st' and token not in NE_EXCEPTIONS:
+            return stem
+
+    elif token.endswith('ue'):
+        stem = token[:-2]
+        if len(stem) >= 3 and stem[-1] not in 'aeiouyq' and \
+           token not in VE_EXCEPTIONS:
+            return stem
+
+    return None
+
+
+# tokens of the normalized index for some text - each folded token, preceded
+# by the word it consists of if it carries an enclitic, so 'arma' also finds
+# 'armaque' while 'armaque' still only finds 'armaque'
+def normalize_tokens(text):
+
+    for token in TOKEN_PATTERN.findall(text):
+        token = fold(token)
+
+        stem = split_enclitic(token)
+        if stem is not None:
+            yield stem
+
+        yield token
+
+
+# normalized form of a passage, as stored in the normalized index
+def normalize(text):
+    return ' '.join(normalize_tokens(text))
+
+
+# rewrite an fts search term for the normalized index - terms are folded
+# (and expanded like the index inside "phrases"), operators and the rest
+# of the query syntax are kept as they are
+def normalize_search_term(search_term):
+
+    parts = re.split('("[^"]*")', search_term)
+
+    for i in range(len(parts)):
+
+        # phrase - adjacent tokens must line up with the index
+        if parts[i].startswith('"'):
+            parts[i] = TOKEN_PATTERN.sub(
+                lambda m: ' '.join(normalize_tokens(m.group(0))), parts[i])
+
+        else:
+            parts[i] = TOKEN_PATTERN.sub(
+                lambda m: m.group(0) if m.group(0) in QUERY_OPERATORS
+                else fold(m.group(0)), parts[i])
+
+    return ''.join(parts)
+
+
+# the trigrams of a token of the index, which is padded with '$' at both
+# ends so the first and last characters count as much as the others
+def trigrams(token):
+
+    token = '$' + token + '$'
+
+    return sorted(set(token[i:i + 3] for i in range(len(token) - 2)))
+
+
+# edit distance between two words - the number of single character
+# insertions, deletions, substitutions and swaps of adjacent characters
+# turning one into the other. with a 'limit', any distance above it is
+# returned as limit + 1, which is found sooner
+def edit_distance(a, b, limit=None):
+
+    if limit is not None and abs(len(a) - len(b)) > limit:
+        return limit + 1
+
+    before, previous = None, list(range(len(b) + 1))
+
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]))
+
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and \
+               a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+
+        # no later row can be less than the two rows before it
+        if limit is not None and min(current) > limit and \
+           min(previous) > limit:
+            return limit + 1
+
+        before, previous = previous, current
+
+    if limit is not None:
+        return min(previous[-1], limit + 1)
+
+    return previous[-1]
@@ -0,0 +1,297 @@
+#!/usr/bin/python3
+
+import json
+import time
+import sqlite3
+import threading
+import http.client
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# free translation api used for english search terms
+TRANSLATION_URL = 'http://mymemory.translated.net/api/get'
+
+# language pair of english search terms
+LANGPAIR = 'en|la'
+
+# sqlite database the translations are cached in - kept apart from the
+# search database, which is opened read-only and cleared by rebuilds
+TRANSLATION_CACHE = 'translations.db'
+
+# translations are fetched again once they are older than this (seconds)
+CACHE_TTL = 30 * 24 * 60 * 60
+
+# maximum number of translations kept in the cache
+CACHE_ENTRIES = 100000
+
+# maximum number of api requests started per second by a client
+REQUEST_RATE = 5
+
+# number of concurrent requests made by translate_many
+WORKERS = 8
+
+# http (or api response) statuses worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# persistent cache of translations keyed on (phrase, langpair) - entries
+# expire after 'ttl' seconds, and once there are more than 'max_entries'
+# the least recently used ones are evicted. safe to share between threads
+class TranslationCache:
+
+    def __init__(self, path=TRANSLATION_CACHE, ttl=CACHE_TTL,
+                 max_entries=CACHE_ENTRIES):
+
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        # opened on first use, so creating a cache touches no file
+        self.db = None
+        self.lock = threading.Lock()
+
+    # connection to the cache database, created on first use
+    def connection(self):
+
+        if self.db is None:
+            self.db = sqlite3.connect(self.path, isolation_level=None,
+                                      check_same_thread=False)
+            self.db.execute('''CREATE TABLE IF NOT EXISTS translation
+                                   (phrase text, langpair text,
+                                    translation text, fetched real,
+                                    used real,
+                                    PRIMARY KEY (phrase, langpair))
+                               WITHOUT ROWID''')
+            self.db.execute('''CREATE INDEX IF NOT EXISTS translation_used
+                               ON translation (used)''')
+
+        return self.db
+
+    # cached translation of a phrase, or None if it is missing or expired
+    def get(self, phrase, langpair=LANGPAIR):
+
+        now = time.time()
+
+        with self.lock:
+            db = self.connection()
+            row = db.execute('''SELECT translation, fetched FROM translation
+                                WHERE phrase = ? AND langpair = ?''',
+                             [phrase, langpair]).fetchone()
+
+            if row is None or now - row[1] > self.ttl:
+                return None
+
+            db.execute('''UPDATE translation SET used = ?
+                          WHERE phrase = ? AND langpair = ?''',
+                       [now, phrase, langpair])
+
+        return row[0]
+
+    # store the translation of a phrase, evicting entries beyond the limits
+    def put(self, phrase, langpair, translation):
+
+        now = time.time()
+
+        with self.lock:
+            db = self.connection()
+            db.execute('BEGIN')
+            db.execute('''INSERT OR REPLACE INTO translation
+                          VALUES (?, ?, ?, ?, ?)''',
+                       [phrase, langpair, translation, now, now])
+
+            # expired entries, then the least recently used ones
+            db.execute('DELETE FROM translation WHERE fetched < ?',
+                       [now - self.ttl])
+            excess = db.execute('SELECT COUNT(*) FROM translation'
+                                ).fetchone()[0] - self.max_entries
+            if excess > 0:
+                db.execute('''DELETE FROM translation
+                              WHERE (phrase, langpair) IN
+                              (SELECT phrase, langpair FROM translation
+                               ORDER BY used LIMIT ?)''', [excess])
+            db.execute('COMMIT')
+
+    def close(self):
+
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
+
+
+# spaces out events shared by many threads so that no more than 'rate'
+# happen per second (no limit if rate is None)
+class RateLimiter:
+
+    def __init__(self, rate=REQUEST_RATE):
+
+        self.interval = 0 if rate is None else 1 / rate
+        self.next = 0
+        self.lock = threading.Lock()
+
+    # wait until the next event may happen
+    def wait(self):
+
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
+
+
+# client of the MyMemory translation api - requests are made in-process
+# over a keep-alive connection per thread, with a timeout and retries, and
+# translations are served from a persistent cache when possible
+class TranslationClient:
+
+    def __init__(self, url=TRANSLATION_URL, cache=None, timeout=10,
+                 retries=2, backoff=0.5, rate=REQUEST_RATE):
+
+        self.cache = TranslationCache() if cache is None else cache
+        self.limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+        url = urllib.parse.urlsplit(url)
+        self.scheme = url.scheme
+        self.host = url.netloc
+        self.path = url.path
+
+        # connection of each thread
+        self.local = threading.local()
+        self.connections = []
+        self.lock = threading.Lock()
+
+    # connection of the calling thread, created on first use
+    def connection(self):
+
+        conn = getattr(self.local, 'conn', None)
+
+        if conn is None:
+            if self.scheme == 'https':
+                conn = http.client.HTTPSConnection(self.host,
+                                                   timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(self.host,
+                                                  timeout=self.timeout)
+
+            self.local.conn = conn
+            with self.lock:
+                self.connections.append(conn)
+
+        return conn
+
+    # request the translation of a phrase from the api - like the api, a
+    # phrase without an appropriate translation is returned unchanged
+    def fetch(self, phrase, langpair=LANGPAIR):
+
+        query = urllib.parse.urlencode({'q': phrase, 'langpair': langpair})
+
+        attempt = 0
+        while True:
+            try:
+                self.limiter.wait()
+                conn = self.connection()
+                conn.request('GET', self.path + '?' + query)
+                response = conn.getresponse()
+                body = response.read()
+
+                # the api reports some errors (e.g. its rate limit) in the
+                # response body with an http status of 200
+                status = response.status
+                if status == 200:
+                    result = json.loads(body.decode('utf-8'))
+                    status = int(result.get('responseStatus', 200))
+
+                if status not in RETRY_STATUSES:
+                    break
+
+                # server asked us to wait
+                delay = response.getheader('Retry-After')
+                error = http.client.HTTPException(
+                    str(status) + ' ' + phrase)
+
+            except (OSError, http.client.HTTPException) as e:
+
+                # drop the broken connection, a new one is opened on retry
+                conn.close()
+                delay = None
+                error = e
+
+            if attempt >= self.retries:
+                raise error
+
+            if delay is not None and delay.isdigit():
+                time.sleep(int(delay))
+            else:
+                time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+        if status != 200:
+            raise http.client.HTTPException(str(status) + ' ' + phrase)
+
+        return result['responseData']['translatedText']
+
+    # translate a phrase, from the cache if it was translated before
+    def translate(self, phrase, langpair=LANGPAIR):
+
+        phrase = phrase.strip()
+
+        translation = self.cache.get(phrase, langpair)
+        if translation is None:
+            translation = self.fetch(phrase, langpair)
+            self.cache.put(phrase, langpair, translation)
+
+        return translation
+
+    # translate many phrases concurrently, with at most 'workers' requests
+    # in flight (and no more than the client's rate started per second).
+    # duplicate phrases are translated once and cached phrases need no
+    # request. yields (phrase, translation) pairs as they finish - with
+    # 'errors', a phrase that could not be translated is yielded with the
+    # exception instead of stopping the others
+    def translate_many(self, phrases, langpair=LANGPAIR, workers=WORKERS,
+                       errors=False):
+
+        # unique phrases, in order
+        phrases = list(dict.fromkeys(phrase.strip() for phrase in phrases))
+
+        # cached translations first - they are ready now
+        missing = []
+        for phrase in phrases:
+            translation = self.cache.get(phrase, langpair)
+            if translation is None:
+                missing.append(phrase)
+            else:
+                yield phrase, translation
+
+        if len(missing) == 0:
+            return
+
+        pool = ThreadPoolExecutor(workers)
+        try:
+            futures = {pool.submit(self.translate, phrase, langpair): phrase
+                       for phrase in missing}
+            for future in as_completed(futures):
+                if errors and future.exception() is not None:
+                    yield futures[future], future.exception()
+                else:
+                    yield futures[future], future.result()
+
+        # stop requests that have not started if the caller stops early or
+        # a request fails
+        finally:
+            pool.shutdown(cancel_futures=True)
+
+    # close the connections of all threads and the cache
+    def close(self):
+
+        with self.lock:
+            for conn in self.connections:
+                conn.close()
+            self.connections = []
+
+        self.cache.close()
@@ -0,0 +1,95 @@
+#!/usr/bin/python3
+
+import array
+import bisect
+import heapq
+import sqlite3
+from latin_library.text import fold
+
+# completions returned for a prefix
+COMPLETIONS = 10
+
+# prefixes matching more words than this have their completions kept once
+# found, rather than picking the most common words again on every call
+SCAN_LIMIT = 256
+
+
+# the words of the normalized index in sorted order, with the number of
+# verses containing each - answers prefix queries by binary search
+class Vocabulary:
+
+    def __init__(self, terms, documents):
+
+        # terms[i] is in documents[i] verses
+        self.terms = terms
+        self.documents = documents
+
+        # word indexes from the most to the least common (words in the same
+        # number of verses in alphabetical order), and the position of each
+        # word in that order, so the most common words of a prefix are the
+        # smallest ranks of its range
+        self.order = array.array('I', sorted(range(len(terms)),
+                                             key=documents.__getitem__,
+                                             reverse=True))
+        self.rank = array.array('I', [0]) * len(terms)
+        for position, i in enumerate(self.order):
+            self.rank[i] = position
+
+        # completions of prefixes matching more than SCAN_LIMIT words
+        self.popular = {}
+
+    # vocabulary of a database built by parse_data - read from latin_vocab,
+    # or through fts4aux from the normalized index of databases built
+    # before latin_vocab existed
+    @classmethod
+    def from_connection(cls, db):
+
+        try:
+            rows = db.execute('''SELECT term, documents FROM latin_vocab
+                                 ORDER BY term''').fetchall()
+
+        except sqlite3.OperationalError:
+            db.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS
+                          temp.latin_norm_terms
+                          USING fts4aux(main, latin_norm_fts)''')
+            rows = db.execute('''SELECT term, documents
+                                 FROM temp.latin_norm_terms
+                                 WHERE col = '*' ORDER BY term''').fetchall()
+
+        return cls([row[0] for row in rows],
+                   array.array('I', (row[1] for row in rows)))
+
+    def __len__(self):
+        return len(self.terms)
+
+    # (start, end) indexes of the words beginning with a folded prefix
+    def prefix_range(self, prefix):
+
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\U0010ffff', start)
+
+        return start, end
+
+    # the words beginning with a prefix as (word, number of verses), at
+    # most 'limit' of them, most common first (then in alphabetical order)
+    def complete(self, prefix, limit=COMPLETIONS):
+
+        prefix = fold(prefix.strip())
+        if prefix == '':
+            return []
+
+        start, end = self.prefix_range(prefix)
+
+        large = end - start > SCAN_LIMIT
+        if large and (prefix, limit) in self.popular:
+            return self.popular[(prefix, limit)]
+
+        completions = [(self.terms[i], self.documents[i])
+                       for i in (self.order[position] for position in
+                                 heapq.nsmallest(limit,
+                                                 self.rank[start:end]))]
+
+        if large:
+            self.popular[(prefix, limit)] = completions
+
+        return completions
@@ -0,0 +1,47 @@
+import sqlite3
+import pytest
+
+from latin_library import parse_data
+
+# rows of the fixture database, one list of items per book link
+fixture_books = {
+    'www.thelatinlibrary.com/vergil/aen1.shtml': [
+        ['Vergil', 'Aeneid I', 'Latin', 'P. Vergilius Maro', '70 - 19 B.C.',
+         'null', 1, 'Arma virumque cano, Troiae qui primus ab oris',
+         'www.thelatinlibrary.com/vergil/aen1.shtml'],
+        ['Vergil', 'Aeneid I', 'Latin', 'P. Vergilius Maro', '70 - 19 B.C.',
+         'null', 2, 'Italiam, fato profugus, Laviniaque venit',
+         'www.thelatinlibrary.com/vergil/aen1.shtml'],
+        ['Vergil', 'Aeneid I', 'Latin', 'P. Vergilius Maro', '70 - 19 B.C.',
+         'null', 3, 'litora, multum ille et terris iactatus et alto',
+         'www.thelatinlibrary.com/vergil/aen1.shtml']],
+    'www.thelatinlibrary.com/silius/punica1.shtml': [
+        ['Silius', 'Punica I', 'Latin', 'Silius Italicus', '28 - 103 A.D.',
+         'null', 1, 'Ordior arma, quibus caelo se gloria tollit',
+         'www.thelatinlibrary.com/silius/punica1.shtml'],
+        ['Silius', 'Punica I', 'Latin', 'Silius Italicus', '28 - 103 A.D.',
+         'null', 2, 'Aeneadum, patiturque ferox Oenotria iura',
+         'www.thelatinlibrary.com/silius/punica1.shtml']]}
+
+
+# rows of the fixture database
+@pytest.fixture
+def books():
+    return fixture_books
+
+
+# build the fixture database in a temporary directory
+@pytest.fixture
+def database(tmp_path):
+
+    path = str(tmp_path / 'latin_library.db')
+
+    db = sqlite3.connect(path)
+    c = db.cursor()
+    parse_data.create_schema(c)
+    for link, items in fixture_books.items():
+        parse_data.replace_book_rows(c, link, items)
+    db.commit()
+    db.close()
+
+    return path
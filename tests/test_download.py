@@ -0,0 +1,146 @@
+import os
+import time
+import threading
+import functools
+import pytest
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from latin_library.download import Downloader
+
+# fixture pages served by the local stand-in for thelatinlibrary.com
+pages = {'verg.html': '<html><a href="vergil/aen1.shtml">Liber I</a>'
+                      '<a href="vergil/aen2.shtml">Liber II</a>'
+                      '<a href="/index.html">Home</a>'
+                      '<a href="http://example.com/elsewhere.html">x</a>'
+                      '</html>',
+         'vergil/aen1.shtml': '<html>arma virumque cano</html>',
+         'vergil/aen2.shtml': '<html>conticuere omnes</html>',
+         'index.html': '<html>The Latin Library</html>'}
+
+
+# keep-alive static file handler that counts connections and can fail the
+# first request for each path to exercise retries
+class FixtureHandler(SimpleHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        if self.path in self.server.fail_once:
+            self.server.fail_once.remove(self.path)
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        super().do_GET()
+
+    def log_message(self, *args):
+        pass
+
+
+# write the fixture site to 'site' and serve it on a free localhost port
+def serve_fixture(site, fail_once=()):
+
+    for path, text in pages.items():
+        os.makedirs(os.path.dirname(os.path.join(site, path)), exist_ok=True)
+        with open(os.path.join(site, path), 'w') as f:
+            f.write(text)
+
+    handler = functools.partial(FixtureHandler, directory=str(site))
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.connections = 0
+    server.fail_once = set(fail_once)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+# test that a collection and its linked pages are mirrored with the layout
+# the parsers expect, over no more connections than worker threads
+def test_download_layout(tmp_path):
+
+    server = serve_fixture(tmp_path / 'site')
+    root = str(tmp_path / 'www.thelatinlibrary.com') + '/'
+    base_url = 'http://127.0.0.1:' + str(server.server_port) + '/'
+
+    downloader = Downloader(base_url, root, workers=2, backoff=0)
+    statuses = downloader.download_collections(['verg'])
+    downloader.close()
+    server.shutdown()
+
+    # every same-site page was downloaded, the off-site link was not
+    assert sorted(statuses) == sorted(pages)
+    assert set(statuses.values()) == {'downloaded'}
+    for path, text in pages.items():
+        with open(root + path) as f:
+            assert f.read() == text
+
+    # connections are reused between requests
+    assert server.connections <= 2
+
+
+# test that unchanged pages are revalidated instead of downloaded again and
+# that a changed page is downloaded
+def test_download_conditional_get(tmp_path):
+
+    server = serve_fixture(tmp_path / 'site')
+    root = str(tmp_path / 'www.thelatinlibrary.com') + '/'
+    base_url = 'http://127.0.0.1:' + str(server.server_port) + '/'
+
+    Downloader(base_url, root, backoff=0).download_collections(['verg'])
+
+    # change one page, with a modification time the server will report
+    changed = tmp_path / 'site' / 'vergil' / 'aen2.shtml'
+    changed.write_text('<html>conticuere omnes intentique ora tenebant</html>')
+    os.utime(changed, (time.time() + 10, time.time() + 10))
+
+    # a new downloader reads the validators saved by the first one
+    statuses = Downloader(base_url, root,
+                          backoff=0).download_collections(['verg'])
+    server.shutdown()
+
+    assert statuses['vergil/aen2.shtml'] == 'downloaded'
+    assert statuses['vergil/aen1.shtml'] == 'not modified'
+    assert statuses['verg.html'] == 'not modified'
+    with open(root + 'vergil/aen2.shtml') as f:
+        assert 'intentique' in f.read()
+
+
+# test that a temporarily failing page is retried
+def test_download_retry(tmp_path):
+
+    server = serve_fixture(tmp_path / 'site', fail_once=['/vergil/aen1.shtml'])
+    root = str(tmp_path / 'www.thelatinlibrary.com') + '/'
+    base_url = 'http://127.0.0.1:' + str(server.server_port) + '/'
+
+    statuses = Downloader(base_url, root,
+                          backoff=0).download_collections(['verg'])
+    server.shutdown()
+
+    assert statuses['vergil/aen1.shtml'] == 'downloaded'
+    assert server.fail_once == set()
+
+
+# test that links leading out of the mirror, plainly or percent-encoded,
+# are skipped like links to other hosts
+def test_download_stays_in_mirror(tmp_path):
+
+    root = str(tmp_path / 'www.thelatinlibrary.com') + '/'
+    os.makedirs(root)
+    with open(root + 'verg.html', 'w') as f:
+        f.write('<html><a href="vergil/aen1.shtml">Liber I</a>'
+                '<a href="%2e%2e/%2e%2e/etc/x.html">x</a>'
+                '<a href="vergil/%2E%2E/..%2f..%2fx.html">x</a>'
+                '<a href="/%2fetc/x.html">x</a></html>')
+
+    downloader = Downloader('http://127.0.0.1:1/', root)
+    assert downloader.page_links('verg.html') == ['/vergil/aen1.shtml']
+
+    assert downloader.local_path('vergil/') == root + 'vergil/index.html'
+    assert downloader.local_path('/%2e%2e/%2e%2e/etc/x.html') is None
+    with pytest.raises(ValueError):
+        downloader.fetch('/%2e%2e/%2e%2e/etc/x.html')
@@ -0,0 +1,419 @@
+import sqlite3
+import itertools
+import pytest
+
+from latin_library import parse_data
+from latin_library import query
+from latin_library.lemma import LookupLemmatizer
+
+# books of the fake collections, in URL_EXTENSIONS order, as (book, lines)
+# - a line starting with '#' is a chapter heading, so the first verses of
+# 'Variae II' carry the last chapter of 'Variae I'
+fake_library = [
+    [('Variae I', ['# Epistula 1', 'Arma virumque cano', 'Troiae qui primus',
+                   '# Epistula 2', 'ab oris Italiam']),
+     ('Variae II', ['fato profugus', 'Laviniaque venit', '# Epistula 3',
+                    'litora multum ille'])],
+    [('Thebais I', ['Fraternas acies alternaque regna'])],
+    [('Aeneid I', ['et terris iactatus et alto', 'ui superum saeuae']),
+     ('Aeneid II', ['Conticuere omnes intentique ora tenebant'])],
+    [('Punica I', ['Ordior arma, quibus caelo se gloria tollit'])]]
+
+
+# link of a book of the fake library
+def fake_link(collection_num, book):
+    return parse_data.URL_ROOT + parse_data.URL_EXTENSIONS[collection_num] + \
+        '/' + book.replace(' ', '_') + '.html'
+
+
+# write the collection and book pages of a fake library to the working
+# directory - a collection page lists its books, one 'book<tab>link' a line
+def write_library(library):
+
+    for collection_num, books in enumerate(library):
+        page = ''
+        for book, lines in books:
+            link = fake_link(collection_num, book)
+            page += book + '\t' + link + '\n'
+            with open(link, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines))
+
+        with open(parse_data.URL_ROOT + parse_data.URL_EXTENSIONS[
+                collection_num] + '.html', 'w', encoding='utf-8') as f:
+            f.write(page)
+
+
+# index parser of a collection of the fake library
+def fake_index_parser(collection_num):
+
+    def parse_index():
+
+        title = parse_data.URL_EXTENSIONS[collection_num].capitalize()
+        with open(parse_data.URL_ROOT + parse_data.URL_EXTENSIONS[
+                collection_num] + '.html', encoding='utf-8') as f:
+            books, links = zip(*(line.split('\t')
+                                 for line in f.read().splitlines()))
+
+        return title, 'Auctor', 'null', list(books), list(links)
+
+    return parse_index
+
+
+# book parser of the fake library - verses are numbered from each heading,
+# and verses before the first heading carry the previous book's chapter
+def parse_fake_book(book_num, book, link, title, author, dates):
+
+    items = []
+    chapter = parse_data.CARRIED_CHAPTER
+    verse = 0
+
+    with open(link, encoding='utf-8') as f:
+        for line in f.read().splitlines():
+            if line.startswith('#'):
+                chapter, verse = line[1:].strip(), 0
+            else:
+                verse += 1
+                items.append([title, book, 'Latin', author, dates, chapter,
+                              verse, line, link])
+
+    return items, chapter
+
+
+# the fake library in a temporary working directory, parsed by the fake
+# parsers - worker processes are forked, so they see the patched parsers
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+
+    monkeypatch.chdir(tmp_path)
+    for extension in parse_data.URL_EXTENSIONS:
+        (tmp_path / parse_data.URL_ROOT / extension).mkdir(parents=True)
+
+    monkeypatch.setattr(parse_data, 'COLLECTION_PARSERS', [
+        (fake_index_parser(collection_num), parse_fake_book)
+        for collection_num in range(len(fake_library))])
+
+    library = [list(books) for books in fake_library]
+    write_library(library)
+
+    return library
+
+
+# test that parsing in a pool gives the same rows in the same order as
+# parsing serially, with chapters carried over between books
+def test_pool_parse(library):
+
+    items = list(parse_data.parse_collections(1))
+    assert list(parse_data.parse_collections(2)) == items
+
+    assert [(item[1], item[5], item[6]) for item in items[:6]] == [
+        ('Variae I', 'Epistula 1', 1), ('Variae I', 'Epistula 1', 2),
+        ('Variae I', 'Epistula 2', 1), ('Variae II', 'Epistula 2', 1),
+        ('Variae II', 'Epistula 2', 2), ('Variae II', 'Epistula 3', 1)]
+
+    # chapters are not carried into the next collection
+    assert items[6][1:2] + items[6][5:6] == ['Thebais I', 'null']
+
+
+# rows of the fts table of a database in docid order
+def corpus_rows(database):
+
+    db = sqlite3.connect(database)
+    rows = db.execute('SELECT docid, * FROM latin_fts ORDER BY docid')
+    rows = rows.fetchall()
+    db.close()
+
+    return rows
+
+
+# docids of the verses of each book of a database
+def book_docids(database):
+
+    db = sqlite3.connect(database)
+    docids = {}
+    for docid, link in db.execute('SELECT docid, link FROM latin_fts'):
+        docids.setdefault(link, []).append(docid)
+    db.close()
+
+    return docids
+
+
+# test that books keep their place in docid order through incremental
+# updates, which give the same rows in the same order as a fresh build, and
+# that the books around an added, moved or removed book keep their docids
+@pytest.mark.parametrize('normalized', [False, True])
+def test_update_keeps_corpus_order(library, normalized):
+
+    parse_data.update_database(database='incremental.db',
+                               normalized=normalized)
+    docids = book_docids('incremental.db')
+
+    # change the first book (and so the chapter carried into the second),
+    # insert a book before the last one of a collection (which is numbered
+    # anew) and add one at the end of another
+    library[0][0] = ('Variae I', ['# Epistula 1', 'Arma virumque cano'])
+    library[2].insert(1, ('Aeneid Ia', ['Musa, mihi causas memora']))
+    library[3].append(('Punica II', ['Iamque deum regnator']))
+    write_library(library)
+    assert parse_data.update_database(database='incremental.db') == 5
+
+    # move a book to the front of its collection and remove another
+    library[0].reverse()
+    library[3].pop()
+    write_library(library)
+    parse_data.update_database(database='incremental.db')
+
+    parse_data.update_database(database='fresh.db', normalized=normalized)
+    rows = corpus_rows('incremental.db')
+    assert [row[1:] for row in rows] == \
+        [row[1:] for row in corpus_rows('fresh.db')]
+
+    books = []
+    for row in rows:
+        if row[4] not in books:
+            books.append(row[4])
+    assert books == ['Variae II', 'Variae I', 'Thebais I', 'Aeneid I',
+                     'Aeneid Ia', 'Aeneid II', 'Punica I']
+
+    # the books that were not added or moved kept their block of docids
+    kept = book_docids('incremental.db')
+    for collection_num, book in ((0, 'Variae I'), (1, 'Thebais I'),
+                                 (2, 'Aeneid I'), (2, 'Aeneid II'),
+                                 (3, 'Punica I')):
+        link = fake_link(collection_num, book)
+        assert kept[link][0] == docids[link][0]
+
+
+# test that books are given blocks of docids BLOCK_GAP apart, that books
+# added between others take blocks in the gaps while the others keep theirs,
+# and that a collection is spread out anew once a gap is used up
+def test_book_blocks():
+
+    def tasks(collection_num, links):
+        return [(collection_num, book_num, link, link, 'Title', 'Auctor',
+                 'null') for book_num, link in enumerate(links)]
+
+    gap = parse_data.BLOCK_GAP
+    first = parse_data.COLLECTION_BLOCKS
+    blocks = parse_data.book_blocks(tasks(0, ['a', 'b']) +
+                                    tasks(1, ['c', 'd', 'h']), {})
+    assert blocks == {'a': gap, 'b': 2 * gap, 'c': first + gap,
+                      'd': first + 2 * gap, 'h': first + 3 * gap}
+
+    # 'c' moved to the end, 'e' inserted between 'd' and 'h' and 'f' added
+    blocks = parse_data.book_blocks(tasks(1, ['d', 'e', 'h', 'c', 'f']),
+                                    blocks)
+    assert blocks == {'d': first + 2 * gap, 'e': first + 2 * gap + gap // 2,
+                      'h': first + 3 * gap, 'c': first + 4 * gap,
+                      'f': first + 5 * gap}
+
+    # no room between two books
+    blocks = parse_data.book_blocks(tasks(0, ['a', 'g', 'b']),
+                                    {'a': 1, 'b': 2})
+    assert blocks == {'a': gap, 'g': 2 * gap, 'b': 3 * gap}
+
+
+# test that a database indexed before books kept their place, with its
+# rows in another order and no manifest, is put back in corpus order
+def test_update_places_books(library):
+
+    db = sqlite3.connect('old.db')
+    c = db.cursor()
+    parse_data.create_schema(c)
+    books = itertools.groupby(parse_data.parse_collections(),
+                              key=lambda item: item[8])
+    books = [(link, list(items)) for link, items in books]
+    for link, items in reversed(books):
+        parse_data.replace_book_rows(c, link, items)
+    db.commit()
+    db.close()
+
+    assert parse_data.update_database(database='old.db') == 6
+    parse_data.update_database(database='fresh.db')
+    assert corpus_rows('old.db') == corpus_rows('fresh.db')
+
+
+# build generation of a database
+def generation(database):
+
+    db = sqlite3.connect(database)
+    version = db.execute('PRAGMA user_version').fetchone()[0]
+    db.close()
+
+    return version
+
+
+# test that an update only re-parses the books whose pages changed and the
+# books whose carried chapter changed, and drops removed books
+def test_update_reparses_changed_books(library):
+
+    assert parse_data.update_database(database='test.db') == 6
+    rows = corpus_rows('test.db')
+
+    # nothing changed - the database and its generation are kept
+    assert parse_data.update_database(database='test.db') == 0
+    assert corpus_rows('test.db') == rows and generation('test.db') == 1
+
+    db = sqlite3.connect('test.db')
+    assert db.execute('''SELECT chapter_in, chapter_out FROM latin_manifest
+                         WHERE link = ?''',
+                      [fake_link(0, 'Variae II')]).fetchone() == \
+        ('Epistula 2', 'Epistula 3')
+    db.close()
+
+    # a changed book page
+    library[0][1] = ('Variae II', library[0][1][1] + ['uenit'])
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 1
+    assert generation('test.db') == 2
+
+    # a new last chapter of the first book is carried into the second
+    library[0][0] = ('Variae I', ['# Epistula 1', 'Arma virumque cano',
+                                  '# Epistula 9', 'ab oris Italiam'])
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 2
+    assert [row[5:7] for row in corpus_rows('test.db')
+            if row[4] == 'Variae II'] == [
+        ('Epistula 9', 1), ('Epistula 9', 2), ('Epistula 3', 1),
+        ('Epistula 3', 2)]
+
+    # a book added at the end of a collection is the only book parsed,
+    # whereas a book inserted before others also changes their numbers
+    library[1].append(('Thebais II', ['Iamque per Ogygias']))
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 1
+    library[1].insert(0, ('Achilleis', ['Magnanimum Aeaciden']))
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 3
+
+    # a removed book is deleted without parsing any other
+    library[2].pop()
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 0
+    assert generation('test.db') == 6
+
+    db = sqlite3.connect('test.db')
+    assert db.execute('''SELECT count(*) FROM latin_text
+                         WHERE book = 'Aeneid II' ''').fetchone()[0] == 0
+    assert db.execute('SELECT count(*) FROM latin_manifest').fetchone()[0] == 7
+    assert db.execute('''SELECT count(*) FROM latin_norm_fts
+                         WHERE passage MATCH 'conticuere' ''').fetchone()[0] \
+        == 0
+    db.close()
+
+
+# test that parsing the changed books in a pool gives the same database as
+# parsing them serially
+def test_pool_update(library):
+
+    assert parse_data.update_database(2, database='pool.db') == 6
+    parse_data.update_database(database='serial.db')
+    assert corpus_rows('pool.db') == corpus_rows('serial.db')
+
+    library[0][0] = ('Variae I', ['# Epistula 1', 'Arma virumque cano'])
+    write_library(library)
+    assert parse_data.update_database(2, database='pool.db') == 2
+    parse_data.update_database(database='serial.db')
+    assert corpus_rows('pool.db') == corpus_rows('serial.db')
+
+
+# test that update_database creates a database with the layout asked for,
+# which later updates keep, and that both layouts hold the same rows
+def test_update_layouts(library):
+
+    parse_data.update_database(database='normalized.db', normalized=True)
+    parse_data.update_database(database='plain.db')
+
+    library[0][1] = ('Variae II', ['fato profugus', 'uenit'])
+    write_library(library)
+    assert parse_data.update_database(database='normalized.db') == 1
+    assert parse_data.update_database(database='plain.db',
+                                      normalized=True) == 1
+
+    for database, normalized in (('normalized.db', True), ('plain.db', False)):
+        db = sqlite3.connect(database)
+        assert parse_data.is_normalized(db.cursor()) == normalized
+        db.close()
+
+    assert corpus_rows('normalized.db') == corpus_rows('plain.db')
+
+
+# test that the lemma table is only rebuilt, and the generation only
+# incremented, when the books or the lemma list changed
+def test_update_lemmas(library):
+
+    with open('lemmas.txt', 'w') as f:
+        f.write('arma armo\n')
+
+    parse_data.update_database(database='test.db',
+                               lemmatizer=LookupLemmatizer.from_file())
+    assert generation('test.db') == 1
+
+    # the same list again
+    parse_data.update_database(database='test.db',
+                               lemmatizer=LookupLemmatizer.from_file())
+    assert generation('test.db') == 1
+
+    with open('lemmas.txt', 'w') as f:
+        f.write('arma arma\n')
+    parse_data.update_database(database='test.db',
+                               lemmatizer=LookupLemmatizer.from_file())
+    assert generation('test.db') == 2
+
+    db = sqlite3.connect('test.db')
+    assert db.execute('SELECT * FROM latin_lemma').fetchall() == [
+        ('arma', 'arma')]
+    db.close()
+
+    # new tokens are lemmatized by the next update with a lemma list, and a
+    # lemmatizer without a digest is always run
+    library[3][0] = ('Punica I', ['Ordior arma, quibus caelo'])
+    write_library(library)
+    parse_data.update_database(database='test.db')
+    parse_data.update_database(database='test.db',
+                               lemmatizer=LookupLemmatizer.from_file())
+    parse_data.update_database(database='test.db', lemmatizer=lambda token: [])
+    assert generation('test.db') == 5
+
+
+# test that collections keep their order, and so their chart colors, when
+# the books of the first collection are re-indexed
+def test_update_keeps_collection_order(library):
+
+    parse_data.update_database(database='test.db')
+    corpus = query.Corpus('test.db')
+    titles = ['Cassiodorus', 'Statius', 'Verg', 'Silius']
+    assert corpus.collections() == titles
+
+    library[0] = [('Variae II', ['fato profugus']),
+                  ('Variae I', ['Arma virumque cano'])]
+    write_library(library)
+    assert parse_data.update_database(database='test.db') == 2
+    assert corpus.collections() == titles
+
+    corpus.close()
+
+
+# test that a build into an empty database is bulk loaded, and that an
+# update of an existing database keeps its rollback journal
+def test_update_pragmas(library, monkeypatch):
+
+    applied = []
+    set_pragmas = parse_data.set_pragmas
+
+    def recording_set_pragmas(db, pragmas):
+        applied.append(pragmas)
+        return set_pragmas(db, pragmas)
+    monkeypatch.setattr(parse_data, 'set_pragmas', recording_set_pragmas)
+
+    parse_data.update_database(database='test.db')
+    parse_data.update_database(database='test.db')
+    parse_data.clear_database('test.db')
+    parse_data.update_database(database='test.db')
+    assert applied[::2] == [parse_data.BULK_PRAGMAS,
+                            parse_data.UPDATE_PRAGMAS,
+                            parse_data.BULK_PRAGMAS]
+
+    # the settings are restored after the build
+    db = sqlite3.connect('test.db')
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'delete'
+    db.close()
@@ -0,0 +1,370 @@
+import sqlite3
+import threading
+import pytest
+
+from latin_library import parse_data
+from latin_library import query
+from latin_library import vocabulary
+from latin_library.lemma import LookupLemmatizer
+
+
+# corpus over the fixture database
+@pytest.fixture
+def corpus(database):
+
+    corpus = query.Corpus(database)
+    yield corpus
+    corpus.close()
+
+
+# test that one read-only connection is reused within a thread and that
+# each thread gets its own connection
+def test_connection_reuse(corpus):
+
+    manager = corpus.connections
+    db = manager.connection()
+    assert manager.connection() is db
+
+    # the database cannot be written through a search connection
+    with pytest.raises(sqlite3.OperationalError):
+        db.execute('DELETE FROM latin_text')
+
+    # another thread gets a separate connection
+    other = []
+    thread = threading.Thread(target=lambda: other.append(manager.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not db
+    assert len(manager.connections) == 2
+
+
+# test that paging through results returns every match exactly once and
+# that the count is reported separately
+def test_search_pagination(database, corpus):
+
+    rows = sqlite3.connect(database).execute(
+        "SELECT * FROM latin_fts WHERE passage MATCH 'et OR arma'").fetchall()
+
+    results, after = corpus.page('et OR arma', 2)
+    assert len(results) == 2 and after is not None
+
+    assert list(corpus.search('et OR arma', 2)) == rows
+    assert corpus.count('et OR arma') == len(rows)
+    assert corpus.count('nusquam') == 0
+
+
+# test that ranked search orders verses by relevance and keeps only the top k
+def test_ranked_search(corpus):
+
+    results = corpus.ranked('et OR arma', 5)
+
+    # the verse containing the rarer term twice ranks first
+    assert len(results) == 3
+    assert results[0].passage.startswith('litora')
+    assert all(results[i].score >= results[i + 1].score
+               for i in range(len(results) - 1))
+
+    assert len(corpus.ranked('et OR arma', 1)) == 1
+
+
+# test that repeated queries are served from the cache and that the cache
+# is dropped when the database is rebuilt
+def test_result_cache(database, corpus, books):
+
+    cache = corpus.cache
+    assert corpus.count('arma') == 2
+    assert corpus.count('  ARMA ') == 2
+    assert cache.hits == 1 and cache.misses == 1
+
+    # operators are not folded into terms - 'near/3' is two terms, which
+    # do not share an entry with the proximity operator
+    assert query.normalize_query('Arma  OR et') == 'arma OR et'
+    assert query.normalize_query('arma NEAR/3 virum') == 'arma NEAR/3 virum'
+    assert corpus.count('arma near/3 uirum') == 0
+    assert corpus.count('arma NEAR/3 uirum') == 1
+
+    # rebuild the second book without 'arma' and bump the generation
+    db = sqlite3.connect(database)
+    c = db.cursor()
+    link = 'www.thelatinlibrary.com/silius/punica1.shtml'
+    parse_data.replace_book_rows(c, link, books[link][1:])
+    parse_data.next_generation(c)
+    db.commit()
+    db.close()
+
+    assert corpus.count('arma') == 1
+
+
+# test that the cache evicts least recently used entries beyond its size
+def test_result_cache_eviction():
+
+    cache = query.ResultCache(max_rows=4)
+    cache.lookup('a', 0, lambda: [1, 2])
+    cache.lookup('b', 0, lambda: [1, 2])
+    cache.lookup('a', 0, lambda: [1, 2])
+    cache.lookup('c', 0, lambda: [1])
+
+    # 'b' was the least recently used entry
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.info() == (1, 3, 2, 3)
+
+
+# test that usage counts from the precomputed matrix match the fts query
+def test_usage_matrix(database, corpus):
+
+    db = sqlite3.connect(database)
+    parse_data.build_usage_matrix(db.cursor())
+    db.commit()
+    db.close()
+
+    for term in ['arma', 'ARMA', 'et', 'nusquam']:
+        assert corpus.matrix_usage(term) == corpus.fts_usage(term)
+
+    # only single terms are served from the matrix
+    assert corpus.matrix_usage('arma OR et') is None
+    assert corpus.usage('arma OR et') == corpus.fts_usage('arma OR et')
+
+
+# test that searches match spelling variants and words carrying enclitics
+# through the normalized index
+def test_normalized_search(database, corpus):
+
+    db = sqlite3.connect(database)
+    c = db.cursor()
+    link = 'www.thelatinlibrary.com/ovid/ovid.met1.shtml'
+    parse_data.replace_book_rows(c, link, [
+        ['Ovid', 'Metamorphoses I', 'Latin', 'P. Ovidius Naso',
+         '43 B.C. - 17 A.D.', 'null', 1, 'Iuppiter armaque Iūnonis', link]])
+    parse_data.build_usage_matrix(c)
+    parse_data.next_generation(c)
+    db.commit()
+    db.close()
+
+    # 'arma' also finds 'armaque', 'Juppiter' finds 'Iuppiter'
+    assert corpus.count('arma') == 3
+    assert corpus.count('armaque') == 1
+    assert corpus.count('Juppiter') == 1
+    assert corpus.count('junonis') == 1
+    assert corpus.count('"Arma virumque"') == 1
+
+    # results are returned in their original spelling
+    results = corpus.ranked('juppiter', 5)
+    assert results[0].passage == 'Iuppiter armaque Iūnonis'
+
+    for term in ['arma', 'VIRUM', 'juppiter']:
+        assert corpus.matrix_usage(term) == corpus.fts_usage(term)
+
+
+# test that a lemma search finds every verse containing a form of the lemma
+def test_lemma_search(database, corpus, tmp_path):
+
+    lemmas = tmp_path / 'lemmas.txt'
+    lemmas.write_text('# form lemma(s)\n'
+                      'virum vir\n'
+                      'arma arma armo\n'
+                      'armavit armo\n'
+                      'terris terra\n')
+
+    db = sqlite3.connect(database)
+    c = db.cursor()
+    parse_data.build_lemma_index(
+        c, LookupLemmatizer.from_file(str(lemmas)))
+    parse_data.next_generation(c)
+    db.commit()
+    db.close()
+
+    # only forms that occur in the corpus are stored
+    assert ('armo', 'armauit') not in sqlite3.connect(database).execute(
+        'SELECT lemma, token FROM latin_lemma').fetchall()
+
+    assert corpus.count('Vir', lemma=True) == 1
+    assert corpus.count('armo', lemma=True) == 2
+    assert corpus.count('terra', lemma=True) == 1
+
+    # a word missing from the list is its own lemma
+    assert corpus.count('litora', lemma=True) == 1
+
+    results = list(corpus.search('armo', 1, lemma=True))
+    assert [result.passage[:5] for result in results] == ['Arma ', 'Ordio']
+
+    assert corpus.lemma_usage('armo') == [
+        ('Aeneid I', 1, 'Vergil'), ('Punica I', 1, 'Silius')]
+
+
+# test that results are returned as records with named fields
+def test_result_records(corpus):
+
+    hit = next(corpus.search('litora'))
+    assert isinstance(hit, query.Hit)
+    assert (hit.book, hit.chapter, hit.verse) == ('Aeneid I', 'null', 3)
+
+    ranked = corpus.ranked('arma')[0]
+    assert ranked.title in ('Vergil', 'Silius') and ranked.score > 0
+
+    assert corpus.usage('arma') == [query.BookCount('Aeneid I', 1, 'Vergil'),
+                                    query.BookCount('Punica I', 1, 'Silius')]
+    assert corpus.usage_map('et') == {'Aeneid I': 1}
+    assert corpus.collections() == ['Vergil', 'Silius']
+
+
+# test that concordance lines hold each match with its context, join the
+# tokens of a phrase and only span verses of the same book
+def test_concordance(corpus):
+
+    lines = list(corpus.concordance('et'))
+    assert [(line.left, line.match, line.right) for line in lines] == [
+        ('litora, multum ille ', 'et', ' terris iactatus et alto'),
+        ('litora, multum ille et terris iactatus ', 'et', ' alto')]
+    assert (lines[0].book, lines[0].verse) == ('Aeneid I', 3)
+
+    line, = corpus.concordance('"arma virumque"', width=10)
+    assert (line.left, line.match, line.right) == ('', 'Arma virumque',
+                                                   ' cano, Tro')
+
+    # context runs into the verses around the match
+    line, = corpus.concordance('Laviniaque', width=30, span=1)
+    assert line.left == 'ris / Italiam, fato profugus, '
+    assert line.right == ' venit / litora, multum ille e'
+
+    # the verse before Punica 1 belongs to another book
+    line, = corpus.concordance('Ordior', width=60, span=1)
+    assert line.left == ''
+    assert line.right.endswith(' tollit / Aeneadum, patiturque ')
+
+
+# test that citations find a verse with its neighbours in either layout,
+# with a single range scan of the citation index
+@pytest.mark.parametrize('normalized', [False, True])
+def test_citation_lookup(tmp_path, books, normalized):
+
+    path = str(tmp_path / 'cite.db')
+    db = sqlite3.connect(path)
+    c = db.cursor()
+    parse_data.create_schema(c, normalized)
+    for link, items in books.items():
+        parse_data.replace_book_rows(c, link, items, normalized)
+    db.commit()
+    db.close()
+
+    corpus = query.Corpus(path)
+
+    # book names are exact in verse lookups - a misspelt name looked up
+    # first does not hide the book from the right one
+    assert corpus.verses('aeneid i', 'null', 1, 3) == []
+    assert len(corpus.verses('Aeneid I', 'null', 1, 3)) == 3
+    assert corpus.chapters('aeneid i') == {}
+    assert corpus.chapters('Aeneid I') != {}
+
+    hit, = corpus.cite('Aeneid I 2')
+    assert hit.passage.startswith('Italiam')
+
+    # case and arabic numerals, a collection title, and context
+    assert [hit.verse for hit in corpus.cite('aeneid 1.2', context=1)] == \
+        [1, 2, 3]
+    assert [hit.verse for hit in corpus.cite('Silius Punica I 1', 5)] == [1, 2]
+    assert corpus.cite('Aeneid I 9') == []
+    with pytest.raises(ValueError):
+        corpus.cite('Aeneid')
+
+    hit = next(corpus.search('profugus'))
+    assert [hit.verse for hit in corpus.around(hit, 1)] == [1, 2, 3]
+
+    plan = ' '.join(row[3] for row in corpus.connection().execute(
+        '''EXPLAIN QUERY PLAN SELECT * FROM latin_text
+           WHERE book = 'Aeneid I' AND chapter = 'null'
+           AND verse BETWEEN 1 AND 3'''))
+    assert 'citation (book' in plan or 'citation (book_id' in plan
+
+    corpus.close()
+
+
+# test that searches and usage counts read the same rows in either layout -
+# through the latin_fts_content view for the normalized one - and that
+# books replaced and deleted under the external content index leave it
+# consistent with its content
+@pytest.mark.parametrize('normalized', [False, True])
+def test_layouts(tmp_path, books, normalized):
+
+    path = str(tmp_path / 'layout.db')
+    db = sqlite3.connect(path)
+    c = db.cursor()
+    parse_data.create_schema(c, normalized)
+    for position, (link, items) in enumerate(books.items()):
+        parse_data.replace_book_rows(c, link, items, normalized, position)
+    parse_data.build_usage_matrix(c)
+    db.commit()
+    assert parse_data.is_normalized(c) == normalized
+
+    corpus = query.Corpus(path)
+    assert [(hit.book, hit.verse) for hit in corpus.search('arma')] == [
+        ('Aeneid I', 1), ('Punica I', 1)]
+    assert next(corpus.search('"fato profugus"')) == query.Hit(
+        'Italiam, fato profugus, Laviniaque venit',
+        'www.thelatinlibrary.com/vergil/aen1.shtml', 'Vergil', 'Aeneid I',
+        'null', 2)
+    assert corpus.count('Lauinia') == 1
+    assert corpus.usage('arma') == [query.BookCount('Aeneid I', 1, 'Vergil'),
+                                    query.BookCount('Punica I', 1, 'Silius')]
+    assert corpus.matrix_usage('et') == corpus.fts_usage('et')
+
+    # replace the first book without its first verse, and delete the second
+    vergil, silius = books
+    parse_data.replace_book_rows(c, vergil, books[vergil][1:], normalized, 0)
+    parse_data.replace_book_rows(c, silius, [], normalized)
+    parse_data.build_usage_matrix(c)
+    parse_data.next_generation(c)
+    db.commit()
+
+    for table in ('latin_fts', 'latin_norm_fts'):
+        c.execute('INSERT INTO {0} ({0}) VALUES (?)'.format(table),
+                  ['integrity-check'])
+    db.close()
+
+    assert corpus.count('arma') == 0 and corpus.count('ordior') == 0
+    assert [hit.verse for hit in corpus.search('profugus OR litora')] == [2, 3]
+    assert corpus.usage('et') == [query.BookCount('Aeneid I', 1, 'Vergil')]
+    assert corpus.collections() == ['Vergil']
+
+    corpus.close()
+
+
+# test that fuzzy searches find the vocabulary words closest to misspelled
+# ones and match all of them at once
+def test_fuzzy_search(database, corpus):
+
+    db = sqlite3.connect(database)
+    parse_data.build_trigram_index(db.cursor())
+    db.commit()
+    db.close()
+
+    assert corpus.similar_terms('profugsu') == [('profugus', 1, 1)]
+    assert corpus.similar_terms('Troia')[0] == ('troiae', 1, 1)
+    assert corpus.similar_terms('xyzzy') == []
+
+    query = corpus.fuzzy_query('Lavina profugs')
+    assert query == 'lauinia profugus'
+    assert [hit.verse for hit in corpus.search(query)] == [2]
+    assert corpus.fuzzy_query('arma xyzzy') is None
+
+
+# test that completions are the words beginning with a prefix, most common
+# first, with or without the latin_vocab table
+def test_complete(database, corpus, monkeypatch):
+
+    # databases without latin_vocab are read through fts4aux
+    assert corpus.complete('Ital') == [('italiam', 1)]
+    assert corpus.complete('a', 3) == [('arma', 2), ('ab', 1), ('aeneadum', 1)]
+    assert corpus.complete('xyz') == [] and corpus.complete(' ') == []
+
+    db = sqlite3.connect(database)
+    parse_data.build_trigram_index(db.cursor())
+    db.commit()
+    db.close()
+
+    # completions of prefixes matching many words are kept
+    monkeypatch.setattr(vocabulary, 'SCAN_LIMIT', 1)
+    other = query.Corpus(database)
+    assert other.complete('Vir') == [('uirum', 1), ('uirumque', 1)]
+    assert other.complete('a', 3) == corpus.complete('a', 3)
+    assert ('a', 3) in other.vocabulary().popular
+    other.close()
@@ -0,0 +1,101 @@
+import io
+import os
+import sys
+import json
+import subprocess
+import pytest
+
+from latin_library import query
+from latin_library import search_interface
+
+
+# point the search interface at the fixture database
+@pytest.fixture
+def interface(database):
+
+    corpus = search_interface.corpus
+    search_interface.corpus = query.Corpus(database)
+    yield search_interface
+    search_interface.corpus.close()
+    search_interface.corpus = corpus
+
+
+# test that search prints every matching verse
+def test_search(interface, capsys):
+
+    search_interface.search('arma')
+    output = capsys.readouterr().out
+
+    assert output.count('Search Result') == 2
+    assert 'Arma virumque cano' in output
+    assert 'Ordior arma' in output
+
+
+# test that usage charts are rendered without a display, to files or bytes,
+# with bars colored by collection
+def test_render_usage_charts(interface, tmp_path):
+
+    assert search_interface.usage_chart_bars('arma') == [
+        ('Aeneid I', 1, 'r'), ('Punica I', 1, 'g')]
+
+    charts = search_interface.render_usage_charts(['arma', 'et', 'nusquam'])
+    charts_arma = charts['arma']
+    assert charts['arma'].startswith(b'\x89PNG')
+    assert charts['et'] != charts['arma']
+    assert charts['nusquam'] is None
+
+    charts = search_interface.render_usage_charts(['Arma virumque'],
+                                                  str(tmp_path), 'svg')
+    path = charts['Arma virumque']
+    assert path == str(tmp_path / 'usage_Arma_virumque.svg')
+    with open(path) as f:
+        assert '<svg' in f.read()
+
+    # one figure is drawn on for every chart
+    renderer = search_interface.UsageChartRenderer()
+    fig = renderer.fig
+    assert renderer.render('arma') == charts_arma
+    assert renderer.render('nusquam') is None
+    assert renderer.render('et').startswith(b'\x89PNG')
+    assert renderer.fig is fig and len(fig.axes) == 1
+
+
+# test that batch mode answers each query with json lines and keeps going
+# after a query the index rejects
+def test_run_batch(interface):
+
+    output = io.StringIO()
+    count = search_interface.run_batch(['arma\n', '\n', '"arma\n', 'et\n'],
+                                       output, limit=1)
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert count == 3
+    assert records[0] == {'query': 'arma',
+                          'passage': 'Arma virumque cano, Troiae qui primus '
+                                     'ab oris',
+                          'link': 'www.thelatinlibrary.com/vergil/aen1.shtml',
+                          'title': 'Vergil', 'book': 'Aeneid I',
+                          'chapter': None, 'verse': 1}
+    assert 'error' in records[1]
+    assert records[2]['query'] == 'et' and len(records) == 3
+
+    output = io.StringIO()
+    search_interface.run_batch(['arma', 'nusquam'], output, 'count')
+    search_interface.run_batch(['arma'], output, 'usage')
+    assert [json.loads(line) for line in output.getvalue().splitlines()] == [
+        {'query': 'arma', 'count': 2}, {'query': 'nusquam', 'count': 0},
+        {'query': 'arma', 'counts': {'Aeneid I': 1, 'Punica I': 1}}]
+
+
+# test that importing the search interface and running a first search stays
+# within the startup budget without loading the plotting modules
+def test_startup_budget(database):
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+
+    result = subprocess.run(
+        [sys.executable, os.path.join(root, 'benchmarks', 'bench_startup.py')],
+        cwd=os.path.dirname(database), env=env, capture_output=True, text=True)
+
+    assert result.returncode == 0, result.stdout + result.stderr
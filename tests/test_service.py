@@ -0,0 +1,188 @@
+import json
+import time
+import sqlite3
+import threading
+import http.client
+import pytest
+
+from latin_library import service
+
+
+# translator standing in for the api
+class StubTranslator:
+
+    def translate(self, phrase):
+        if phrase == 'fail':
+            raise http.client.HTTPException('503 fail')
+        return {'weapons': 'arma'}.get(phrase, phrase)
+
+
+# service over the fixture database, listening on a free port
+@pytest.fixture
+def client(database):
+
+    port, stop = service.run_in_thread(
+        service.SearchService(database, workers=2, translator=StubTranslator()))
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    yield conn
+    conn.close()
+    stop()
+
+
+# status and json body of a GET request
+def get(conn, target):
+
+    conn.request('GET', target)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read().decode('utf-8'))
+
+
+# test the search, count, usage and translation endpoints over one
+# keep-alive connection
+def test_endpoints(client):
+
+    status, result = get(client, '/search?q=arma&limit=1')
+    assert status == 200
+    assert len(result['hits']) == 1
+    assert result['hits'][0]['book'] == 'Aeneid I'
+    assert result['hits'][0]['chapter'] is None
+
+    status, rest = get(client, '/search?q=arma&after=' + str(result['after']))
+    assert status == 200
+    assert len(rest['hits']) >= 1 and rest['after'] is None
+
+    status, result = get(client, '/count?q=arma')
+    assert result == {'query': 'arma', 'count': 1 + len(rest['hits'])}
+
+    status, result = get(client, '/usage?q=arma')
+    assert status == 200 and sum(result['counts'].values()) == 1 + len(rest['hits'])
+
+    status, result = get(client, '/ranked?q=arma&k=1')
+    assert status == 200 and result['hits'][0]['score'] > 0
+
+    status, result = get(client, '/complete?q=Vir')
+    assert [c['term'] for c in result['completions']] == ['uirum', 'uirumque']
+
+    status, result = get(client, '/translate?q=weapons')
+    assert (status, result['latin']) == (200, 'arma')
+
+
+# test that bad requests are answered with an error status and that the
+# metrics count them
+def test_errors_and_metrics(client):
+
+    assert get(client, '/search')[0] == 400
+    assert get(client, '/search?q=arma&limit=x')[0] == 400
+    assert get(client, '/search?q=%22arma')[0] == 400
+    assert get(client, '/nowhere')[0] == 404
+    assert get(client, '/translate?q=fail')[0] == 502
+
+    client.request('POST', '/search?q=arma')
+    response = client.getresponse()
+    response.read()
+    assert response.status == 405
+
+    status, metrics = get(client, '/metrics')
+    search = metrics['endpoints']['/search']
+    assert search['requests'] == 4 and search['errors'] == 4
+    assert search['p50_ms'] <= search['p99_ms'] <= search['max_ms']
+
+
+# test that a query running past the timeout is answered with 504 and
+# interrupted rather than left holding a worker
+def test_timeout(database):
+
+    slow = service.SearchService(database, workers=1, timeout=0.2)
+
+    # a query that would run for a very long time without the interrupt
+    def count(term, lemma=False):
+        db = slow.corpus.connection()
+        return db.execute('''WITH RECURSIVE n(i) AS
+                                 (SELECT 1 UNION ALL SELECT i + 1 FROM n)
+                             SELECT COUNT(*) FROM n''').fetchone()[0]
+    slow.corpus.count = count
+
+    port, stop = service.run_in_thread(slow)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        assert get(conn, '/count?q=arma')[0] == 504
+
+        # the single worker is free again for the next request
+        slow.corpus.count = lambda term, lemma=False: 0
+        assert get(conn, '/count?q=arma') == (200, {'query': 'arma', 'count': 0})
+    finally:
+        conn.close()
+        stop()
+
+
+# test that a query still waiting for a worker when its request timed out
+# is never run, and that the query the worker runs next is not interrupted
+def test_timeout_queued(database):
+
+    slow = service.SearchService(database, workers=1, timeout=0.2)
+    counted = []
+
+    def count(term, lemma=False):
+        if term == 'slow':
+            time.sleep(0.5)
+            return 0
+        counted.append(term)
+        return slow.corpus.connection().execute(
+            'SELECT COUNT(*) FROM latin_text').fetchone()[0]
+    slow.corpus.count = count
+
+    port, stop = service.run_in_thread(slow)
+    conns = [http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+             for i in range(2)]
+    try:
+        statuses = []
+        requests = [threading.Thread(
+            target=lambda conn, q: statuses.append(
+                get(conn, '/count?q=' + q)[0]), args=(conn, q))
+            for conn, q in zip(conns, ['slow', 'queued'])]
+        for request in requests:
+            request.start()
+            time.sleep(0.05)
+        for request in requests:
+            request.join()
+        assert statuses == [504, 504]
+
+        # once the slow call returned, the worker runs the next query
+        time.sleep(0.5)
+        status, result = get(conns[0], '/count?q=arma')
+        assert status == 200 and result['count'] > 0
+        assert counted == ['arma']
+    finally:
+        for conn in conns:
+            conn.close()
+        stop()
+
+
+# test that an unexpected error in a route, including a sqlite error other
+# than a query syntax error, is answered with 500 and counted in the metrics
+def test_internal_error(database):
+
+    broken = service.SearchService(database, workers=1)
+
+    def count(term, lemma=False):
+        raise sqlite3.DatabaseError('database disk image is malformed')
+    broken.corpus.count = count
+
+    # an operational error that is not down to the query syntax
+    def usage_map(term, lemma=False):
+        raise sqlite3.OperationalError('disk I/O error')
+    broken.corpus.usage_map = usage_map
+
+    port, stop = service.run_in_thread(broken)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    try:
+        status, result = get(conn, '/count?q=arma')
+        assert status == 500 and 'malformed' in result['error']
+        assert get(conn, '/usage?q=arma')[0] == 500
+        assert get(conn, '/search?q=%22arma')[0] == 400
+
+        status, metrics = get(conn, '/metrics')
+        assert metrics['endpoints']['/count']['errors'] == 1
+    finally:
+        conn.close()
+        stop()
@@ -0,0 +1,122 @@
+import re
+import sqlite3
+import pytest
+
+from latin_library import snapshot
+from latin_library import parse_data
+from latin_library.query import Hit
+
+
+# snapshot of the fixture database
+@pytest.fixture
+def corpus_snapshot(database, tmp_path):
+
+    path = str(tmp_path / 'latin_library.snapshot')
+    assert snapshot.write_snapshot(database, path) == 5
+
+    mapped = snapshot.Snapshot(path)
+    yield mapped
+    mapped.close()
+
+
+# test that regular expressions find the matching verses, with the
+# character positions of every match, and never a match across two verses
+def test_search(corpus_snapshot):
+
+    assert len(corpus_snapshot) == 5
+
+    hits = corpus_snapshot.search('^Arma')
+    assert [hit.hit for hit in hits] == [Hit(
+        'Arma virumque cano, Troiae qui primus ab oris',
+        'www.thelatinlibrary.com/vergil/aen1.shtml', 'Vergil', 'Aeneid I',
+        'null', 1)]
+    assert hits[0].spans == [(0, 4)]
+
+    hits = corpus_snapshot.search(r'\w+que\b')
+    assert [(hit.hit.book, hit.hit.verse, hit.spans) for hit in hits] == [
+        ('Aeneid I', 1, [(5, 13)]), ('Aeneid I', 2, [(24, 34)]),
+        ('Punica I', 2, [(10, 20)])]
+    assert len(corpus_snapshot.search(r'\w+que\b', limit=2)) == 2
+
+    # '$' ends each verse, and whitespace does not run on into the next one
+    assert corpus_snapshot.count_matches('oris$') == 1
+    assert corpus_snapshot.count_matches(r'oris\s+Italiam') == 0
+    assert corpus_snapshot.count_matches('^$') == 0
+
+    assert corpus_snapshot.count_matches('ARMA', re.IGNORECASE) == 2
+    assert corpus_snapshot.count_matches(re.compile(r'a\b')) == 4
+
+
+# test that str patterns match characters rather than utf-8 bytes - in
+# several chunks of verses - and that bytes patterns only match whole
+# characters
+def test_unicode_patterns(tmp_path, monkeypatch):
+
+    database = str(tmp_path / 'macrons.db')
+    link = 'www.thelatinlibrary.com/vergil/aen1.shtml'
+    passages = ['Mūsa, mihi causās memorā', 'quō nūmine laesō',
+                'quidve dolēns rēgīna deum', 'Iūnōnis ob īram']
+    db = sqlite3.connect(database)
+    c = db.cursor()
+    parse_data.create_schema(c)
+    parse_data.replace_book_rows(c, link, [
+        ['Vergil', 'Aeneid I', 'Latin', 'P. Vergilius Maro', '70 - 19 B.C.',
+         'null', verse, passage, link]
+        for verse, passage in enumerate(passages, 8)])
+    db.commit()
+    db.close()
+
+    path = str(tmp_path / 'macrons.snapshot')
+    snapshot.write_snapshot(database, path)
+    mapped = snapshot.Snapshot(path)
+
+    # a chunk as small as a verse
+    for chunk_bytes in (snapshot.CHUNK_BYTES, 1):
+        monkeypatch.setattr(snapshot, 'CHUNK_BYTES', chunk_bytes)
+
+        hits = mapped.search(r'\w+nōnis')
+        assert [(hit.hit.verse, hit.spans) for hit in hits] == [(11, [(0, 7)])]
+
+        assert mapped.count_matches(r'^.{4},') == 1
+        assert mapped.count_matches(r'^.{5},') == 0
+        assert [(hit.hit.verse, hit.spans) for hit in
+                mapped.search('[ūō]')] == [
+            (8, [(1, 2)]), (9, [(2, 3), (5, 6), (15, 16)]),
+            (11, [(1, 2), (3, 4)])]
+        assert mapped.count_matches(r'laesō$') == 1
+        assert mapped.count_matches(r'laesō\s+quid') == 0
+
+    # 'ū' is two bytes, which a bytes pattern must match whole
+    assert mapped.count_matches(rb'^I.n') == 0
+    hits = mapped.search(rb'^I..n')
+    assert [(hit.hit.verse, hit.spans) for hit in hits] == [(11, [(0, 3)])]
+    assert mapped.search(rb'^M.') == []
+
+    mapped.close()
+
+
+# test that a file other than a snapshot is not opened
+def test_not_a_snapshot(database):
+
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(database)
+
+
+# test that a snapshot written before the database was last updated is
+# found stale, and not opened against that database
+def test_stale_snapshot(database, tmp_path):
+
+    path = str(tmp_path / 'latin_library.snapshot')
+    snapshot.write_snapshot(database, path)
+
+    mapped = snapshot.Snapshot(path, database)
+    assert not mapped.is_stale(database)
+
+    db = sqlite3.connect(database)
+    db.execute('PRAGMA user_version = 1')
+    db.close()
+
+    assert mapped.is_stale(database)
+    mapped.close()
+    with pytest.raises(ValueError):
+        snapshot.Snapshot(path, database)
@@ -0,0 +1,217 @@
+import io
+import json
+import time
+import sqlite3
+import threading
+import urllib.parse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from latin_library import search_interface
+from latin_library import query
+from latin_library.translation import TranslationCache, TranslationClient
+
+# translations returned by the local stand-in for the MyMemory api
+translations = {'death': 'necro', 'war': 'bellum', 'man': 'vir'}
+
+
+# keep-alive stub of the MyMemory 'get' endpoint - counts requests and can
+# answer the first request for each phrase with the api's rate limit error,
+# or every request for a phrase with an error that is not retried
+class MyMemoryHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        phrase = query['q'][0]
+        self.server.requests.append((url.path, phrase, query['langpair'][0]))
+
+        if phrase in self.server.limit_once:
+            self.server.limit_once.remove(phrase)
+            result = {'responseData': {'translatedText': 'MYMEMORY WARNING'},
+                      'responseStatus': '429'}
+        elif phrase in self.server.fail:
+            result = {'responseData': {'translatedText': 'INVALID'},
+                      'responseStatus': '403'}
+        else:
+            result = {'responseData': {
+                          'translatedText': translations.get(phrase, phrase)},
+                      'responseStatus': 200}
+
+        body = json.dumps(result).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# serve the stub api on a free localhost port
+@pytest.fixture
+def api():
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MyMemoryHandler)
+    server.requests = []
+    server.limit_once = set()
+    server.fail = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    server.url = 'http://127.0.0.1:' + str(server.server_port) + '/api/get'
+    yield server
+    server.shutdown()
+
+
+# test that phrases are translated through the api and repeated phrases are
+# served from the cache, also by later clients sharing the cache file
+def test_translate_cached(api, tmp_path):
+
+    path = str(tmp_path / 'translations.db')
+
+    client = TranslationClient(api.url, TranslationCache(path))
+    assert client.translate('death') == 'necro'
+    assert client.translate(' death ') == 'necro'
+    assert client.translate('nothing') == 'nothing'
+    client.close()
+
+    assert api.requests == [('/api/get', 'death', 'en|la'),
+                            ('/api/get', 'nothing', 'en|la')]
+
+    # a new session skips the network entirely
+    client = TranslationClient(api.url, TranslationCache(path))
+    assert client.translate('death') == 'necro'
+    assert len(api.requests) == 2
+
+    # the language pair is part of the key
+    client.translate('death', 'en|it')
+    assert len(api.requests) == 3
+    client.close()
+
+
+# test that expired translations are fetched again and that the least
+# recently used translations are evicted beyond the size limit
+def test_translation_cache_eviction(tmp_path):
+
+    path = str(tmp_path / 'translations.db')
+    cache = TranslationCache(path, ttl=60, max_entries=2)
+
+    cache.put('death', 'en|la', 'necro')
+    cache.put('war', 'en|la', 'bellum')
+    assert cache.get('death') == 'necro'
+    cache.put('man', 'en|la', 'vir')
+
+    # 'war' was the least recently used entry
+    assert cache.get('war') is None
+    assert cache.get('death') == 'necro' and cache.get('man') == 'vir'
+
+    # age 'death' past the ttl
+    db = sqlite3.connect(path)
+    db.execute("UPDATE translation SET fetched = fetched - 120 "
+               "WHERE phrase = 'death'")
+    db.commit()
+    db.close()
+
+    assert cache.get('death') is None
+    cache.close()
+
+
+# test that the api's rate limit error is retried
+def test_translate_retry(api, tmp_path):
+
+    api.limit_once.add('war')
+
+    client = TranslationClient(api.url,
+                               TranslationCache(str(tmp_path / 't.db')),
+                               backoff=0)
+    assert client.translate('war') == 'bellum'
+    assert len(api.requests) == 2
+    client.close()
+
+
+# test that the search interface translates through the client
+def test_search_interface_translate(api, tmp_path, monkeypatch):
+
+    client = TranslationClient(api.url,
+                               TranslationCache(str(tmp_path / 't.db')))
+    monkeypatch.setattr(search_interface, 'translator', client)
+
+    assert search_interface.translate('man') == 'vir'
+    assert search_interface.translate('man') == 'vir'
+    assert len(api.requests) == 1
+    client.close()
+
+
+# test that a batch is translated concurrently, once per unique phrase,
+# with cached phrases served without requests
+def test_translate_many(api, tmp_path):
+
+    client = TranslationClient(api.url,
+                               TranslationCache(str(tmp_path / 't.db')),
+                               rate=None)
+    client.translate('death')
+
+    pairs = list(client.translate_many(['war', 'death', 'man', 'war ',
+                                        'nothing'], workers=3))
+    client.close()
+
+    assert sorted(pairs) == [('death', 'necro'), ('man', 'vir'),
+                             ('nothing', 'nothing'), ('war', 'bellum')]
+    # the cached phrase is ready first
+    assert pairs[0] == ('death', 'necro')
+    assert sorted(request[1] for request in api.requests) == \
+           ['death', 'man', 'nothing', 'war']
+
+
+# test that requests are spaced out by the client's rate limit
+def test_translate_many_rate(api, tmp_path):
+
+    client = TranslationClient(api.url,
+                               TranslationCache(str(tmp_path / 't.db')),
+                               rate=20)
+
+    start = time.monotonic()
+    pairs = list(client.translate_many(['a', 'b', 'c', 'd', 'e'], workers=5))
+    client.close()
+
+    assert len(pairs) == 5
+    assert time.monotonic() - start >= 4 / 20
+
+
+# test that an english batch reports a query that could not be translated
+# in its record and goes on with the others, and that the queries are read
+# as they are answered
+def test_batch_translation_errors(api, tmp_path, database, monkeypatch):
+
+    api.fail.add('death')
+    client = TranslationClient(api.url,
+                               TranslationCache(str(tmp_path / 't.db')),
+                               rate=None)
+    monkeypatch.setattr(search_interface, 'translator', client)
+    monkeypatch.setattr(search_interface, 'corpus', query.Corpus(database))
+    monkeypatch.setattr(search_interface, 'BATCH_WINDOW', 1)
+
+    output = io.StringIO()
+
+    # the first query is answered before the last one is read
+    def lines():
+        yield 'death\n'
+        yield 'arma\n'
+        assert output.getvalue() != ''
+        yield 'war\n'
+
+    assert search_interface.run_batch(lines(), output, 'count',
+                                      english=True) == 3
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+
+    assert records[0]['english'] == 'death'
+    assert records[0]['error'].startswith('translation failed')
+    assert records[1:] == [
+        {'english': 'arma', 'query': 'arma', 'count': 2},
+        {'english': 'war', 'query': 'bellum', 'count': 0}]
+
+    search_interface.corpus.close()
+    client.close()